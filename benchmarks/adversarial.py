@@ -0,0 +1,184 @@
+"""
+Time every reader on adversarial lines that are built to make its patterns backtrack:
+the literal parts of each pattern repeated many times on one long line.
+
+    python -m benchmarks.adversarial [--length 10000] [--max-seconds 0.1]
+"""
+import argparse
+import io
+import re
+import sys
+import time
+
+from quoteimporter import rejects
+from quoteimporter.profiling import Profiler
+from quoteimporter.rejects import Rejects
+
+from quoteimporter.readers.whatsapp.handlers import TIMESTAMP_PATTERN
+
+from .readers import make_reader
+
+# a valid timestamp prefix for lines of each format, and how the patterns match it
+prefixes = {
+    "irssi": ("20:56 ", [r"^(\d{2}:\d{2}) "]),
+    "hexchat": ("Jul 22 20:56:00 ", [r"^(\w{3} \d{2} \d{2}:\d{2}:\d{2}) "]),
+    "nda": (
+        "2017-07-22 20:56:00.000000 ",
+        [
+            r"^(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2})\.\d{6} ",
+            r"^\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}\.\d{6} ",
+        ],
+    ),
+    "whatsapp": ("22/07/2017, 20:56 - ", ["^%s " % TIMESTAMP_PATTERN]),
+}
+
+# escapes that stand for a class of characters instead of a literal one
+class_escapes = "dDsSwWbBAZ"
+
+
+def fragments(pattern):
+    """The literal parts of a pattern, e.g. ' has left ' and ' [' for the irssi leave pattern"""
+    parts = []
+    current = ""
+    i = 0
+
+    while i < len(pattern):
+        c = pattern[i]
+
+        if c == "\\" and i + 1 < len(pattern):
+            escaped = pattern[i + 1]
+            i += 2
+
+            if escaped in class_escapes:
+                parts.append(current)
+                current = ""
+            else:
+                current += "\t" if escaped == "t" else escaped
+            continue
+
+        if c == "[":
+            # skip the character class
+            parts.append(current)
+            current = ""
+            i = pattern.index("]", i + 2) + 1
+            continue
+
+        if c == "{":
+            i = pattern.index("}", i) + 1
+            continue
+
+        if c in "^$().+*?|":
+            parts.append(current)
+            current = ""
+        else:
+            current += c
+
+        i += 1
+
+    parts.append(current)
+    return [part for part in parts if len(part.strip()) > 0]
+
+
+def reader_patterns(reader):
+    """
+    All compiled patterns of a reader or of its handlers that lines are matched with, leaving out those
+    for the raw bytes of a log
+    """
+    if hasattr(reader, "handlers"):
+        return [handler.pattern for handler in reader.handlers]
+
+    patterns = []
+
+    for name in dir(type(reader)):
+        value = getattr(reader, name)
+
+        if isinstance(value, re.Pattern):
+            patterns.append(value)
+        elif isinstance(value, list):
+            patterns.extend(v for v in value if isinstance(v, re.Pattern))
+
+    return [pattern for pattern in patterns if isinstance(pattern.pattern, str)]
+
+
+def adversarial_lines(log_format, length):
+    """Lines of about the given length for every pattern of the reader"""
+    (prefix, pattern_prefixes) = prefixes[log_format]
+    lines = []
+
+    for pattern in reader_patterns(make_reader(log_format)):
+        source = pattern.pattern
+        line_prefix = ""
+
+        for pattern_prefix in pattern_prefixes:
+            if source.startswith(pattern_prefix):
+                source = source[len(pattern_prefix) :]
+                line_prefix = prefix
+
+        parts = fragments(source)
+
+        if len(parts) == 0:
+            continue
+
+        # all literal parts in order, and each part on its own, repeated until the line is long enough
+        units = ["a" + "a".join(parts[1:]) + "a"] + [part + "a" for part in parts]
+
+        for start in [parts[0], "a" + parts[0]]:
+            for unit in units:
+                repeated = unit * (length // len(unit) + 1)
+
+                # with different endings, so the match both succeeds and fails late
+                for end in ["", "a", "]", ")"]:
+                    lines.append(line_prefix + start + repeated + end)
+
+    return lines
+
+
+def run(log_format, lines):
+    """Read every line on its own. Returns the slowest (seconds, line) and the time per pattern"""
+    profiler = Profiler()
+    reader = make_reader(log_format)
+    profiler.instrument(reader)
+    slowest = (0.0, "")
+
+    for line in lines:
+        start = time.perf_counter()
+        list(reader.read(io.StringIO(line + "\n")))
+        seconds = time.perf_counter() - start
+        slowest = max(slowest, (seconds, line))
+
+    return (slowest, profiler.profiles)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.adversarial")
+    parser.add_argument("--readers", default=",".join(prefixes))
+    parser.add_argument("--length", type=int, default=10000)
+    parser.add_argument("--max-seconds", type=float, default=0.1)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    rejects.active = Rejects()
+    failed = False
+
+    for log_format in args.readers.split(","):
+        lines = adversarial_lines(log_format, args.length)
+        ((seconds, line), profiles) = run(log_format, lines)
+        worst = max(profiles, key=lambda p: p.seconds)
+
+        print(
+            "%-10s %5i lines, slowest %.4fs (%s...), most time in %s (%.3fs)"
+            % (log_format, len(lines), seconds, line[:40], worst.name, worst.seconds)
+        )
+
+        if seconds > args.max_seconds:
+            failed = True
+
+    if failed:
+        print("Some lines took longer than %.3fs" % args.max_seconds)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
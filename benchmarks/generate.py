@@ -0,0 +1,474 @@
+"""
+Generate reproducible synthetic logs in every supported format.
+
+    python -m benchmarks.generate [OPTIONS] LOG_TYPE OUTPUT
+"""
+import argparse
+import json
+import os
+import os.path
+import random
+from datetime import datetime, timedelta
+
+words = (
+    "the be to of and a in that have it for not on with he as you do at this but his by from "
+    "they we say her she or an will my one all would there their what so up out if about who "
+    "get which go me when make can like time no just him know take people into year your good "
+    "some could them see other than then now look only come its over think also back after use "
+    "two how our work first well way even new want because any these give day most us lol ok "
+    "yeah nice haha wtf irc bot server patch release broken works fixed tomorrow tonight"
+).split()
+
+units = {"KB": 10**3, "MB": 10**6, "GB": 10**9}
+
+
+class GeneratorOptions:
+    """
+    What the generated logs look like. Rates are the share of lines or messages of that kind.
+    Attachment files are only written if attachment_size is above 0.
+    """
+
+    def __init__(
+        self,
+        authors=20,
+        zipf=1.0,
+        multiline_rate=0.05,
+        attachment_rate=0.05,
+        attachment_size=0,
+        glitch_rate=0.0,
+        unknown_rate=0.0,
+        variant="android",
+        date_order="standard",
+    ):
+        self.authors = authors
+        self.zipf = zipf
+        self.multiline_rate = multiline_rate
+        self.attachment_rate = attachment_rate
+        self.attachment_size = attachment_size
+        self.glitch_rate = glitch_rate
+        self.unknown_rate = unknown_rate
+        self.variant = variant
+        self.date_order = date_order
+
+
+class Corpus:
+    """Shared state for generating one log: a seeded random source, options, authors and a clock"""
+
+    def __init__(self, seed, options=None, channel="#chan", media_dir=None):
+        self.random = random.Random(seed)
+        self.options = options if options is not None else GeneratorOptions()
+        self.channel = channel
+        self.media_dir = media_dir
+        self.authors = ["nick%02i" % i for i in range(self.options.authors)]
+        # Zipf's law: the author of rank r writes about 1/r^s of the messages
+        self.weights = [1 / (rank + 1) ** self.options.zipf for rank in range(self.options.authors)]
+        self.time = datetime(2017, 7, 22, 20, 0, 0)
+        self.attachments = 0
+
+    def author(self):
+        return self.random.choices(self.authors, self.weights)[0]
+
+    def text(self, max_words=20):
+        n = min(int(self.random.expovariate(1 / 8)) + 1, max_words)
+        return " ".join(self.random.choice(words) for _ in range(n))
+
+    def tick(self):
+        """Advance the clock by a random number of seconds. Returns whether the day changed"""
+        day = self.time.date()
+        self.time += timedelta(seconds=int(self.random.expovariate(1 / 60)))
+        return self.time.date() != day
+
+    def pick(self, mix, extras=()):
+        """
+        Pick a line kind from a list of (kind, weight), unless one of the extra kinds this
+        format supports (multiline, attachment, glitch, unknown) is picked at its configured rate
+        """
+        roll = self.random.random()
+
+        for kind in extras:
+            rate = getattr(self.options, "%s_rate" % kind)
+            if roll < rate:
+                return kind
+            roll -= rate
+
+        return self.random.choices([k for (k, _) in mix], [w for (_, w) in mix])[0]
+
+    def attachment(self, path):
+        """Write a dummy media file for an attachment, relative to the media directory"""
+        self.attachments += 1
+
+        if self.media_dir is None or self.options.attachment_size <= 0:
+            return path
+
+        full_path = os.path.join(self.media_dir, path)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+
+        with open(full_path, "wb") as file:
+            file.write(self.random.randbytes(self.options.attachment_size))
+
+        return path
+
+
+def irssi_lines(corpus):
+    c = corpus
+    mix = [
+        ("message", 80),
+        ("me", 4),
+        ("join", 6),
+        ("quit", 6),
+        ("nick", 2),
+        ("topic", 1),
+    ]
+    yield c.time.strftime("--- Log opened %a %b %d %H:%M:%S %Y")
+
+    while True:
+        if c.tick():
+            yield c.time.strftime("--- Day changed %a %b %d %Y")
+
+        time = c.time.strftime("%H:%M")
+        kind = c.pick(mix, ["glitch", "unknown"])
+        author = c.author()
+
+        if kind == "message":
+            yield "%s <%s> %s" % (time, author, c.text())
+        elif kind == "me":
+            yield "%s  * %s %s" % (time, author, c.text())
+        elif kind == "join":
+            yield "%s -!- %s [~%s@example.com] has joined %s" % (time, author, author, c.channel)
+        elif kind == "quit":
+            yield "%s -!- %s [~%s@example.com] has quit [%s]" % (
+                time,
+                author,
+                author,
+                c.text(4),
+            )
+        elif kind == "nick":
+            yield "%s -!- %s is now known as %s_" % (time, author, author)
+        elif kind == "topic":
+            yield "%s -!- %s changed the topic of %s to: %s" % (
+                time,
+                author,
+                c.channel,
+                c.text(),
+            )
+        elif kind == "glitch":
+            # a message interleaved with the next one
+            yield "%s %s <%s> %s<%s> %s" % (time, time, author, c.text(), c.author(), c.text())
+        else:
+            yield c.text()
+
+
+def hexchat_lines(corpus):
+    c = corpus
+    mix = [
+        ("message", 80),
+        ("me", 4),
+        ("join", 6),
+        ("quit", 6),
+        ("nick", 2),
+        ("topic", 1),
+    ]
+    yield c.time.strftime("**** BEGIN LOGGING AT %a %b %d %H:%M:%S %Y")
+
+    while True:
+        if c.tick():
+            yield c.time.strftime("**** BEGIN LOGGING AT %a %b %d %H:%M:%S %Y")
+
+        time = c.time.strftime("%b %d %H:%M:%S")
+        kind = c.pick(mix, ["unknown"])
+        author = c.author()
+
+        if kind == "message":
+            yield "%s <%s>\t%s" % (time, author, c.text())
+        elif kind == "me":
+            yield "%s *\t%s %s" % (time, author, c.text())
+        elif kind == "join":
+            yield "%s *\t%s (~%s@example.com) has joined %s" % (time, author, author, c.channel)
+        elif kind == "quit":
+            yield "%s *\t%s has quit (%s)" % (time, author, c.text(4))
+        elif kind == "nick":
+            yield "%s *\t%s is now known as %s_" % (time, author, author)
+        elif kind == "topic":
+            yield "%s *\t%s has changed the topic to: %s" % (time, author, c.text())
+        else:
+            yield c.text()
+
+
+def nda_lines(corpus):
+    c = corpus
+    mix = [
+        ("message", 70),
+        ("own", 5),
+        ("join", 6),
+        ("part", 3),
+        ("quit", 4),
+        ("nick", 2),
+        ("ping", 10),
+    ]
+
+    while True:
+        c.tick()
+        time = c.time.strftime("%Y-%m-%d %H:%M:%S.%f")
+        kind = c.pick(mix, ["unknown"])
+        author = c.author()
+        prefix = "%s :%s!~%s@example.com" % (time, author, author)
+
+        if kind == "message":
+            yield "%s PRIVMSG %s :%s" % (prefix, c.channel, c.text())
+        elif kind == "own":
+            yield "%s Sending %s to %s" % (time, c.text(), c.channel)
+        elif kind == "join":
+            yield "%s JOIN %s" % (prefix, c.channel)
+        elif kind == "part":
+            yield "%s PART %s :%s" % (prefix, c.channel, c.text(4))
+        elif kind == "quit":
+            yield "%s QUIT :%s" % (prefix, c.text(4))
+        elif kind == "nick":
+            yield "%s NICK :%s_" % (prefix, author)
+        elif kind == "ping":
+            yield "%s PING :irc.example.com" % time
+        else:
+            yield "%s %s" % (time, c.text())
+
+
+def whatsapp_timestamp(corpus):
+    """The timestamp prefix of a line, for the configured app variant and date order"""
+    t = corpus.time
+    american = corpus.options.date_order == "american"
+
+    if corpus.options.variant == "ios":
+        date = "%i/%i/%s" % ((t.month, t.day, t.strftime("%y")) if american else (t.day, t.month, t.year))
+        return "[%s, %s]" % (date, t.strftime("%H.%M.%S"))
+
+    date = "%i/%i/%s" % (t.month, t.day, t.strftime("%y")) if american else t.strftime("%d/%m/%Y")
+    return "%s, %s -" % (date, t.strftime("%H:%M"))
+
+
+def whatsapp_lines(corpus):
+    """
+    Android exports look like "31/05/2017, 20:56 - nick: message" and iOS exports like
+    "[31/05/2017, 20.56.32] nick: message", with left-to-right marks before attachments.
+    Lines without a timestamp continue the previous message, so there are no unknown lines.
+    """
+    c = corpus
+    mix = [("message", 85), ("join", 2), ("left", 2)]
+    ios = c.options.variant == "ios"
+
+    while True:
+        c.tick()
+        timestamp = whatsapp_timestamp(c)
+        kind = c.pick(mix, ["multiline", "attachment"])
+        author = c.author()
+
+        if kind == "message":
+            yield "%s %s: %s" % (timestamp, author, c.text())
+        elif kind == "multiline":
+            yield "%s %s: %s" % (timestamp, author, c.text())
+            for _ in range(c.random.randint(1, 4)):
+                yield c.text()
+        elif kind == "attachment":
+            if ios:
+                filename = "%08i-PHOTO-%s.jpg" % (
+                    c.attachments,
+                    c.time.strftime("%Y-%m-%d-%H-%M-%S"),
+                )
+                yield "\u200e%s %s: \u200e<attached: %s>" % (
+                    timestamp,
+                    author,
+                    c.attachment(filename),
+                )
+            else:
+                filename = "IMG-%s-WA%04i.jpg" % (c.time.strftime("%Y%m%d"), c.attachments)
+                yield "%s %s: <attached: %s>" % (timestamp, author, c.attachment(filename))
+        elif kind == "join":
+            yield "%s %s added %s" % (timestamp, c.author(), author)
+        else:
+            yield "%s %s left" % (timestamp, author)
+
+
+def telegram_messages(corpus):
+    c = corpus
+    mix = [
+        ("message", 85),
+        ("links", 5),
+        ("join", 3),
+        ("pin", 0.1),
+    ]
+    media = [
+        ("sticker", "stickers/sticker_%i.webp"),
+        ("animation", "video_files/animation_%i.mp4"),
+        ("voice_message", "voice_messages/audio_%i.ogg"),
+    ]
+    message_id = 0
+
+    while True:
+        c.tick()
+        message_id += 1
+        date = c.time.strftime("%Y-%m-%dT%H:%M:%S")
+        kind = c.pick(mix, ["multiline", "attachment", "unknown"])
+        author = c.author()
+        message = {"id": message_id, "date": date}
+
+        if kind == "message":
+            message.update(type="message", **{"from": author}, text=c.text())
+        elif kind == "multiline":
+            lines = [c.text() for _ in range(c.random.randint(2, 5))]
+            message.update(type="message", **{"from": author}, text="\n".join(lines))
+        elif kind == "links":
+            message.update(
+                type="message",
+                **{"from": author},
+                text=[c.text(), {"type": "link", "text": "https://example.com"}],
+            )
+        elif kind == "attachment":
+            (media_type, path) = c.random.choice(media)
+            message.update(
+                type="message",
+                **{"from": author},
+                file=c.attachment(path % message_id),
+                media_type=media_type,
+                text="",
+            )
+            if media_type == "sticker":
+                message["sticker_emoji"] = "❤️"
+        elif kind == "join":
+            message.update(type="service", actor=author, action="join_group_by_link")
+        elif kind == "pin":
+            message.update(
+                type="service",
+                actor=author,
+                action="pin_message",
+                message_id=c.random.randint(1, message_id),
+            )
+        else:
+            message.update(type="service", actor=author, action="phone_call")
+
+        yield message
+
+
+line_generators = {
+    "irssi": irssi_lines,
+    "hexchat": hexchat_lines,
+    "nda": nda_lines,
+    "whatsapp": whatsapp_lines,
+}
+
+formats = list(line_generators) + ["telegram"]
+
+
+def generate(log_format, filename, size, seed=0, options=None, channel="#chan"):
+    """Write a log of about size bytes. Returns the number of lines, or messages for Telegram"""
+    corpus = Corpus(seed, options, channel, os.path.dirname(os.path.abspath(filename)))
+    written = 0
+    count = 0
+
+    with open(filename, "w", encoding="utf-8", newline="\n") as file:
+        if log_format == "telegram":
+            file.write('{"name": "%s", "type": "public_supergroup", "messages": [\n' % channel)
+
+            for message in telegram_messages(corpus):
+                data = ("" if count == 0 else ",\n") + json.dumps(message, ensure_ascii=False)
+                file.write(data)
+                written += len(data.encode("utf-8"))
+                count += 1
+
+                if written >= size:
+                    break
+
+            file.write("\n]}\n")
+            return count
+
+        for line in line_generators[log_format](corpus):
+            data = line + "\n"
+            file.write(data)
+            written += len(data.encode("utf-8"))
+            count += 1
+
+            if written >= size:
+                return count
+
+
+def log_filename(log_format, directory, channel):
+    """Where the log of a channel goes: a file per channel, or an export directory for Telegram"""
+    if log_format == "telegram":
+        return os.path.join(directory, channel.lstrip("#"), "result.json")
+    elif log_format == "whatsapp":
+        return os.path.join(directory, channel.lstrip("#"), "_chat.txt")
+
+    return os.path.join(directory, "%s.log" % channel)
+
+
+def generate_channels(log_format, directory, size, channels, seed=0, options=None):
+    """Write logs for several channels, splitting the size between them. Returns the total count"""
+    count = 0
+
+    for i in range(channels):
+        filename = log_filename(log_format, directory, "#chan%i" % i)
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+        count += generate(log_format, filename, size // channels, seed + i, options, "#chan%i" % i)
+
+    return count
+
+
+def parse_size(size):
+    """Parse a size like 100MB"""
+    for (unit, factor) in units.items():
+        if size.upper().endswith(unit):
+            return int(float(size[: -len(unit)]) * factor)
+    return int(size)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.generate")
+    parser.add_argument("--size", default="1MB", help="total size, e.g. 100MB")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--channels",
+        type=int,
+        default=1,
+        help="write a log per channel into OUTPUT, which is a directory",
+    )
+    parser.add_argument("--authors", type=int, default=20)
+    parser.add_argument("--zipf", type=float, default=1.0, help="author distribution exponent")
+    parser.add_argument("--multiline-rate", type=float, default=0.05)
+    parser.add_argument("--attachment-rate", type=float, default=0.05)
+    parser.add_argument(
+        "--attachment-size",
+        type=parse_size,
+        default=0,
+        help="write dummy media files of this size next to the log",
+    )
+    parser.add_argument("--glitch-rate", type=float, default=0.0)
+    parser.add_argument("--unknown-rate", type=float, default=0.0)
+    parser.add_argument("--variant", choices=["android", "ios"], default="android")
+    parser.add_argument("--dates", choices=["standard", "american"], default="standard")
+    parser.add_argument("type", choices=formats)
+    parser.add_argument("output")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    options = GeneratorOptions(
+        args.authors,
+        args.zipf,
+        args.multiline_rate,
+        args.attachment_rate,
+        args.attachment_size,
+        args.glitch_rate,
+        args.unknown_rate,
+        args.variant,
+        args.dates,
+    )
+    size = parse_size(args.size)
+
+    if args.channels > 1:
+        count = generate_channels(args.type, args.output, size, args.channels, args.seed, options)
+    else:
+        count = generate(args.type, args.output, size, args.seed, options)
+
+    print("Wrote %i %s" % (count, "messages" if args.type == "telegram" else "lines"))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+"""
+Benchmark the throughput and peak memory of every reader on synthetic logs.
+
+    python -m benchmarks.readers [--sizes 1MB,100MB,1GB] [--output results.json] [--compare baseline.json]
+"""
+import argparse
+import contextlib
+import json
+import multiprocessing
+import os
+import os.path
+import platform
+import resource
+import sys
+import time
+
+from quoteimporter.lines import LineSource
+from quoteimporter.readers.hexchat import HexChatLogReader
+from quoteimporter.readers.irssi import IrssiLogReader
+from quoteimporter.readers.nda import NdaLogReader
+from quoteimporter.readers.telegram.models import TelegramOptions
+from quoteimporter.readers.telegram.reader import TelegramLogReader
+from quoteimporter.readers.whatsapp.models import WhatsAppOptions
+from quoteimporter.readers.whatsapp.reader import WhatsAppLogReader
+
+from .generate import formats, generate, parse_size
+
+corpus_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "corpora")
+
+
+def make_reader(log_format):
+    if log_format == "irssi":
+        return IrssiLogReader("#chan", 0, "You")
+    elif log_format == "hexchat":
+        return HexChatLogReader("#chan", 0, "You")
+    elif log_format == "nda":
+        return NdaLogReader("#chan", "nda")
+    elif log_format == "whatsapp":
+        return WhatsAppLogReader(WhatsAppOptions("#chan"))
+    else:
+        return TelegramLogReader(TelegramOptions("#chan"))
+
+
+def corpus(log_format, size, seed):
+    """Get the synthetic log for the format and size, generating it the first time"""
+    os.makedirs(corpus_dir, exist_ok=True)
+    filename = os.path.join(corpus_dir, "%s-%i-%i.log" % (log_format, size, seed))
+    meta_filename = filename + ".json"
+
+    if not os.path.exists(meta_filename):
+        count = generate(log_format, filename, size, seed)
+        with open(meta_filename, "w") as file:
+            json.dump({"lines": count}, file)
+
+    with open(meta_filename) as file:
+        return (filename, json.load(file)["lines"])
+
+
+def run(log_format, filename, connection):
+    """Read the whole log in a fresh process, so its peak memory is only this reader's"""
+    reader = make_reader(log_format)
+    quotes = 0
+
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        start = time.perf_counter()
+
+        with open(filename, "rb") as stream:
+            if log_format == "telegram":
+                lines = stream
+            else:
+                lines = LineSource(stream)
+
+            for _ in reader.read(lines):
+                quotes += 1
+
+        seconds = time.perf_counter() - start
+
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    peak_mb = peak / 2**20 if sys.platform == "darwin" else peak / 2**10
+    connection.send((quotes, seconds, peak_mb))
+
+
+def benchmark(log_format, size, seed):
+    (filename, lines) = corpus(log_format, size, seed)
+    context = multiprocessing.get_context("spawn")
+    (receiver, sender) = context.Pipe(duplex=False)
+    process = context.Process(target=run, args=(log_format, filename, sender))
+    process.start()
+    (quotes, seconds, peak_mb) = receiver.recv()
+    process.join()
+
+    return {
+        "reader": log_format,
+        "size": size,
+        "lines": lines,
+        "quotes": quotes,
+        "seconds": seconds,
+        "lines_per_second": lines / seconds,
+        "quotes_per_second": quotes / seconds,
+        "megabytes_per_second": size / 1e6 / seconds,
+        "peak_memory_mb": peak_mb,
+    }
+
+
+def compare(results, baseline, threshold):
+    """Find results that are slower or use more memory than the baseline by more than the threshold"""
+    previous = {(r["reader"], r["size"]): r for r in baseline["results"]}
+    regressions = []
+
+    for result in results:
+        before = previous.get((result["reader"], result["size"]))
+
+        if before is None:
+            continue
+
+        if result["lines_per_second"] < before["lines_per_second"] * (1 - threshold):
+            regressions.append(
+                "%s %s: %i lines/s, was %i"
+                % (
+                    result["reader"],
+                    result["size"],
+                    result["lines_per_second"],
+                    before["lines_per_second"],
+                )
+            )
+
+        if result["peak_memory_mb"] > before["peak_memory_mb"] * (1 + threshold):
+            regressions.append(
+                "%s %s: %.1f MB peak memory, was %.1f"
+                % (
+                    result["reader"],
+                    result["size"],
+                    result["peak_memory_mb"],
+                    before["peak_memory_mb"],
+                )
+            )
+
+    return regressions
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.readers")
+    parser.add_argument("--readers", default=",".join(formats))
+    parser.add_argument("--sizes", default="1MB")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output")
+    parser.add_argument("--compare")
+    parser.add_argument("--threshold", type=float, default=0.1)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    results = []
+
+    for size in [parse_size(s) for s in args.sizes.split(",")]:
+        for log_format in args.readers.split(","):
+            result = benchmark(log_format, size, args.seed)
+            results.append(result)
+            print(
+                "%-10s %6.0f MB %10i lines/s %10i quotes/s %8.1f MB/s %8.1f MB peak"
+                % (
+                    log_format,
+                    size / 1e6,
+                    result["lines_per_second"],
+                    result["quotes_per_second"],
+                    result["megabytes_per_second"],
+                    result["peak_memory_mb"],
+                )
+            )
+
+    if args.output is not None:
+        with open(args.output, "w") as file:
+            json.dump(
+                {
+                    "python": platform.python_version(),
+                    "machine": platform.machine(),
+                    "seed": args.seed,
+                    "results": results,
+                },
+                file,
+                indent=2,
+            )
+
+    if args.compare is not None:
+        with open(args.compare) as file:
+            regressions = compare(results, json.load(file), args.threshold)
+
+        for regression in regressions:
+            print("Regression: %s" % regression)
+
+        if len(regressions) > 0:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""Start throwaway local database servers for benchmarks, if their binaries are installed"""
+import contextlib
+import os.path
+import shutil
+import socket
+import subprocess
+import tempfile
+import time
+
+
+class ServerUnavailable(Exception):
+    """The server binaries or client library are not installed, or the server didn't start"""
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_port(port, process, timeout=30.0):
+    deadline = time.monotonic() + timeout
+
+    while time.monotonic() < deadline:
+        if process is not None and process.poll() is not None:
+            raise ServerUnavailable("Server exited with code %i" % process.returncode)
+
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=1.0):
+                return
+        except OSError:
+            time.sleep(0.2)
+
+    raise ServerUnavailable("Server didn't listen on port %i within %is" % (port, timeout))
+
+
+def require(*binaries):
+    for binary in binaries:
+        if shutil.which(binary) is None:
+            raise ServerUnavailable("%s not found" % binary)
+
+
+@contextlib.contextmanager
+def stop_on_exit(process):
+    try:
+        yield
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+@contextlib.contextmanager
+def postgres_server():
+    """Yields a function that creates a PostgresDb connected to an empty database"""
+    require("initdb", "pg_ctl")
+    try:
+        import psycopg2
+        from quoteimporter.writers.postgresdb import PostgresDb
+    except ImportError as e:
+        raise ServerUnavailable(str(e))
+
+    with tempfile.TemporaryDirectory() as directory:
+        data = os.path.join(directory, "data")
+        port = free_port()
+        subprocess.run(
+            ["initdb", "-D", data, "-U", "postgres", "--auth=trust"],
+            check=True,
+            capture_output=True,
+        )
+        options = "-p %i -k %s -c listen_addresses=127.0.0.1 -c fsync=on" % (port, directory)
+        subprocess.run(
+            ["pg_ctl", "-D", data, "-o", options, "-l", os.path.join(directory, "log"), "-w", "start"],
+            check=True,
+            capture_output=True,
+        )
+
+        try:
+            cnx = psycopg2.connect(host="127.0.0.1", port=port, user="postgres", dbname="postgres")
+            cnx.autocommit = True
+            cnx.cursor().execute("CREATE DATABASE quotes")
+            cnx.close()
+
+            yield lambda: PostgresDb(host="127.0.0.1", port=port, user="postgres", dbname="quotes")
+        finally:
+            subprocess.run(["pg_ctl", "-D", data, "-m", "fast", "-w", "stop"], capture_output=True)
+
+
+@contextlib.contextmanager
+def mysql_server():
+    """Yields a function that creates a MySqlDb connected to an empty database"""
+    require("mysqld")
+    try:
+        import mysql.connector
+        from quoteimporter.writers.mysqldb import MySqlDb
+    except ImportError as e:
+        raise ServerUnavailable(str(e))
+
+    with tempfile.TemporaryDirectory() as directory:
+        data = os.path.join(directory, "data")
+        port = free_port()
+        arguments = [
+            "--no-defaults",
+            "--datadir=%s" % data,
+            "--socket=%s" % os.path.join(directory, "mysqld.sock"),
+            "--pid-file=%s" % os.path.join(directory, "mysqld.pid"),
+        ]
+        subprocess.run(
+            ["mysqld", *arguments, "--initialize-insecure"], check=True, capture_output=True
+        )
+        process = subprocess.Popen(
+            ["mysqld", *arguments, "--port=%i" % port, "--bind-address=127.0.0.1"],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+
+        with stop_on_exit(process):
+            wait_for_port(port, process)
+            cnx = mysql.connector.connect(host="127.0.0.1", port=port, user="root")
+            cnx.cursor().execute("CREATE DATABASE quotes")
+            cnx.close()
+
+            yield lambda: MySqlDb(host="127.0.0.1", port=port, user="root", database="quotes")
+
+
+@contextlib.contextmanager
+def mongo_server():
+    """Yields a function that creates a MongoDb connected to an empty database"""
+    require("mongod")
+    try:
+        from quoteimporter.writers.mongodb import MongoDb
+    except ImportError as e:
+        raise ServerUnavailable(str(e))
+
+    with tempfile.TemporaryDirectory() as directory:
+        port = free_port()
+        process = subprocess.Popen(
+            ["mongod", "--dbpath", directory, "--port", str(port), "--bind_ip", "127.0.0.1"],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+
+        with stop_on_exit(process):
+            wait_for_port(port, process)
+            yield lambda: MongoDb("127.0.0.1", port, "quotes")
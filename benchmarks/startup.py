@@ -0,0 +1,94 @@
+"""
+Measure how long the CLI takes to start, using python -X importtime.
+
+    python -m benchmarks.startup [--runs 10] [--max-ms 100]
+"""
+import argparse
+import os
+import os.path
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+# modules that should only be imported when their reader or writer is selected
+lazy_modules = ["pymongo", "mysql.connector", "psycopg2", "concurrent.futures.process"]
+
+
+def import_times():
+    """Import the CLI in a fresh interpreter. Returns the cumulative microseconds per module"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import quoteimporter.__main__"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times = {}
+
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+
+        (_, cumulative, module) = line[len("import time:") :].split("|")
+        times[module.strip()] = int(cumulative)
+
+    return times
+
+
+def dry_run_seconds(filename):
+    """Wall time of a whole dry run import of a tiny log"""
+    start = time.perf_counter()
+    subprocess.run(
+        [sys.executable, "-m", "quoteimporter", "irssi", "#chan", filename],
+        stdout=subprocess.DEVNULL,
+        check=True,
+    )
+    return time.perf_counter() - start
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.startup")
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--max-ms", type=float, help="fail if importing the CLI takes longer")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    runs = [import_times() for _ in range(args.runs)]
+    totals = [times["quoteimporter.__main__"] / 1000 for times in runs]
+    fastest = runs[totals.index(min(totals))]
+
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, "tiny.log")
+        with open(filename, "w") as file:
+            file.write("--- Log opened Sat Jul 22 20:00:00 2017\n20:56 <nick> hello\n")
+
+        dry_runs = [dry_run_seconds(filename) * 1000 for _ in range(args.runs)]
+
+    print("import quoteimporter.__main__: %.1f ms median, %.1f ms min" % (statistics.median(totals), min(totals)))
+    print("dry run of a tiny log: %.1f ms median, %.1f ms min" % (statistics.median(dry_runs), min(dry_runs)))
+    print("Slowest imports of the fastest run:")
+
+    for (module, microseconds) in sorted(fastest.items(), key=lambda m: m[1], reverse=True)[: args.top]:
+        print("%8.1f ms  %s" % (microseconds / 1000, module))
+
+    failed = False
+    loaded = [module for module in lazy_modules if module in fastest]
+
+    if len(loaded) > 0:
+        print("Imported at startup, but should be lazy: %s" % ", ".join(loaded))
+        failed = True
+
+    if args.max_ms is not None and statistics.median(totals) > args.max_ms:
+        print("Startup is slower than %.1f ms" % args.max_ms)
+        failed = True
+
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
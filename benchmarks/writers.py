@@ -0,0 +1,251 @@
+"""
+Benchmark the throughput and commit latency of every writer on a synthetic quote stream.
+PostgreSQL, MySQL and MongoDB run against throwaway local servers, and are skipped if not installed.
+
+    python -m benchmarks.writers [--writers sqlite,json,postgres] [--chunk-sizes 1000,10000,auto] [--attachment-sizes 0,100KB]
+"""
+import argparse
+import contextlib
+import json
+import os
+import os.path
+import platform
+import subprocess
+import tempfile
+import time
+
+from quoteimporter import batches, hash_quotes, metrics
+from quoteimporter.metrics import Metrics
+from quoteimporter.models import Attachment, Quote, QuoteType
+from quoteimporter.writers.jsonfile import JsonFile
+from quoteimporter.writers.sqlitedb import SqliteDb
+
+from .generate import Corpus, parse_size
+from .servers import ServerUnavailable, mongo_server, mysql_server, postgres_server
+
+writer_names = ["sqlite", "json", "postgres", "mysql", "mongo"]
+
+
+def make_quotes(count, attachment_size, seed=0):
+    """Synthetic quotes with an attachment of the given size on every tenth one"""
+    corpus = Corpus(seed)
+    quotes = []
+
+    for sequence_id in range(1, count + 1):
+        corpus.tick()
+        author = corpus.author()
+        message = corpus.text()
+        attachment = None
+
+        if attachment_size > 0 and sequence_id % 10 == 0:
+            attachment = Attachment(
+                "IMG-%i.jpg" % sequence_id, corpus.random.randbytes(attachment_size)
+            )
+
+        quotes.append(
+            Quote(
+                "#chan",
+                sequence_id,
+                author,
+                message,
+                corpus.time,
+                QuoteType.message,
+                "benchmark",
+                "%s <%s> %s" % (corpus.time.strftime("%H:%M"), author, message),
+                attachment,
+            )
+        )
+
+    return list(hash_quotes(quotes))
+
+
+def quote_bytes(quote):
+    size = len(quote.message.encode("utf-8")) + len(quote.raw.encode("utf-8"))
+    if quote.attachment is not None:
+        size += len(quote.attachment.content)
+    return size
+
+
+@contextlib.contextmanager
+def file_writers():
+    """Yields a function that creates a SQLite or JSON writer on a new file"""
+    with tempfile.TemporaryDirectory() as directory:
+        files = iter(range(1000000))
+
+        def make(writer_name):
+            filename = os.path.join(directory, "quotes%i" % next(files))
+            return SqliteDb(filename) if writer_name == "sqlite" else JsonFile(filename)
+
+        yield make
+
+
+def reset(writer):
+    """Drop the quotes of a previous run on a database server"""
+    if hasattr(writer, "quotes"):
+        writer.quotes.drop()
+        return
+
+    cursor = writer.cnx.cursor()
+    cursor.execute("DROP TABLE IF EXISTS quotes")
+    writer.cnx.commit()
+    cursor.close()
+
+
+def run(writer, quotes, chunk_size, batch_size):
+    """
+    Write the quotes in batches like an import does, timing each batch until it is committed,
+    and the commit itself. JSON and MongoDB writes have no separate commit.
+    A chunk size of "auto" keeps the writer's adaptive chunk size.
+    """
+    if chunk_size not in [None, "auto"]:
+        writer.chunk_size = chunk_size
+        writer.chunk_seconds = None
+
+    writer.initialize()
+    metrics.active = Metrics(progress=False)
+    latencies = []
+    commits = []
+
+    try:
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            start = time.perf_counter()
+
+            for batch in batches(iter(quotes), batch_size):
+                committed = metrics.active.wall["commit"]
+                batch_start = time.perf_counter()
+                writer.insert_all(batch)
+                latencies.append(time.perf_counter() - batch_start)
+                commits.append(metrics.active.wall["commit"] - committed)
+
+            # the JSON writer only writes its file at the end
+            if hasattr(writer, "flush"):
+                writer.flush()
+
+            seconds = time.perf_counter() - start
+        stages = dict(metrics.active.wall)
+    finally:
+        metrics.active = None
+
+    return (seconds, latencies, commits, stages)
+
+
+def benchmark(writer_name, make_writer, quotes, chunk_size, attachment_size, batch_size):
+    writer = make_writer()
+
+    try:
+        if writer_name not in ["sqlite", "json"]:
+            reset(writer)
+
+        (seconds, latencies, commits, stages) = run(writer, quotes, chunk_size, batch_size)
+    finally:
+        writer.close()
+
+    size = sum(quote_bytes(quote) for quote in quotes)
+
+    return {
+        "writer": writer_name,
+        "chunk_size": chunk_size,
+        "attachment_size": attachment_size,
+        "rows": len(quotes),
+        "seconds": seconds,
+        "rows_per_second": len(quotes) / seconds,
+        "megabytes_per_second": size / 1e6 / seconds,
+        "batch_latency_mean": sum(latencies) / len(latencies),
+        "batch_latency_max": max(latencies),
+        "commit_latency_mean": sum(commits) / len(commits),
+        "commit_latency_max": max(commits),
+        "stage_seconds": stages,
+    }
+
+
+def servers(writer_name):
+    if writer_name == "postgres":
+        return postgres_server()
+    elif writer_name == "mysql":
+        return mysql_server()
+    else:
+        return mongo_server()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.writers")
+    parser.add_argument("--writers", default=",".join(writer_names))
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--batch-size", type=int, default=10000)
+    parser.add_argument("--chunk-sizes", default="100,1000,2000,10000,auto")
+    parser.add_argument("--attachment-sizes", default="0,100KB")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    chunk_sizes = [
+        size if size == "auto" else int(size) for size in args.chunk_sizes.split(",")
+    ]
+    attachment_sizes = [parse_size(size) for size in args.attachment_sizes.split(",")]
+    results = []
+
+    with contextlib.ExitStack() as stack:
+        make_file_writer = stack.enter_context(file_writers())
+
+        for writer_name in args.writers.split(","):
+            if writer_name in ["sqlite", "json"]:
+                make_writer = lambda name=writer_name: make_file_writer(name)
+            else:
+                try:
+                    make_writer = stack.enter_context(servers(writer_name))
+                except (ServerUnavailable, OSError, subprocess.SubprocessError) as e:
+                    print("Skipping %s: %s" % (writer_name, e))
+                    continue
+
+            # the JSON file is rewritten as a whole, so it has no chunks
+            sizes = [None] if writer_name == "json" else chunk_sizes
+
+            for attachment_size in attachment_sizes:
+                quotes = make_quotes(args.rows, attachment_size, args.seed)
+
+                for chunk_size in sizes:
+                    result = benchmark(
+                        writer_name,
+                        make_writer,
+                        quotes,
+                        chunk_size,
+                        attachment_size,
+                        args.batch_size,
+                    )
+                    results.append(result)
+                    print(
+                        "%-8s chunk %6s attachments %7i B %9i rows/s %8.1f MB/s "
+                        "batch %8.1f ms (max %.1f) commit %6.1f ms (max %.1f)"
+                        % (
+                            writer_name,
+                            chunk_size if chunk_size is not None else "-",
+                            attachment_size,
+                            result["rows_per_second"],
+                            result["megabytes_per_second"],
+                            result["batch_latency_mean"] * 1000,
+                            result["batch_latency_max"] * 1000,
+                            result["commit_latency_mean"] * 1000,
+                            result["commit_latency_max"] * 1000,
+                        )
+                    )
+
+    if args.output is not None:
+        with open(args.output, "w") as file:
+            json.dump(
+                {
+                    "python": platform.python_version(),
+                    "machine": platform.machine(),
+                    "rows": args.rows,
+                    "batch_size": args.batch_size,
+                    "results": results,
+                },
+                file,
+                indent=2,
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,91 +1,386 @@
 """Transform logs into structured data"""
-import os.path
-
-from .models import QuoteType
-from .readers.hexchat import HexChatLogReader
-from .readers.irssi import IrssiLogReader
-from .readers.nda import NdaLogReader
-from .readers.telegram.models import TelegramOptions
-from .readers.telegram.reader import TelegramLogReader
-from .readers.whatsapp.models import DateOrder, WhatsAppOptions
-from .readers.whatsapp.reader import WhatsAppLogReader
-from .writers.dryrun import DryRun
-from .writers.jsonfile import JsonFile
-from .writers.mongodb import MongoDb
-from .writers.mysqldb import MySqlDb
-from .writers.postgresdb import PostgresDb
-from .writers.sqlitedb import SqliteDb
+import contextlib
+import itertools
 
+from . import metrics, profiling, registry
+from .archives import input_size, open_log
+from .indexes import deferred_indexes
+from .lines import LineSource
+from .models import content_hash
+from .timerange import resolve, seek, within
 
-def read_quotes(args):
+
+def make_reader(args):
     """Creates an appropriate reader using the command line args"""
-    source = os.path.basename(args.filename)
+    reader = registry.make_reader(args)
 
-    if args.type == "irssi":
-        reader = IrssiLogReader(args.channel, args.utc_offset, args.you, source)
-    elif args.type == "whatsapp":
-        date_order = (
-            DateOrder.american if args.dates == "american" else DateOrder.standard
-        )
-        attachment_dir = None if args.no_attachments else os.path.dirname(args.filename)
-        options = WhatsAppOptions(
-            args.channel, args.utc_offset, date_order, args.you, source, attachment_dir
+    if profiling.active is not None:
+        profiling.active.instrument(reader)
+
+    return reader
+
+
+def read_quotes(args):
+    """Reads all quotes from the log file given in the command line args"""
+    reader = make_reader(args)
+
+    with open_log(args.filename) as stream:
+        (_, quotes) = stream_quotes(args, reader, stream, args.skip_lines)
+        return list(quotes)
+
+
+def import_quotes(args, stats=None):
+    """
+    Streams quotes from the log file to the writer in batches, without reading the whole log into memory.
+    Each batch of args.commit_every quotes, or about args.commit_bytes, is committed on its own.
+    With args.defer_indexes, the indexes are built once at the end instead, and with args.backfill,
+    the quotes are inserted between the quotes already in the channel by timestamp.
+    """
+    reader = make_reader(args)
+    writer = make_writer(args)
+
+    if args.backfill and not hasattr(writer, "timeline"):
+        raise Exception("The %s writer can't backfill quotes" % args.writer)
+
+    writer.initialize()
+
+    with open_log(args.filename) as stream:
+        (_, quotes) = stream_quotes(args, reader, stream, args.skip_lines)
+
+        if stats is not None:
+            quotes = stats.collect(quotes)
+
+        quote_batches = batches(quotes, args.commit_every, args.commit_bytes)
+
+        if args.backfill:
+            from .gaps import backfill
+
+            for batch in quote_batches:
+                backfill(
+                    writer, args.channel, batch, args.commit_every, args.commit_bytes
+                )
+        elif args.defer_indexes:
+            bulk_insert(
+                writer,
+                args.channel,
+                quote_batches,
+                args.commit_every,
+                args.commit_bytes,
+            )
+        else:
+            insert_batches(
+                writer,
+                args.channel,
+                quote_batches,
+                args.commit_every,
+                args.commit_bytes,
+            )
+
+    writer.close()
+
+
+def stream_quotes(args, reader, stream, skip=0, state=None):
+    """
+    Reads quotes from a binary stream of the log, starting at its current position.
+    With --since, reading starts near the first quote since then instead, unless a reader state is given.
+    Returns the line source, which tracks the byte offset (None for Telegram exports), and the quotes.
+    """
+    since = resolve(args.since, args.utc_offset)
+    until = resolve(args.until, args.utc_offset)
+
+    if since is not None and state is None:
+        state = seek(reader, stream, since)
+
+    lines = None if args.type == "telegram" else LineSource(stream)
+    source = stream if lines is None else lines
+    instrumentation = metrics.active
+
+    if instrumentation is not None:
+        start = stream.tell()
+        size = input_size(stream)
+        instrumentation.total_bytes = None if size is None else size - start
+        instrumentation.position = (
+            (lambda: stream.tell() - start)
+            if lines is None
+            else (lambda: lines.offset - start)
         )
-        reader = WhatsAppLogReader(options)
-    elif args.type == "hexchat":
-        reader = HexChatLogReader(args.channel, args.utc_offset, args.you, source)
-    elif args.type == "nda":
-        reader = NdaLogReader(args.channel, args.you, source)
-    elif args.type == "telegram":
-        export_dir = None if args.no_attachments else os.path.dirname(args.filename)
-        options = TelegramOptions(args.channel, source, export_dir)
-        reader = TelegramLogReader(options)
+
+        if lines is not None:
+            source = instrumentation.track_lines(lines)
+
+    if state is None:
+        quotes = reader.read(source, skip)
     else:
-        raise Exception("Invalid log type")
+        quotes = reader.read(source, skip, state)
+
+    if since is not None or until is not None:
+        quotes = within(quotes, since, until, args.utc_offset)
+
+    if instrumentation is not None:
+        quotes = instrumentation.track_quotes(quotes)
+
+    return (lines, hash_quotes(quotes))
+
+
+def batches(quotes, batch_size, batch_bytes=None):
+    """
+    Split a stream of quotes into lists of batch_size quotes, or fewer if they add up to batch_bytes,
+    without reading ahead of the last quote of each list
+    """
+    while True:
+        if batch_bytes is None:
+            batch = list(itertools.islice(quotes, batch_size))
+        else:
+            batch = []
+            size = 0
+
+            for quote in quotes:
+                batch.append(quote)
+                size += quote_size(quote)
+
+                if len(batch) >= batch_size or size >= batch_bytes:
+                    break
+
+        if len(batch) == 0:
+            return
+
+        yield batch
+
+
+def quote_size(quote):
+    """Estimate how many bytes a quote takes up when it is written"""
+    size = len(quote.author) + len(quote.message) + len(quote.raw)
+
+    if quote.attachment is not None and quote.attachment.content is not None:
+        size += len(quote.attachment.content)
+
+    return size
+
+
+def hash_quotes(quotes):
+    """Sets the content hash of each quote as it is read"""
+    timestamp = None
+    occurrences = {}
+
+    for quote in quotes:
+        # identical quotes always share a timestamp, so only count occurrences within one
+        if quote.timestamp != timestamp:
+            timestamp = quote.timestamp
+            occurrences = {}
+
+        key = (quote.author, quote.raw)
+        occurrence = occurrences.get(key, 0)
+        occurrences[key] = occurrence + 1
+
+        quote.content_hash = content_hash(quote, occurrence)
+        yield quote
+
+
+def make_writer(args):
+    """
+    Creates an appropriate writer using the command line args. With args.connections above 1, it is a
+    pool of that many writers, each with its own connection, that load batches in parallel, and one more
+    for everything else, unless the writer can write several chunks at once by itself.
+    """
+    writer = configure_writer(registry.make_writer(args), args)
 
-    with open(args.filename, encoding="utf-8", errors="replace") as stream:
-        return list(reader.read(stream, args.skip_lines))
+    if args.connections == 1:
+        return writer
+
+    # writers that write several chunks at once by themselves
+    if hasattr(writer, "in_flight"):
+        writer.in_flight = args.connections
+        return writer
+
+    if not hasattr(writer, "write_all"):
+        raise Exception(
+            "The %s writer can't write through several connections" % args.writer
+        )
+
+    from .writers.pool import WriterPool
+
+    loaders = [
+        configure_writer(registry.make_writer(args), args)
+        for _ in range(args.connections)
+    ]
+    return WriterPool(writer, loaders)
+
+
+def configure_writer(writer, args):
+    """Applies the writer options of the command line args to a writer"""
+    if args.merge is not None:
+        if not hasattr(writer, "merge"):
+            raise Exception("The %s writer can't merge quotes" % args.writer)
+
+        writer.merge = args.merge
+
+    writer.sequence_gap = args.sequence_gap
+
+    # writers that send quotes in chunks, with the defaults of each writer unless overridden
+    if hasattr(writer, "chunk_seconds"):
+        if args.chunk_bytes is not None:
+            writer.chunk_bytes = args.chunk_bytes
+        if args.chunk_seconds is not None:
+            writer.chunk_seconds = args.chunk_seconds or None
+
+    return writer
 
 
 def write_quotes(args, quotes):
     """Initializes a writer and writes the quotes to it"""
-    if args.writer == "mysql":
-        writer = MySqlDb(
-            host="127.0.0.1",
-            user=args.mysql_user,
-            password=args.mysql_password,
-            database=args.database,
-        )
-    elif args.writer == "postgres":
-        writer = PostgresDb(
-            host="127.0.0.1",
-            user=args.postgres_user,
-            password=args.postgres_password,
-            dbname=args.database,
+    writer = make_writer(args)
+    writer.initialize()
+    insert_quotes(writer, args.channel, quotes, args.commit_every, args.commit_bytes)
+    writer.close()
+
+
+def insert_quotes(
+    writer, channel, quotes, commit_every=10000, commit_bytes=None, announce=True
+):
+    """
+    Appends the quotes to the channel in an initialized writer, committing every commit_every quotes
+    or about commit_bytes. Quotes at the start that were already imported before, like the old part of a
+    re-exported chat history, are recognized by their content hash and skipped.
+    Writers that merge match every quote to the quotes of the channel by its content hash instead, so
+    quotes already present keep their sequence id and only the new ones are appended after the others.
+    The quotes already present are written without a sequence id, only to update them, or not at all if
+    the writer skips them.
+    With announce, prints the sequence id the appended quotes start at. Returns how many were appended.
+    """
+    if getattr(writer, "merge", None) is not None:
+        from .gaps import new_quotes
+
+        new = new_quotes(writer, channel, quotes)
+        print(
+            "Merging %i quotes into %s, %i of them new" % (len(quotes), channel, len(new))
         )
-    elif args.writer == "json":
-        writer = JsonFile("quotes.json")
-    elif args.writer == "mongo":
-        writer = MongoDb("localhost", 27017, args.database)
-    elif args.writer == "sqlite":
-        writer = SqliteDb("quotes.db")
-    else:
-        writer = DryRun()
 
-    writer.initialize()
+        if writer.merge == "skip":
+            quotes = new
+        else:
+            for quote in quotes:
+                quote.sequence_id = None
 
-    max_existing_sequence_id = writer.max_sequence_id(args.channel)
-    shift(quotes, max_existing_sequence_id)
+        with allocated(writer, channel, new):
+            for batch in batches(iter(quotes), commit_every, commit_bytes):
+                writer.insert_all(batch)
 
-    print("Starting at sequence id %i for %s" % (quotes[0].sequence_id, args.channel))
+        return len(new)
 
-    writer.insert_all(quotes)
-    writer.close()
+    present = count_present(writer, channel, quotes)
+
+    if present == len(quotes):
+        print("All %i quotes are already present in %s" % (present, channel))
+        return 0
+
+    if present > 0:
+        print("Skipping %i quotes already present in %s" % (present, channel))
+        quotes = quotes[present:]
+
+    with allocated(writer, channel, quotes):
+        if announce:
+            print("Starting at sequence id %i for %s" % (quotes[0].sequence_id, channel))
+
+        for batch in batches(iter(quotes), commit_every, commit_bytes):
+            writer.insert_all(batch)
 
+    return len(quotes)
 
-def count(quotes, quote_type):
-    """Counts the number of quotes of a given type"""
-    return sum(1 for x in quotes if x.quote_type == quote_type)
+
+def insert_batches(writer, channel, quote_batches, commit_every=10000, commit_bytes=None):
+    """
+    Appends batches of quotes to the channel like insert_quotes, only printing the sequence id the
+    import starts at for the first batch that appends any quotes
+    """
+    announce = True
+
+    for batch in quote_batches:
+        if insert_quotes(writer, channel, batch, commit_every, commit_bytes, announce) > 0:
+            announce = False
+
+
+def bulk_insert(writer, channel, quote_batches, commit_every=10000, commit_bytes=None):
+    """
+    Appends batches of quotes to the channel with the indexes of the writer dropped, and builds them
+    once at the end. Without indexes, every lookup scans the whole table, so whether the log was
+    already imported is only looked up at the start, and a log that was already partly imported is
+    inserted the usual way, committing every commit_every quotes or about commit_bytes like the batches.
+    The sequence ids of each batch are reserved like for other imports.
+    """
+    batch = next(quote_batches, None)
+
+    if batch is None:
+        return
+
+    if count_present(writer, channel, batch[:1]) > 0:
+        print("%s already has quotes from this log, so its indexes are kept" % channel)
+
+        quote_batches = itertools.chain([batch], quote_batches)
+        insert_batches(writer, channel, quote_batches, commit_every, commit_bytes)
+
+        return
+
+    # reserving nothing brings the counter up to the last quote while the index makes that cheap
+    if hasattr(writer, "reserve_sequence_ids"):
+        writer.reserve_sequence_ids(channel, 0)
+
+    with deferred_indexes(writer):
+        with allocated(writer, channel, batch):
+            print("Starting at sequence id %i for %s" % (batch[0].sequence_id, channel))
+            writer.insert_all(batch)
+
+        for batch in quote_batches:
+            with allocated(writer, channel, batch):
+                writer.insert_all(batch)
+
+
+def count_present(writer, channel, quotes, chunk_size=1000):
+    """Counts the quotes at the start that are already present in the writer, looking them up in chunks"""
+    present = 0
+
+    for i in range(0, len(quotes), chunk_size):
+        hashes = [quote.content_hash for quote in quotes[i : i + chunk_size]]
+        existing = writer.existing_hashes(channel, hashes)
+
+        for content_hash in hashes:
+            if content_hash not in existing:
+                return present
+            present += 1
+
+    return present
+
+
+@contextlib.contextmanager
+def allocated(writer, channel, quotes):
+    """
+    Gives the quotes the next sequence ids of the channel, keeping their order, while they are written.
+    With a writer.sequence_gap above 1, each quote is preceded by that many ids minus one that are left
+    free for older quotes inserted later.
+    Writers that reserve sequence ids hand out each block atomically, so importers writing to the same
+    channel at once never get the same ones, and take the block back if writing it fails. With other
+    writers, the block simply starts after the last quote of the channel.
+    """
+    gap = getattr(writer, "sequence_gap", 1)
+
+    if not hasattr(writer, "reserve_sequence_ids"):
+        number(quotes, writer.max_sequence_id(channel) + 1, gap)
+        yield
+        return
+
+    first = writer.reserve_sequence_ids(channel, len(quotes) * gap)
+    number(quotes, first, gap)
+
+    try:
+        yield
+    except BaseException:
+        writer.release_sequence_ids(channel, first, len(quotes) * gap)
+        raise
+
+
+def number(quotes, first, gap=1):
+    """Numbers the quotes from sequence id first on, gap apart, ending each gap with a quote"""
+    for (i, quote) in enumerate(quotes):
+        quote.sequence_id = first + (i + 1) * gap - 1
 
 
 def shift(quotes, amount):
@@ -93,16 +388,3 @@ def shift(quotes, amount):
     for quote in quotes:
         quote.sequence_id += amount
 
-
-def print_stats(quotes):
-    """Prints stats about the quotes read"""
-    print("Read %i messages" % count(quotes, QuoteType.message))
-    print("Read %i subject changes" % count(quotes, QuoteType.subject))
-    print("Read %i joins" % count(quotes, QuoteType.join))
-    print("Read %i leaves" % count(quotes, QuoteType.leave))
-    print("Read %i kicks" % count(quotes, QuoteType.kick))
-    print("Read %i bans" % count(quotes, QuoteType.ban))
-    print("Read %i nick changes" % count(quotes, QuoteType.nick))
-    print("Read %i system notices" % count(quotes, QuoteType.system))
-    print("Read %i attachments" % count(quotes, QuoteType.attachment))
-    print("Read %i total" % len(quotes))
@@ -1,37 +1,268 @@
 import argparse
+import cProfile
+import os.path
+import sys
 
-from . import print_stats, read_quotes, write_quotes
+from . import import_quotes, make_reader, metrics, profiling, registry, rejects
+from .archives import attachment_dir
+from .checkpoint import import_with_checkpoints
+from .dayindex import build_index, index_path
+from .follow import follow
+from .metrics import Metrics, print_stages, write_metrics
+from .profiling import Profiler, print_profile
+from .rejects import Rejects, print_rejects
+from .stats import Stats, print_stats, write_stats
+from .timerange import iso_time
+from .unused import find_unused_attachments
 
 
-def parse_args():
-    """Parse arguments from the command line"""
-    parser = argparse.ArgumentParser()
-    parser.add_argument(
-        "--writer",
-        choices=["sqlite", "mysql", "json", "mongo", "postgres", "none"],
-        default="none",
-    )
+def byte_size(value):
+    """A number of bytes on the command line, like 64MB"""
+    units = {"KB": 2**10, "MB": 2**20, "GB": 2**30}
+
+    for (unit, factor) in units.items():
+        if value.upper().endswith(unit):
+            return int(float(value[: -len(unit)]) * factor)
+
+    return int(value)
+
+
+def write_concern(value):
+    """A MongoDB write concern on the command line, a number of nodes like 1 or a name like majority"""
+    return int(value) if value.isdigit() else value
+
+
+def add_reader_args(parser):
+    """Add the options used to construct readers"""
     parser.add_argument("--utc-offset", type=int, default=0)
     parser.add_argument("--dates", choices=["standard", "american"], default="standard")
     parser.add_argument("--you", default="You")
     parser.add_argument("--skip-lines", type=int, default=0)
+    parser.add_argument("--since", type=iso_time)
+    parser.add_argument("--until", type=iso_time)
     parser.add_argument("--no-attachments", action="store_true")
+    parser.add_argument("--rejects-file")
+    parser.add_argument("--unknown-samples", type=int, default=3)
+
+
+def add_writer_args(parser):
+    """Add the options used to construct writers"""
+    parser.add_argument(
+        "--writer",
+        default="none",
+        help="%s, or a writer added by another package" % ", ".join(registry.writers),
+    )
     parser.add_argument("--database", default="quotes")
     parser.add_argument("--mysql-user", default="root")
     parser.add_argument("--mysql-password")
     parser.add_argument("--postgres-user", default="postgres")
     parser.add_argument("--postgres-password")
+    parser.add_argument("--mongo-write-concern", type=write_concern)
     parser.add_argument(
-        "type", choices=["irssi", "whatsapp", "hexchat", "nda", "telegram"]
+        "--commit-every",
+        "--checkpoint-every",
+        dest="commit_every",
+        type=int,
+        default=10000,
+    )
+    parser.add_argument("--commit-bytes", type=byte_size)
+    parser.add_argument("--chunk-bytes", type=byte_size)
+    parser.add_argument("--chunk-seconds", type=float)
+    parser.add_argument("--merge", choices=["skip", "update"])
+    parser.add_argument("--sequence-gap", type=int, default=1)
+    parser.add_argument("--connections", type=int, default=1)
+
+
+def parse_args(argv):
+    """Parse arguments from the command line"""
+    parser = argparse.ArgumentParser()
+    add_reader_args(parser)
+    add_writer_args(parser)
+    parser.add_argument("--checkpoint")
+    parser.add_argument("--resume", action="store_true")
+    parser.add_argument("--defer-indexes", action="store_true")
+    parser.add_argument("--backfill", action="store_true")
+    parser.add_argument("--follow", action="store_true")
+    parser.add_argument("--flush-interval", type=float, default=1.0)
+    parser.add_argument("--flush-size", type=int, default=1000)
+    parser.add_argument("--stats-file")
+    parser.add_argument("--progress", action="store_true")
+    parser.add_argument("--progress-interval", type=float, default=10.0)
+    parser.add_argument("--metrics-file")
+    parser.add_argument("--profile", action="store_true")
+    parser.add_argument("--profile-output")
+    parser.add_argument(
+        "type", help="%s, or a reader added by another package" % ", ".join(registry.readers)
     )
     parser.add_argument("channel")
     parser.add_argument("filename")
-    return parser.parse_args()
+    args = parser.parse_args(argv)
+
+    if args.resume and args.checkpoint is None:
+        parser.error("--resume requires --checkpoint")
+
+    if args.defer_indexes and args.follow:
+        parser.error("--defer-indexes can't be used with --follow")
+
+    if args.defer_indexes and args.merge is not None:
+        parser.error("--defer-indexes can't be used with --merge")
+
+    if args.connections > 1 and (args.follow or args.backfill):
+        parser.error("--connections can't be used with --follow or --backfill")
+
+    if args.backfill and (args.follow or args.checkpoint is not None):
+        parser.error("--backfill can't be used with --follow or --checkpoint")
+
+    if args.backfill and (args.defer_indexes or args.merge is not None):
+        parser.error("--backfill can't be used with --defer-indexes or --merge")
+
+    return args
+
+
+def parse_batch_args(argv):
+    """Parse arguments for the batch command"""
+    parser = argparse.ArgumentParser(prog="quoteimporter batch")
+    add_reader_args(parser)
+    add_writer_args(parser)
+    parser.add_argument("--workers", type=int)
+    parser.add_argument("--pattern", default="*.log")
+    parser.add_argument("type", choices=["irssi", "hexchat"])
+    parser.add_argument("directory")
+    return parser.parse_args(argv)
+
+
+def parse_unused_attachments_args(argv):
+    """Parse arguments for the unused-attachments command"""
+    parser = argparse.ArgumentParser(prog="quoteimporter unused-attachments")
+    parser.add_argument("--utc-offset", type=int, default=0)
+    parser.add_argument("--dates", choices=["standard", "american"], default="standard")
+    parser.add_argument("type", choices=["whatsapp", "telegram"])
+    parser.add_argument("filename")
+    parser.add_argument("attachments_dir", nargs="?")
+    parser.set_defaults(channel="", you="You", no_attachments=True)
+    return parser.parse_args(argv)
+
+
+def parse_index_args(argv):
+    """Parse arguments for the index command"""
+    parser = argparse.ArgumentParser(prog="quoteimporter index")
+    parser.add_argument("type", choices=["irssi", "hexchat"])
+    parser.add_argument("filenames", nargs="+")
+    parser.set_defaults(channel="", utc_offset=0, you="You")
+    return parser.parse_args(argv)
+
+
+def import_command(argv):
+    """Read a log file and write its quotes"""
+    args = parse_args(argv)
+
+    stats = Stats()
+    rejects.active = Rejects(args.unknown_samples, args.rejects_file)
+
+    if args.progress or args.metrics_file is not None:
+        metrics.active = Metrics(
+            interval=args.progress_interval,
+            metrics_file=args.metrics_file,
+            progress=args.progress,
+        )
+
+    if args.profile:
+        profiling.active = Profiler()
+
+    if args.profile_output is not None:
+        profile = cProfile.Profile()
+        profile.enable()
+
+    if args.follow:
+        follow(args, stats)
+    elif args.checkpoint is not None:
+        import_with_checkpoints(args, stats)
+    else:
+        import_quotes(args, stats)
+
+    if args.profile_output is not None:
+        profile.disable()
+        profile.dump_stats(args.profile_output)
+        print("Wrote profile to %s" % args.profile_output)
+
+    print_stats(stats)
+    print_rejects(rejects.active)
+    rejects.active.close()
+
+    if args.stats_file is not None:
+        write_stats(stats, args.stats_file)
+
+    if metrics.active is not None:
+        print_stages(metrics.active)
+
+        if args.metrics_file is not None:
+            write_metrics(metrics.active, args.metrics_file)
+
+    if profiling.active is not None:
+        print_profile(profiling.active)
+
+
+def batch_command(argv):
+    """Import every log file in a directory tree"""
+    # the process pool is slow to import, so only import it for this command
+    from .batch import import_tree
+
+    args = parse_batch_args(argv)
+    rejects.active = Rejects(args.unknown_samples, args.rejects_file)
+    import_tree(args, args.directory, args.workers, args.pattern)
+    print_rejects(rejects.active)
+    rejects.active.close()
+
+
+def unused_attachments_command(argv):
+    """Print attachments in the export directory that the log never refers to"""
+    args = parse_unused_attachments_args(argv)
+    attachments_dir = args.attachments_dir or attachment_dir(
+        os.path.abspath(args.filename)
+    )
+    rejects.active = Rejects()
+    report = find_unused_attachments(make_reader(args), args.filename, attachments_dir)
+
+    for path in report.unused:
+        print(path)
+
+    for name in report.missing:
+        print("Missing %s" % name, file=sys.stderr)
+
+    print(
+        "%i unused attachments (%i bytes), %i missing"
+        % (len(report.unused), report.unused_bytes, len(report.missing)),
+        file=sys.stderr,
+    )
+    print_rejects(rejects.active, file=sys.stderr)
+
+
+def index_command(argv):
+    """Build or refresh the day index of log files, so --since can seek near the date"""
+    args = parse_index_args(argv)
+
+    for filename in args.filenames:
+        reader = make_reader(argparse.Namespace(**vars(args), filename=filename))
+        index = build_index(reader, filename)
+        print(
+            "Indexed %i days of %s in %s"
+            % (len(index.days), filename, index_path(filename))
+        )
+
+
+commands = {
+    "batch": batch_command,
+    "index": index_command,
+    "unused-attachments": unused_attachments_command,
+}
+
 
+def main(argv):
+    if len(argv) > 0 and argv[0] in commands:
+        commands[argv[0]](argv[1:])
+    else:
+        import_command(argv)
 
-args = parse_args()
-quotes = read_quotes(args)
-print_stats(quotes)
 
-if len(quotes) > 0:
-    write_quotes(args, quotes)
+if __name__ == "__main__":
+    main(sys.argv[1:])
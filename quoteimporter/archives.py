@@ -0,0 +1,131 @@
+"""
+Read logs from compressed files and zip archives without extracting them first.
+The compression modules are only imported for files that need them.
+"""
+import io
+import os
+import os.path
+import posixpath
+
+# extensions of compressed logs
+compressions = [".gz", ".xz", ".bz2"]
+
+# names of the log inside a WhatsApp or Telegram export archive
+log_members = ["_chat.txt", "result.json"]
+
+
+def is_zip(filename):
+    return filename.lower().endswith(".zip")
+
+
+def open_log(filename):
+    """
+    Open a log file as a binary stream. Compressed logs are decompressed while reading,
+    and for zip archives, the log inside is opened.
+    """
+    extension = os.path.splitext(filename)[1].lower()
+
+    if extension == ".gz":
+        import gzip
+
+        return gzip.open(filename, "rb")
+
+    if extension == ".xz":
+        import lzma
+
+        return lzma.open(filename, "rb")
+
+    if extension == ".bz2":
+        import bz2
+
+        return bz2.open(filename, "rb")
+
+    if is_zip(filename):
+        import zipfile
+
+        archive = zipfile.ZipFile(filename)
+        return archive.open(log_member(archive))
+
+    return open(filename, "rb")
+
+
+def is_plain(stream):
+    """
+    Whether the stream reads a file as it is on disk, so it can be memory-mapped and its size is known.
+    Decompressing streams have the file descriptor of the compressed file.
+    """
+    return isinstance(stream, io.BufferedReader)
+
+
+def input_size(stream):
+    """The size of the file a stream reads, or None if it isn't known up front"""
+    return os.fstat(stream.fileno()).st_size if is_plain(stream) else None
+
+
+def log_member(archive):
+    """The name of the log in an archive: a known export log, or else its only text file"""
+    names = archive.namelist()
+
+    for name in names:
+        if posixpath.basename(name) in log_members:
+            return name
+
+    texts = [name for name in names if name.lower().endswith(".txt")]
+
+    if len(texts) != 1:
+        raise Exception("No chat log found in %s" % archive.filename)
+
+    return texts[0]
+
+
+class ZipDirectory:
+    """The folder of the log inside a zip archive, to read attachments from"""
+
+    def __init__(self, filename):
+        import zipfile
+
+        self.archive = zipfile.ZipFile(filename)
+        self.log = log_member(self.archive)
+        self.prefix = posixpath.dirname(self.log)
+
+    def read(self, relative_path):
+        """The contents of a file relative to the log, or None if the archive doesn't have it"""
+        name = posixpath.normpath(posixpath.join(self.prefix, relative_path))
+
+        try:
+            info = self.archive.getinfo(name)  # looked up in the archive's index of members
+        except KeyError:
+            return None
+
+        return None if info.is_dir() else self.archive.read(info)
+
+    def files(self):
+        """The names and sizes of the members below the folder of the log, other than the log itself"""
+        prefix = "" if self.prefix == "" else self.prefix + "/"
+
+        for info in self.archive.infolist():
+            if (
+                info.filename.startswith(prefix)
+                and not info.is_dir()
+                and info.filename != self.log
+            ):
+                yield (info.filename, info.file_size)
+
+
+def attachment_dir(filename):
+    """Where the attachments of a log are: the archive it is in, or the folder next to it"""
+    return ZipDirectory(filename) if is_zip(filename) else os.path.dirname(filename)
+
+
+def read_file(directory, relative_path):
+    """The contents of a file in a folder or a ZipDirectory, or None if there is no such file"""
+    if isinstance(directory, ZipDirectory):
+        return directory.read(relative_path)
+
+    path = os.path.join(directory, relative_path)
+
+    if not os.path.isfile(path):
+        return None
+
+    with open(path, "rb") as file:
+        return file.read()
@@ -0,0 +1,152 @@
+"""Import directory trees of irssi or HexChat logs"""
+import argparse
+import fnmatch
+import os
+import os.path
+import re
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from . import insert_quotes, make_writer, read_quotes, rejects
+from .archives import compressions
+from .rejects import Rejects
+
+# #channel.log, optionally with a date suffix like #channel-2017-07-22.log or #channel.20170722.log,
+# and optionally compressed like #channel.log.gz
+channel_file_re = re.compile(
+    r"^(.+?)(?:[._-]\d{4}-?\d{2}-?\d{2})?\.log(?:\.gz|\.xz|\.bz2)?$"
+)
+
+# daily rotated files inside a directory per channel, like #channel/2017-07-22.log
+date_file_re = re.compile(r"^\d{4}-?\d{2}-?\d{2}\.log(?:\.gz|\.xz|\.bz2)?$")
+
+
+class LogFile:
+    """A log file in the tree and the channel it belongs to"""
+
+    def __init__(self, path, channel, size):
+        self.path = path
+        self.channel = channel
+        self.size = size
+
+
+def infer_channel(path):
+    """Infers the channel name from the path of a log file"""
+    filename = os.path.basename(path)
+
+    if date_file_re.match(filename) is not None:
+        return os.path.basename(os.path.dirname(path))
+
+    match = channel_file_re.match(filename)
+    return match.group(1) if match is not None else os.path.splitext(filename)[0]
+
+
+def find_logs(directory, pattern="*.log"):
+    """
+    Walks the directory and finds all log files, grouped per channel in path order. The pattern also
+    matches the compressed files of the names it matches, like #channel.log.gz for *.log.
+    """
+    channels = {}
+    patterns = [pattern] + [pattern + extension for extension in compressions]
+
+    for root, _, names in os.walk(directory):
+        matching = [
+            name
+            for name in names
+            if any(fnmatch.fnmatch(name, glob) for glob in patterns)
+        ]
+
+        for name in matching:
+            path = os.path.join(root, name)
+            channel = infer_channel(path)
+            log_file = LogFile(path, channel, os.path.getsize(path))
+            channels.setdefault(channel, []).append(log_file)
+
+    for log_files in channels.values():
+        log_files.sort(key=lambda f: f.path)
+
+    return channels
+
+
+def schedule(channels):
+    """
+    The order to parse the files of the channels in: the first file of every channel, then the second
+    ones and so on, the channels with the most bytes first. Each channel is written in path order, so
+    this keeps its later files from waiting in memory until its first one is parsed.
+    """
+    sizes = {
+        channel: sum(log_file.size for log_file in log_files)
+        for (channel, log_files) in channels.items()
+    }
+    tasks = [
+        (channel, index, log_file)
+        for (channel, log_files) in channels.items()
+        for (index, log_file) in enumerate(log_files)
+    ]
+    tasks.sort(key=lambda task: (task[1], -sizes[task[0]]))
+    return tasks
+
+
+def import_tree(args, directory, workers=None, pattern="*.log"):
+    """
+    Parses all log files below the directory in a process pool and writes them through a single writer.
+    Each channel is parsed and written in path order, the biggest channels first.
+    """
+    channels = find_logs(directory, pattern)
+    tasks = schedule(channels)
+
+    # results that arrived before an earlier file of the same channel, by channel and file index
+    pending = {channel: {} for channel in channels}
+    next_index = {channel: 0 for channel in channels}
+
+    writer = make_writer(args)
+    writer.initialize()
+
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {
+                executor.submit(
+                    read_file, file_args(args, channel, log_file.path)
+                ): (channel, index)
+                for (channel, index, log_file) in tasks
+            }
+
+            for future in as_completed(futures):
+                (channel, index) = futures[future]
+                (quotes, file_rejects) = future.result()
+                pending[channel][index] = quotes
+
+                if rejects.active is not None:
+                    rejects.active.merge(file_rejects)
+
+                while next_index[channel] in pending[channel]:
+                    quotes = pending[channel].pop(next_index[channel])
+                    log_file = channels[channel][next_index[channel]]
+                    next_index[channel] += 1
+
+                    print("Read %i from %s" % (len(quotes), log_file.path))
+
+                    if len(quotes) > 0:
+                        insert_quotes(
+                            writer,
+                            channel,
+                            quotes,
+                            args.commit_every,
+                            args.commit_bytes,
+                        )
+    finally:
+        writer.close()
+
+
+def read_file(args):
+    """Reads all quotes of a file in a worker process, collecting its unknown lines to send back"""
+    rejects.active = Rejects(args.unknown_samples)
+
+    if args.rejects_file is not None:
+        rejects.active.lines = []
+
+    return (read_quotes(args), rejects.active)
+
+
+def file_args(args, channel, filename):
+    """Copies the command line args for reading a single file of the tree"""
+    return argparse.Namespace(**dict(vars(args), channel=channel, filename=filename))
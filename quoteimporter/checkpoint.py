@@ -0,0 +1,167 @@
+"""Record import progress so interrupted imports can be resumed"""
+import contextlib
+import json
+import os
+
+from . import allocated, batches, make_reader, make_writer, stream_quotes
+from .archives import open_log
+from .indexes import deferred_indexes
+
+
+class Checkpoint:
+    """The position in a log file after the last committed batch of quotes"""
+
+    def __init__(self, filename, channel, offset, sequence_id, state):
+        self.filename = filename
+        self.channel = channel
+        self.offset = offset  # byte offset, or None for logs that aren't line based
+        self.sequence_id = sequence_id  # last sequence id written to the channel
+        self.state = state  # reader state, see state() on the readers
+
+
+def load_checkpoint(path):
+    """Read a checkpoint file, or None if there is none"""
+    if not os.path.exists(path):
+        return None
+
+    with open(path) as file:
+        return Checkpoint(**json.load(file))
+
+
+def save_checkpoint(path, checkpoint):
+    """Atomically replace the checkpoint file, so a crash never leaves it half written"""
+    temp_path = path + ".tmp"
+
+    with open(temp_path, "w") as file:
+        json.dump(vars(checkpoint), file)
+        file.flush()
+        os.fsync(file.fileno())
+
+    os.replace(temp_path, path)
+
+
+def saved(args, checkpoint):
+    """A function that saves the checkpoint file once its batch is committed, or None without one"""
+    if args.checkpoint is None:
+        return None
+
+    return lambda: save_checkpoint(args.checkpoint, checkpoint)
+
+
+def resume_checkpoint(args, writer):
+    """
+    The checkpoint to resume from. Writers that commit a progress marker with every batch may be
+    further along than the checkpoint file, if the import stopped between the commit and saving the file.
+    """
+    checkpoint = None if args.checkpoint is None else load_checkpoint(args.checkpoint)
+
+    if hasattr(writer, "load_progress"):
+        progress = writer.load_progress(args.channel, os.path.abspath(args.filename))
+
+        if progress is not None and (
+            checkpoint is None or progress["sequence_id"] > checkpoint.sequence_id
+        ):
+            checkpoint = Checkpoint(**progress)
+
+    return checkpoint
+
+
+def write_batch(writer, batch, checkpoint, committed=None):
+    """
+    Insert a batch, and commit the checkpoint with it if the writer can, then call committed. A writer
+    pool writes the batch in the background and calls committed once it is committed.
+    """
+    progress = vars(checkpoint) if hasattr(writer, "load_progress") else None
+
+    if hasattr(writer, "submit"):
+        writer.submit(batch, progress, committed)
+        return
+
+    if progress is not None:
+        writer.insert_all(batch, progress)
+    else:
+        writer.insert_all(batch)
+
+    if committed is not None:
+        committed()
+
+
+def verify_checkpoint(checkpoint, args, writer, max_existing_sequence_id):
+    """
+    Make sure the checkpoint belongs to this import and matches what has been written. Other imports
+    may have appended to the channel since, so the quote of the checkpoint only has to be in it.
+    """
+    if checkpoint.filename != os.path.abspath(args.filename):
+        raise Exception("Checkpoint is for a different file: %s" % checkpoint.filename)
+
+    if checkpoint.sequence_id > max_existing_sequence_id or (
+        hasattr(writer, "sequence_ids_from")
+        and next(writer.sequence_ids_from(args.channel, checkpoint.sequence_id, 1), None)
+        != checkpoint.sequence_id
+    ):
+        raise Exception(
+            "Checkpoint is at sequence id %i, but %s has no quote there (it is at %i)"
+            % (checkpoint.sequence_id, args.channel, max_existing_sequence_id)
+        )
+
+
+def import_with_checkpoints(args, stats=None):
+    """
+    Import the log in batches of args.commit_every quotes, or about args.commit_bytes, and save a
+    checkpoint after each committed batch. With args.resume, seek straight to the last checkpoint and
+    restore the reader state saved with it. With args.defer_indexes, the indexes are built at the end.
+    """
+    reader = make_reader(args)
+
+    if not hasattr(reader, "state"):
+        raise Exception("Checkpoints are not supported for %s logs" % args.type)
+
+    writer = make_writer(args)
+    writer.initialize()
+    checkpoint = resume_checkpoint(args, writer) if args.resume else None
+    max_existing_sequence_id = writer.max_sequence_id(args.channel)
+    count = 0
+
+    if checkpoint is not None:
+        verify_checkpoint(checkpoint, args, writer, max_existing_sequence_id)
+
+    print(
+        "Starting at sequence id %i for %s" % (max_existing_sequence_id + 1, args.channel)
+    )
+
+    skip = args.skip_lines if checkpoint is None else 0
+    state = checkpoint.state if checkpoint is not None else None
+
+    indexes = (
+        deferred_indexes(writer) if args.defer_indexes else contextlib.nullcontext()
+    )
+
+    with open_log(args.filename) as stream, indexes:
+        if checkpoint is not None and checkpoint.offset is not None:
+            stream.seek(checkpoint.offset)
+
+        # the telegram reader state is an index into the message array instead
+        (lines, quotes) = stream_quotes(args, reader, stream, skip, state)
+
+        if stats is not None:
+            quotes = stats.collect(quotes)
+
+        for batch in batches(quotes, args.commit_every, args.commit_bytes):
+            # the reader is suspended right after the last quote of the batch
+            offset = lines.offset if lines is not None else None
+            state = reader.state()
+
+            with allocated(writer, args.channel, batch):
+                checkpoint = Checkpoint(
+                    os.path.abspath(args.filename),
+                    args.channel,
+                    offset,
+                    batch[-1].sequence_id,
+                    state,
+                )
+                write_batch(writer, batch, checkpoint, saved(args, checkpoint))
+
+            count += len(batch)
+
+    writer.close()
+    print("Imported %i" % count)
@@ -0,0 +1,83 @@
+"""A sidecar index of where each day starts in irssi and HexChat logs, to seek near a date"""
+import bisect
+import json
+import os
+from datetime import date
+
+from .archives import compressions
+
+
+class DayIndex:
+    """The byte offsets of the lines that start a day, like --- Day changed, up to the indexed size"""
+
+    def __init__(self, size, days):
+        self.size = size  # bytes indexed, always the end of a whole line
+        self.days = days  # [date in ISO format, byte offset] in the order of the log
+
+
+def index_path(filename):
+    return filename + ".index.json"
+
+
+def load_index(filename):
+    """The index of a log file, or None if there is none or the log was truncated since"""
+    path = index_path(filename)
+
+    if not os.path.exists(path):
+        return None
+
+    with open(path) as file:
+        index = DayIndex(**json.load(file))
+
+    if os.path.getsize(filename) < index.size:
+        print("Ignoring the outdated index %s" % path)
+        return None
+
+    return index
+
+
+def save_index(filename, index):
+    """Atomically replace the index file, like a checkpoint"""
+    path = index_path(filename)
+    temp_path = path + ".tmp"
+
+    with open(temp_path, "w") as file:
+        json.dump(vars(index), file)
+
+    os.replace(temp_path, path)
+
+
+def build_index(reader, filename):
+    """
+    Index the days of a log file, or only the lines appended to it since it was last indexed.
+    The reader recognizes the lines that start a day with its day() method.
+    """
+    if os.path.splitext(filename)[1].lower() in compressions + [".zip"]:
+        raise Exception("Compressed logs can't be indexed: %s" % filename)
+
+    index = load_index(filename) or DayIndex(0, [])
+
+    with open(filename, "rb") as stream:
+        stream.seek(index.size)
+
+        for line in stream:
+            # an unfinished last line is indexed once it is complete
+            if not line.endswith(b"\n"):
+                break
+
+            day = reader.day(line.decode("utf-8", errors="replace").rstrip("\r\n"))
+
+            if day is not None:
+                index.days.append([day.isoformat(), index.size])
+
+            index.size += len(line)
+
+    save_index(filename, index)
+    return index
+
+
+def day_offset(index, day):
+    """The offset of the last day that starts on or before the given day, or 0 if there is none"""
+    days = [date.fromisoformat(d) for (d, _) in index.days]
+    i = bisect.bisect_right(days, day)
+    return 0 if i == 0 else index.days[i - 1][1]
@@ -0,0 +1,161 @@
+"""Follow continuously growing logs and import new quotes as they are appended"""
+import os
+import os.path
+import time
+
+from . import allocated, hash_quotes, make_reader, make_writer
+from .checkpoint import (
+    Checkpoint,
+    resume_checkpoint,
+    save_checkpoint,
+    verify_checkpoint,
+    write_batch,
+)
+
+
+class FollowSource:
+    """
+    Iterate over the lines of a file that is still being written to, like tail -F.
+    At the end of the file, on_idle is called before waiting for more data. A file that is
+    replaced (rotated) or truncated is reopened from the beginning.
+    """
+
+    def __init__(self, filename, poll_interval=1.0, offset=0, on_idle=None):
+        self.filename = filename
+        self.poll_interval = poll_interval
+        self.offset = offset
+        self.on_idle = on_idle
+
+    def __iter__(self):
+        stream = self.open()
+        partial = b""
+
+        try:
+            while True:
+                line = stream.readline() if stream is not None else b""
+
+                if line.endswith(b"\n"):
+                    line = partial + line
+                    partial = b""
+                    self.offset += len(line)
+                    yield line.decode("utf-8", errors="replace")
+                    continue
+
+                # wait for the rest of an unfinished line
+                partial += line
+
+                if self.on_idle is not None:
+                    self.on_idle()
+
+                if self.rotated(stream):
+                    if stream is not None:
+                        stream.close()
+
+                    self.offset = 0
+                    partial = b""
+                    stream = self.open()
+                    continue
+
+                time.sleep(self.poll_interval)
+        finally:
+            if stream is not None:
+                stream.close()
+
+    def open(self):
+        """Open the file at the current offset, or None if it doesn't exist right now"""
+        try:
+            stream = open(self.filename, "rb")
+        except FileNotFoundError:
+            return None
+
+        stream.seek(self.offset)
+        return stream
+
+    def rotated(self, stream):
+        """Whether the file was replaced or truncated since it was opened"""
+        try:
+            stat = os.stat(self.filename)
+        except FileNotFoundError:
+            return False  # rotated away, but the new file hasn't been created yet
+
+        if stream is None:
+            return True
+
+        return stat.st_ino != os.fstat(stream.fileno()).st_ino or stat.st_size < self.offset
+
+
+def follow(args, stats=None):
+    """
+    Import a log and keep importing lines appended to it until interrupted.
+    Quotes are written in small batches through one writer connection, whenever flush_size quotes
+    are pending, flush_interval seconds have passed, or the end of the file has been reached.
+    """
+    if args.type not in ["irssi", "hexchat", "nda"]:
+        raise Exception("Following is not supported for %s logs" % args.type)
+
+    if args.since is not None or args.until is not None:
+        raise Exception("--since and --until are not supported when following")
+
+    reader = make_reader(args)
+    writer = make_writer(args)
+    writer.initialize()
+    checkpoint = resume_checkpoint(args, writer) if args.resume else None
+    max_existing_sequence_id = writer.max_sequence_id(args.channel)
+
+    if checkpoint is not None:
+        verify_checkpoint(checkpoint, args, writer, max_existing_sequence_id)
+
+    print(
+        "Following %s from sequence id %i for %s"
+        % (args.filename, max_existing_sequence_id + 1, args.channel)
+    )
+
+    offset = checkpoint.offset if checkpoint is not None else 0
+    source = FollowSource(args.filename, args.flush_interval, offset)
+    pending = []
+    last_flush = time.monotonic()
+
+    def flush():
+        nonlocal last_flush
+        last_flush = time.monotonic()
+
+        if len(pending) == 0:
+            return
+
+        with allocated(writer, args.channel, pending):
+            checkpoint = Checkpoint(
+                os.path.abspath(args.filename),
+                args.channel,
+                source.offset,
+                pending[-1].sequence_id,
+                reader.state(),
+            )
+            write_batch(writer, pending, checkpoint)
+
+        if args.checkpoint is not None:
+            save_checkpoint(args.checkpoint, checkpoint)
+
+        pending.clear()
+
+    source.on_idle = flush
+    skip = args.skip_lines if checkpoint is None else 0
+    state = checkpoint.state if checkpoint is not None else None
+
+    quotes = hash_quotes(reader.read(source, skip, state))
+
+    if stats is not None:
+        quotes = stats.collect(quotes)
+
+    try:
+        for quote in quotes:
+            pending.append(quote)
+
+            if (
+                len(pending) >= args.flush_size
+                or time.monotonic() - last_flush >= args.flush_interval
+            ):
+                flush()
+    except KeyboardInterrupt:
+        flush()
+    finally:
+        writer.close()
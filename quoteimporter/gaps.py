@@ -0,0 +1,115 @@
+"""
+Insert older logs between the quotes already in a channel. With a sequence gap, appended quotes are
+spaced out with free sequence ids between them, and quotes placed between them by timestamp use those
+up. Only when a gap is used up are the quotes after it moved up, as far as the next gap that has room.
+"""
+import bisect
+from datetime import timezone
+
+from . import allocated, batches
+
+
+def backfill(writer, channel, quotes, commit_every=10000, commit_bytes=None):
+    """
+    Inserts the quotes into the channel in order of their timestamps, between the quotes already in it,
+    skipping those that were already imported. Quotes newer than all of them are appended as usual.
+    """
+    quotes = new_quotes(writer, channel, quotes)
+
+    if len(quotes) == 0:
+        print("All quotes are already present in %s" % channel)
+        return
+
+    gap = getattr(writer, "sequence_gap", 1)
+    since = min(quote.timestamp for quote in quotes)
+    until = max(quote.timestamp for quote in quotes)
+    timeline = writer.timeline(channel, since, until)
+    sequence_ids = [sequence_id for (sequence_id, _) in timeline]
+    timestamps = [utc(timestamp) for (_, timestamp) in timeline]
+    slots = {}
+
+    # each quote goes after the existing quotes with the same timestamp
+    for quote in quotes:
+        slot = bisect.bisect_right(timestamps, utc(quote.timestamp))
+        slots.setdefault(slot, []).append(quote)
+
+    newer = slots.pop(len(sequence_ids), [])
+    older = []
+
+    for slot in sorted(slots):
+        group = slots[slot]
+        lower = sequence_ids[slot - 1] if slot > 0 else 0
+        upper = sequence_ids[slot]
+
+        if upper - lower - 1 < len(group):
+            amount = (len(group) + 1) * gap - (upper - lower)
+            last = make_room(writer, channel, upper, amount)
+
+            for i in range(slot, len(sequence_ids)):
+                if sequence_ids[i] <= last:
+                    sequence_ids[i] += amount
+
+            upper = sequence_ids[slot]
+
+        spread(group, lower, upper)
+        older += group
+
+    if len(older) > 0:
+        print("Inserting %i quotes between the quotes of %s" % (len(older), channel))
+
+        for batch in batches(iter(older), commit_every, commit_bytes):
+            writer.insert_all(batch)
+
+    if len(newer) > 0:
+        with allocated(writer, channel, newer):
+            print("Starting at sequence id %i for %s" % (newer[0].sequence_id, channel))
+
+            for batch in batches(iter(newer), commit_every, commit_bytes):
+                writer.insert_all(batch)
+
+
+def new_quotes(writer, channel, quotes, chunk_size=1000):
+    """Leaves out the quotes that are already present in the channel, looking them up in chunks"""
+    present = set()
+
+    for i in range(0, len(quotes), chunk_size):
+        hashes = [quote.content_hash for quote in quotes[i : i + chunk_size]]
+        present |= writer.existing_hashes(channel, hashes)
+
+    return [quote for quote in quotes if quote.content_hash not in present]
+
+
+def spread(quotes, lower, upper):
+    """Gives the quotes sequence ids between lower and upper, spread evenly over the gap between them"""
+    for (i, quote) in enumerate(quotes):
+        quote.sequence_id = lower + (i + 1) * (upper - lower) // (len(quotes) + 1)
+
+
+def make_room(writer, channel, first, amount):
+    """
+    Moves the quotes of the channel from sequence id first up by amount, up to the first gap after them
+    with room for it, so only the quotes between the used up gap and that one are renumbered.
+    Returns the last sequence id that was moved.
+    """
+    last = None
+
+    for sequence_id in writer.sequence_ids_from(channel, first):
+        if last is not None and sequence_id - last > amount:
+            break
+
+        last = sequence_id
+
+    writer.renumber(channel, first, last, amount)
+    print(
+        "Renumbered sequence ids %i to %i of %s by %i to make room"
+        % (first, last, channel, amount)
+    )
+    return last
+
+
+def utc(timestamp):
+    """Compare timestamps as naive UTC times, as some databases return them without a time zone"""
+    if timestamp.tzinfo is None:
+        return timestamp
+
+    return timestamp.astimezone(timezone.utc).replace(tzinfo=None)
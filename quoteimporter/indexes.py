@@ -0,0 +1,56 @@
+"""Build the indexes of the quotes table once after a bulk load, instead of updating them for every row"""
+import contextlib
+import sys
+
+# number of conflicting sequence ids listed in a conflict report
+max_listed = 20
+
+
+@contextlib.contextmanager
+def deferred_indexes(writer):
+    """
+    Drop the indexes of the writer while loading and build them again afterwards, also when the load
+    fails or is interrupted. The quotes of a failed batch are rolled back first, so building the indexes
+    doesn't commit part of them. Writers that can't drop their indexes keep them.
+    """
+    if not hasattr(writer, "drop_indexes"):
+        yield
+        return
+
+    writer.drop_indexes()
+    print("Dropped indexes for the bulk load")
+
+    try:
+        yield
+    except BaseException:
+        if hasattr(writer, "rollback"):
+            writer.rollback()
+        raise
+    finally:
+        print("Building indexes")
+        conflicts = writer.create_indexes()
+
+    check_conflicts(conflicts)
+
+
+def print_conflicts(conflicts, file=sys.stdout):
+    """Prints the sequence ids that are used by more than one quote of a channel"""
+    for (channel, sequence_id, count) in conflicts[:max_listed]:
+        print(
+            "Sequence id %i of %s is used by %i quotes" % (sequence_id, channel, count),
+            file=file,
+        )
+
+    if len(conflicts) > max_listed:
+        print("... and %i more" % (len(conflicts) - max_listed), file=file)
+
+
+def check_conflicts(conflicts):
+    """Report the sequence ids that kept the unique index from being built, and fail if there are any"""
+    if len(conflicts) > 0:
+        print_conflicts(conflicts, sys.stderr)
+        raise Exception(
+            "The unique index on channel and sequence id can't be built, as %i sequence ids are used "
+            "more than once. Remove the duplicate quotes and run the import again to build it."
+            % len(conflicts)
+        )
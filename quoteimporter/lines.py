@@ -0,0 +1,74 @@
+"""Read lines from binary log files"""
+from . import rejects
+
+
+class LineSource:
+    """
+    Iterate over the lines of a binary stream, decoded like a text stream opened with errors="replace".
+    Keeps track of the byte offset just past the last line yielded, so a reader can later seek back to it.
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.offset = stream.tell()
+
+    def __iter__(self):
+        for line in self.stream:
+            self.offset += len(line)
+            yield line.decode("utf-8", errors="replace")
+
+
+def reader_rules(reader):
+    """The rules of a reader as (pattern, handler) pairs, with the lists of patterns in them expanded"""
+    rules = []
+
+    for (name, handler) in reader.rules:
+        patterns = getattr(reader, name)
+        handle = None if handler is None else getattr(reader, handler)
+
+        for pattern in patterns if isinstance(patterns, list) else [patterns]:
+            rules.append((pattern, handle))
+
+    return rules
+
+
+def handle_line(rules, line, sequence_id):
+    """
+    The quote read from a line by the first rule that matches it, or None if its handler makes no quote.
+    Lines that match no rule are reported as unknown.
+    """
+    if len(line) > rejects.max_line_length:
+        rejects.unknown(line)
+        return None
+
+    for (pattern, handle) in rules:
+        match = pattern.match(line)
+
+        if match is not None:
+            return None if handle is None else handle(match, sequence_id)
+
+    rejects.unknown(line)
+    return None
+
+
+def read_lines(reader, lines, skip=0):
+    """
+    Read quotes from lines with the rules of a reader: its patterns in the order they are tried,
+    each with the name of the method that makes a quote from a match, or None to ignore the line.
+    """
+    rules = reader_rules(reader)
+    sequence_id = 1
+    skipped = 0
+
+    for line in lines:
+        line = line.rstrip("\r\n")
+
+        if skipped < skip:
+            skipped += 1
+            continue
+
+        quote = handle_line(rules, line, sequence_id)
+
+        if quote is not None:
+            yield quote
+            sequence_id += 1
@@ -0,0 +1,216 @@
+"""Measure import throughput and the time spent in each stage of the pipeline"""
+import contextlib
+import json
+import os
+import sys
+import threading
+import time
+
+# the metrics of the running import, or None when instrumentation is disabled
+active = None
+
+_disabled = contextlib.nullcontext()
+
+stages = ["read", "parse", "attachment", "serialize", "write", "commit"]
+
+
+class Metrics:
+    """
+    Counts lines, quotes and bytes and accumulates wall and CPU time per stage.
+    Stages nest, and time is only charged to the innermost stage, so e.g. the time
+    spent loading attachments while parsing is not counted as parsing.
+    """
+
+    def __init__(self, total_bytes=None, interval=10.0, metrics_file=None, progress=True):
+        self.total_bytes = total_bytes
+        self.interval = interval
+        self.metrics_file = metrics_file
+        self.progress = progress
+        self.position = None  # function returning the number of bytes read so far
+        self.lines = 0
+        self.quotes = 0
+        self.wall = {stage: 0.0 for stage in stages}
+        self.cpu = {stage: 0.0 for stage in stages}
+        self.threads = threading.local()
+        self.lock = threading.Lock()
+        self.started = time.perf_counter()
+        self.started_cpu = time.process_time()
+        self.last_report = self.started
+
+    @property
+    def stack(self):
+        """The stages entered on the current thread, as writer pools time their stages on their own"""
+        if not hasattr(self.threads, "stack"):
+            self.threads.stack = []
+
+        return self.threads.stack
+
+    def enter(self, stage):
+        now = (time.perf_counter(), time.process_time())
+
+        if len(self.stack) > 0:
+            self.charge(self.stack[-1], now)
+
+        self.stack.append([stage, now])
+
+    def exit(self):
+        now = (time.perf_counter(), time.process_time())
+        self.charge(self.stack.pop(), now)
+
+        if len(self.stack) > 0:
+            self.stack[-1][1] = now
+
+    def charge(self, entry, now):
+        (stage, (wall, cpu)) = entry
+
+        with self.lock:
+            self.wall[stage] = self.wall.get(stage, 0.0) + now[0] - wall
+            self.cpu[stage] = self.cpu.get(stage, 0.0) + now[1] - cpu
+
+    @contextlib.contextmanager
+    def stage(self, stage):
+        self.enter(stage)
+        try:
+            yield
+        finally:
+            self.exit()
+
+    def timed(self, iterable, stage):
+        """Charge the time spent producing each item of the iterable to the stage"""
+        iterator = iter(iterable)
+
+        while True:
+            self.enter(stage)
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                self.exit()
+
+            yield item
+
+    def track_lines(self, lines):
+        """Count lines as they are read"""
+        for line in self.timed(lines, "read"):
+            self.lines += 1
+            yield line
+
+    @property
+    def bytes(self):
+        return self.position() if self.position is not None else 0
+
+    def track_quotes(self, quotes):
+        """Count quotes as they are parsed and report progress periodically"""
+        for quote in self.timed(quotes, "parse"):
+            self.quotes += 1
+
+            if self.quotes % 1000 == 0:
+                now = time.perf_counter()
+                if now - self.last_report >= self.interval:
+                    self.last_report = now
+                    self.report()
+
+            yield quote
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def eta(self):
+        """Seconds left, estimated from the position in the input file"""
+        if not self.total_bytes or self.bytes == 0:
+            return None
+
+        rate = self.bytes / self.elapsed()
+        return max(self.total_bytes - self.bytes, 0) / rate
+
+    def progress_line(self):
+        elapsed = max(self.elapsed(), 1e-9)
+        line = "%i lines (%i/s), %i quotes (%i/s), %.1f MB (%.1f MB/s)" % (
+            self.lines,
+            self.lines / elapsed,
+            self.quotes,
+            self.quotes / elapsed,
+            self.bytes / 1e6,
+            self.bytes / 1e6 / elapsed,
+        )
+        eta = self.eta()
+
+        if eta is not None:
+            line += ", %i%%, ETA %is" % (100 * self.bytes / self.total_bytes, eta)
+
+        return line
+
+    def report(self):
+        """Print a progress line and update the metrics file"""
+        if self.progress:
+            print(self.progress_line(), file=sys.stderr)
+
+        if self.metrics_file is not None:
+            write_metrics(self, self.metrics_file)
+
+    def to_json(self):
+        return {
+            "lines": self.lines,
+            "quotes": self.quotes,
+            "bytes": self.bytes,
+            "total_bytes": self.total_bytes,
+            "elapsed_seconds": self.elapsed(),
+            "cpu_seconds": time.process_time() - self.started_cpu,
+            "eta_seconds": self.eta(),
+            "stage_wall_seconds": dict(self.wall),
+            "stage_cpu_seconds": dict(self.cpu),
+        }
+
+    def to_prometheus(self):
+        data = self.to_json()
+        lines = []
+
+        for name in ["lines", "quotes", "bytes"]:
+            lines.append("# TYPE quoteimporter_%s_total counter" % name)
+            lines.append("quoteimporter_%s_total %i" % (name, data[name]))
+
+        for name in ["elapsed_seconds", "cpu_seconds"]:
+            lines.append("# TYPE quoteimporter_%s gauge" % name)
+            lines.append("quoteimporter_%s %f" % (name, data[name]))
+
+        for (name, times) in [("wall", self.wall), ("cpu", self.cpu)]:
+            lines.append("# TYPE quoteimporter_stage_%s_seconds counter" % name)
+            for (stage, seconds) in times.items():
+                lines.append(
+                    'quoteimporter_stage_%s_seconds{stage="%s"} %f' % (name, stage, seconds)
+                )
+
+        return "\n".join(lines) + "\n"
+
+
+def write_metrics(metrics, filename):
+    """Atomically write the metrics as Prometheus text format if the file ends in .prom, otherwise as JSON"""
+    temp_filename = filename + ".tmp"
+
+    with open(temp_filename, "w") as file:
+        if filename.endswith(".prom"):
+            file.write(metrics.to_prometheus())
+        else:
+            json.dump(metrics.to_json(), file, indent=2)
+
+    os.replace(temp_filename, filename)
+
+
+def stage(name):
+    """Time a stage of the running import, or do nothing if instrumentation is disabled"""
+    if active is None:
+        return _disabled
+
+    return active.stage(name)
+
+
+def print_stages(metrics):
+    """Prints the time spent in each stage"""
+    print(metrics.progress_line())
+
+    for name in metrics.wall:
+        print(
+            "Spent %.2fs (%.2fs CPU) in %s"
+            % (metrics.wall[name], metrics.cpu[name], name)
+        )
@@ -1,6 +1,7 @@
 """Quote models"""
 
 
+import hashlib
 from datetime import datetime
 
 
@@ -50,3 +51,21 @@ class Quote:
         self.source = source
         self.raw = raw
         self.attachment = attachment
+        self.content_hash = None
+
+
+def content_hash(quote: Quote, occurrence: int = 0) -> str:
+    """
+    Hash the content of a quote so it can be recognized when the same log is imported again.
+    Identical lines at the same timestamp are told apart by the number of times they occurred before.
+    """
+    content = "\0".join(
+        [
+            quote.channel,
+            quote.timestamp.strftime("%Y-%m-%d %H:%M:%S"),
+            quote.author,
+            quote.raw,
+            str(occurrence),
+        ]
+    )
+    return hashlib.sha1(content.encode("utf-8")).hexdigest()
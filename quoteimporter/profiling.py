@@ -0,0 +1,152 @@
+"""Count how often each pattern of a reader is tried and how often it matches"""
+import re
+import time
+
+# the profiler of the running import, or None when profiling is disabled
+active = None
+
+
+class PatternProfile:
+    """Attempts, hits and time spent for a single pattern or handler"""
+
+    def __init__(self, name):
+        self.name = name
+        self.attempts = 0
+        self.hits = 0
+        self.seconds = 0.0
+
+
+class ProfiledPattern:
+    """Wraps a compiled pattern and records every match attempt"""
+
+    def __init__(self, pattern, profile, profiler):
+        self.pattern = pattern
+        self.profile = profile
+        self.profiler = profiler
+
+    def match(self, string, *args):
+        start = time.perf_counter()
+        match = self.pattern.match(string, *args)
+        self.profile.seconds += time.perf_counter() - start
+        self.profiler.record(self.profile, string, match is not None)
+        return match
+
+    def __getattr__(self, name):
+        return getattr(self.pattern, name)
+
+
+class Profiler:
+    """
+    Instruments the patterns of a reader and collects their statistics.
+    Readers are only instrumented when profiling is enabled, so disabled profiling costs nothing.
+    """
+
+    def __init__(self):
+        self.profiles = []
+        self.current = None  # the line or message currently being matched
+        self.matched = False
+        self.failed = 0
+        self.lines = 0
+        self.matched_lines = 0
+        self.failed_before_match = 0
+
+    def instrument(self, reader):
+        """Replace the patterns of a reader, or of its handlers, with profiled ones"""
+        if hasattr(reader, "handlers"):
+            for handler in reader.handlers:
+                name = type(handler).__name__
+
+                if isinstance(getattr(handler, "pattern", None), re.Pattern):
+                    handler.pattern = self.wrap(handler.pattern, name)
+                else:
+                    handler.can_handle = self.wrap_function(handler.can_handle, name)
+            return
+
+        for name in dir(type(reader)):
+            value = getattr(reader, name)
+            qualified_name = "%s.%s" % (type(reader).__name__, name)
+
+            if isinstance(value, re.Pattern):
+                setattr(reader, name, self.wrap(value, qualified_name))
+            elif isinstance(value, list) and all(isinstance(v, re.Pattern) for v in value):
+                setattr(
+                    reader,
+                    name,
+                    [
+                        self.wrap(pattern, "%s[%i]" % (qualified_name, i))
+                        for (i, pattern) in enumerate(value)
+                    ],
+                )
+
+    def wrap(self, pattern, name):
+        profile = PatternProfile(name)
+        self.profiles.append(profile)
+        return ProfiledPattern(pattern, profile, self)
+
+    def wrap_function(self, function, name):
+        """Profile a predicate like the can_handle method of Telegram handlers"""
+        profile = PatternProfile(name)
+        self.profiles.append(profile)
+
+        def profiled(item):
+            start = time.perf_counter()
+            result = function(item)
+            profile.seconds += time.perf_counter() - start
+            self.record(profile, item, result)
+            return result
+
+        return profiled
+
+    def record(self, profile, item, hit):
+        if item is not self.current:
+            self.current = item
+            self.matched = False
+            self.failed = 0
+            self.lines += 1
+
+        profile.attempts += 1
+
+        if hit:
+            profile.hits += 1
+
+        # only count the failures before the first hit of each line
+        if self.matched:
+            return
+
+        if hit:
+            self.matched = True
+            self.matched_lines += 1
+            self.failed_before_match += self.failed
+        else:
+            self.failed += 1
+
+
+def print_profile(profiler):
+    """Prints a table of pattern statistics, most expensive first"""
+    print("%-60s %10s %10s %7s %9s" % ("pattern", "attempts", "hits", "hit%", "seconds"))
+
+    for profile in sorted(profiler.profiles, key=lambda p: p.seconds, reverse=True):
+        print(
+            "%-60s %10i %10i %6.1f%% %9.3f"
+            % (
+                profile.name,
+                profile.attempts,
+                profile.hits,
+                100 * profile.hits / profile.attempts if profile.attempts else 0,
+                profile.seconds,
+            )
+        )
+
+    if profiler.matched_lines > 0:
+        print(
+            "%i lines, %i matched after %.2f failed attempts on average"
+            % (
+                profiler.lines,
+                profiler.matched_lines,
+                profiler.failed_before_match / profiler.matched_lines,
+            )
+        )
+
+    unused = [p.name for p in profiler.profiles if p.attempts > 0 and p.hits == 0]
+    if len(unused) > 0:
+        print("Never matched: %s" % ", ".join(unused))
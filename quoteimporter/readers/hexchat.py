@@ -1,12 +1,15 @@
 """Read HexChat logs"""
 import re
 from datetime import datetime, timezone, timedelta
+from quoteimporter.lines import read_lines
 from quoteimporter.models import Quote, QuoteType
 
 
 class HexChatLogReader:
     """Read a HexChat log file"""
 
+    blank_re = re.compile(r"^$")
+
     """Regular message"""
     message_re = re.compile(r"^(\w{3} \d{2} \d{2}:\d{2}:\d{2}) <(.+)>\t(.*)$")
 
@@ -20,19 +23,19 @@ class HexChatLogReader:
         r"^\*\*\*\* ENDING LOGGING AT .{3} (\w{3} (\d| )?\d \d{2}:\d{2}:\d{2} \d{4})$"
     )
     join_re = re.compile(
-        r"^(\w{3} \d{2} \d{2}:\d{2}:\d{2}) \*\t(.+) \(.+\) has joined .+$"
+        r"^(\w{3} \d{2} \d{2}:\d{2}:\d{2}) \*\t(\S+) \(\S+\) has joined .+$"
     )
     leave_re = re.compile(
-        r"^(\w{3} \d{2} \d{2}:\d{2}:\d{2}) \*\t(.+) \(.+\) has left \S+(?: \(\"?(.*?)\"?\))?$"
+        r"^(\w{3} \d{2} \d{2}:\d{2}:\d{2}) \*\t(\S+) \(\S+\) has left \S+(?: \(\"?(.*?)\"?\))?$"
     )
     quit_re = re.compile(
-        r"^(\w{3} \d{2} \d{2}:\d{2}:\d{2}) \*\t(.+) has quit \((.*)\)$"
+        r"^(\w{3} \d{2} \d{2}:\d{2}:\d{2}) \*\t(\S+) has quit \((.*)\)$"
     )
     kick_re = re.compile(
-        r"^(\w{3} \d{2} \d{2}:\d{2}:\d{2}) \*\t(.+) has kicked (.+) from .+ \(.*\)$"
+        r"^(\w{3} \d{2} \d{2}:\d{2}:\d{2}) \*\t(\S+) has kicked (\S+) from \S+ \(.*\)$"
     )
     ban_re = re.compile(
-        r"^(\w{3} \d{2} \d{2}:\d{2}:\d{2}) \*\t(.+) sets ban on (\S+)!.+$"
+        r"^(\w{3} \d{2} \d{2}:\d{2}:\d{2}) \*\t(\S+) sets ban on (\S+)!.+$"
     )
     me_re = re.compile(r"^(\w{3} \d{2} \d{2}:\d{2}:\d{2}) \*\t(.+?) (.*)$")
 
@@ -87,6 +90,27 @@ class HexChatLogReader:
         re.compile(r"^(\w{3} \d{2} \d{2}:\d{2}:\d{2}) Update Checker\t.+$"),
     ]
 
+    """Patterns in the order they are tried, and the method that reads a line matching each"""
+    rules = [
+        ("blank_re", None),
+        ("message_re", "message"),
+        ("topic_re", "subject"),
+        ("join_re", "join"),
+        ("leave_re", "leave"),
+        ("quit_re", "leave"),
+        ("kick_re", "kick"),
+        ("ban_re", "ban"),
+        ("nick_re", "nick"),
+        ("you_nick_re", "you_nick"),
+        ("chanserv_re", "system"),
+        ("system_res", "unspecific_system"),
+        # before /me because they use the same syntax
+        ("ignored_res", None),
+        ("me_re", "message"),
+        ("log_open_re", "date_change"),
+        ("log_close_re", "date_change"),
+    ]
+
     def __init__(self, channel, utc_offset, you, source="hexchat"):
         self.channel = channel
         self.tzinfo = timezone(timedelta(hours=utc_offset))
@@ -94,194 +118,84 @@ class HexChatLogReader:
         self.source = source
         self.current_date = datetime.fromtimestamp(0, tz=self.tzinfo)
 
-    def read(self, iterable, skip=0):
-        """Transform lines from iterable into quotes"""
+    def read(self, iterable, skip=0, state=None):
+        """Transform lines from iterable into quotes, optionally continuing from a saved reader state"""
         self.current_date = datetime.fromtimestamp(0, tz=self.tzinfo)
-        sequence_id = 1
-        skipped = 0
-
-        for line in iterable:
-            line = line.rstrip("\r\n")
-
-            if skipped < skip:
-                skipped += 1
-                continue
-
-            if not any(line):
-                continue
-
-            match = self.message_re.match(line)
-            if match is not None:
-                yield self.make_quote(
-                    match.group(1),
-                    match.group(2),
-                    match.group(3),
-                    sequence_id,
-                    QuoteType.message,
-                    line,
-                )
-                sequence_id += 1
-                continue
-
-            match = self.topic_re.match(line)
-            if match is not None:
-                yield self.make_quote(
-                    match.group(1),
-                    match.group(2),
-                    match.group(3),
-                    sequence_id,
-                    QuoteType.subject,
-                    line,
-                )
-                sequence_id += 1
-                continue
-
-            match = self.join_re.match(line)
-            if match is not None:
-                yield self.make_quote(
-                    match.group(1),
-                    match.group(2),
-                    "",
-                    sequence_id,
-                    QuoteType.join,
-                    line,
-                )
-                sequence_id += 1
-                continue
-
-            match = self.leave_re.match(line)
-            if match is not None:
-                yield self.make_quote(
-                    match.group(1),
-                    match.group(2),
-                    match.group(3),
-                    sequence_id,
-                    QuoteType.leave,
-                    line,
-                )
-                sequence_id += 1
-                continue
-
-            match = self.quit_re.match(line)
-            if match is not None:
-                yield self.make_quote(
-                    match.group(1),
-                    match.group(2),
-                    match.group(3),
-                    sequence_id,
-                    QuoteType.leave,
-                    line,
-                )
-                sequence_id += 1
-                continue
-
-            match = self.kick_re.match(line)
-            if match is not None:
-                yield self.make_quote(
-                    match.group(1),
-                    match.group(3),
-                    match.group(2),
-                    sequence_id,
-                    QuoteType.kick,
-                    line,
-                )
-                sequence_id += 1
-                continue
-
-            match = self.ban_re.match(line)
-            if match is not None:
-                yield self.make_quote(
-                    match.group(1),
-                    match.group(3),
-                    match.group(2),
-                    sequence_id,
-                    QuoteType.ban,
-                    line,
-                )
-                sequence_id += 1
-                continue
-
-            match = self.nick_re.match(line)
-            if match is not None:
-                yield self.make_quote(
-                    match.group(1),
-                    match.group(2),
-                    match.group(3),
-                    sequence_id,
-                    QuoteType.nick,
-                    line,
-                )
-                sequence_id += 1
-                continue
-
-            match = self.you_nick_re.match(line)
-            if match is not None:
-                yield self.make_quote(
-                    match.group(1),
-                    self.you,
-                    match.group(3),
-                    sequence_id,
-                    QuoteType.nick,
-                    line,
-                )
-                sequence_id += 1
-                continue
-
-            match = self.chanserv_re.match(line)
-            if match is not None:
-                yield self.make_quote(
-                    match.group(1),
-                    match.group(2),
-                    match.group(3),
-                    sequence_id,
-                    QuoteType.system,
-                    line,
-                )
-                sequence_id += 1
-                continue
-
-            system_matches = (sre.match(line) for sre in self.system_res)
-            match = next((m for m in system_matches if m), None)
-            if match is not None:
-                yield self.make_quote(
-                    match.group(1),
-                    "",
-                    match.group(2),
-                    sequence_id,
-                    QuoteType.system,
-                    line,
-                )
-                sequence_id += 1
-                continue
-
-            # handle before /me because they use the same syntax
-            if any(ire.match(line) for ire in self.ignored_res):
-                continue
-
-            match = self.me_re.match(line)
-            if match is not None:
-                yield self.make_quote(
-                    match.group(1),
-                    match.group(2),
-                    match.group(3),
-                    sequence_id,
-                    QuoteType.message,
-                    line,
-                )
-                sequence_id += 1
-                continue
-
-            match = self.log_open_re.match(line)
-            if match is not None:
-                self.current_date = self.parse_timestamp(match.group(1))
-                continue
-
-            match = self.log_close_re.match(line)
-            if match is not None:
-                self.current_date = self.parse_timestamp(match.group(1))
-                continue
-
-            print("Unknown %s" % line)
+
+        if state is not None:
+            self.restore(state)
+
+        yield from read_lines(self, iterable, skip)
+
+    def message(self, match, sequence_id):
+        return self.quote(
+            match, match.group(2), match.group(3), sequence_id, QuoteType.message
+        )
+
+    def subject(self, match, sequence_id):
+        return self.quote(
+            match, match.group(2), match.group(3), sequence_id, QuoteType.subject
+        )
+
+    def join(self, match, sequence_id):
+        return self.quote(match, match.group(2), "", sequence_id, QuoteType.join)
+
+    def leave(self, match, sequence_id):
+        return self.quote(
+            match, match.group(2), match.group(3), sequence_id, QuoteType.leave
+        )
+
+    def kick(self, match, sequence_id):
+        return self.quote(
+            match, match.group(3), match.group(2), sequence_id, QuoteType.kick
+        )
+
+    def ban(self, match, sequence_id):
+        return self.quote(
+            match, match.group(3), match.group(2), sequence_id, QuoteType.ban
+        )
+
+    def nick(self, match, sequence_id):
+        return self.quote(
+            match, match.group(2), match.group(3), sequence_id, QuoteType.nick
+        )
+
+    def you_nick(self, match, sequence_id):
+        return self.quote(match, self.you, match.group(3), sequence_id, QuoteType.nick)
+
+    def system(self, match, sequence_id):
+        return self.quote(
+            match, match.group(2), match.group(3), sequence_id, QuoteType.system
+        )
+
+    def unspecific_system(self, match, sequence_id):
+        return self.quote(match, "", match.group(2), sequence_id, QuoteType.system)
+
+    def date_change(self, match, sequence_id):
+        self.current_date = self.parse_timestamp(match.group(1))
+
+    def quote(self, match, author, message, sequence_id, quote_type):
+        """Make a quote from a line with the timestamp in the first group"""
+        return self.make_quote(
+            match.group(1), author, message, sequence_id, quote_type, match.string
+        )
+
+    def state(self):
+        """The reader state needed to continue reading from the current line"""
+        return {"current_date": self.current_date.isoformat()}
+
+    def restore(self, state):
+        """Restore a reader state saved by state()"""
+        self.current_date = datetime.fromisoformat(state["current_date"])
+
+    def day(self, line):
+        """The local date a log opens at, or None for other lines, for the day index"""
+        match = self.log_open_re.match(line)
+
+        if match is None:
+            return None
+
+        return self.parse_timestamp(match.group(1)).astimezone(self.tzinfo).date()
 
     def make_quote(self, datetime_str, author, message, sequence_id, quote_type, raw):
         """Make a quote from a line"""
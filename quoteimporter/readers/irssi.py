@@ -1,6 +1,7 @@
 """Read irssi logs"""
 import re
 from datetime import datetime, timezone, timedelta
+from quoteimporter.lines import read_lines
 from quoteimporter.models import Quote, QuoteType
 
 
@@ -11,23 +12,29 @@ class IrssiLogReader:
     message_re = re.compile(r"^(\d{2}:\d{2}) <(.+?)> (.*)$")
 
     """Glitched out line with the message interleaved with itself"""
-    message_glitch_re = re.compile(r"^(\d{2}:\d{2}) \d{2}:\d{2} <(.+?)> (.*)<.+?> .*$")
+    message_glitch_re = re.compile(
+        r"^(\d{2}:\d{2}) \d{2}:\d{2} <([^<>]++)> (.*)<[^<>]++> .*$"
+    )
 
-    topic_re = re.compile(r"^(\d{2}:\d{2}) (.+) changed the topic of .+ to: (.*)$")
+    topic_re = re.compile(r"^(\d{2}:\d{2}) (.+?) changed the topic of \S+ to: (.*)$")
     log_open_re = re.compile(r"^--- Log opened .{3} (\w{3}) (\d{2}) .{8} (\d{4})$")
     log_close_re = re.compile(r"^--- Log closed .{3} (\w{3}) (\d{2}) .{8} (\d{4})$")
     date_re = re.compile(r"^--- Day changed .{3} (\w{3}) (\d{2}) (\d{4})$")
-    join_re = re.compile(r"^(\d{2}:\d{2}) -!- (.+) \[.+\] has joined .+$")
-    leave_re = re.compile(r"^(\d{2}:\d{2}) -!- (.+) \[.+\] has left .+ \[(.*)\]$")
-    quit_re = re.compile(r"^(\d{2}:\d{2}) -!- (.+) \[.+\] has quit \[(.*)\]$")
-    kick_re = re.compile(r"^(\d{2}:\d{2}) -!- (.+) was kicked from .+ by (.+) \[.*\]$")
+    join_re = re.compile(r"^(\d{2}:\d{2}) -!- (\S+) \[\S+\] has joined .+$")
+    leave_re = re.compile(r"^(\d{2}:\d{2}) -!- (\S+) \[\S+\] has left \S+ \[(.*)\]$")
+    quit_re = re.compile(r"^(\d{2}:\d{2}) -!- (\S+) \[\S+\] has quit \[(.*)\]$")
+    kick_re = re.compile(
+        r"^(\d{2}:\d{2}) -!- (\S+) was kicked from \S+ by (\S+) \[.*\]$"
+    )
 
     """Mode +b nick!*@*"""
-    ban_re = re.compile(r"^(\d{2}:\d{2}) -!- mode\/.+ \[.*\+b\S* (\S+)!.+\] by (.+)$")
+    ban_re = re.compile(
+        r"^(\d{2}:\d{2}) -!- mode\/\S+ \[(?=\S*\+b)\S+ (\S+)!.+\] by (.+)$"
+    )
 
     """Mode +b nick *!*@*"""
     ban2_re = re.compile(
-        r"^(\d{2}:\d{2}) -!- mode\/.+ \[.*\+b\S* (\S+) \S+!.+\] by (.+)$"
+        r"^(\d{2}:\d{2}) -!- mode\/\S+ \[(?=\S*\+b)\S+ (\S+) \S+!.+\] by (.+)$"
     )
 
     '''/me command: "* nick message"'''
@@ -37,293 +44,138 @@ class IrssiLogReader:
     you_nick_re = re.compile(r"^(\d{2}:\d{2}) -!- (You)\'re now known as (.+)$")
 
     """Channel invites, which are usually followed by a join"""
-    invite_re = re.compile(r"^(\d{2}:\d{2}) .+ (.+) (invited .+ into the channel)\.$")
+    invite_re = re.compile(
+        r"^(\d{2}:\d{2}) (?=.* into the channel\.$).+ (\S+) (invited .+ into the channel)\.$"
+    )
     invite2_re = re.compile(
-        r"^(\d{2}:\d{2}) .+ \*\*\* (.+) (invited .+ into the channel)$"
+        r"^(\d{2}:\d{2}) (?=.* into the channel$).+ \*\*\* (\S+) (invited .+ into the channel)$"
     )
 
     """ChanServ notices"""
     chanserv_re = re.compile(r"^(\d{2}:\d{2}) -(ChanServ):.+?- (.+)$")
 
     """Some sort of channel notice from a real user. Match after chanserv_re because it's less specific"""
-    chan_message_re = re.compile(r"^(\d{2}:\d{2}) -(.+?):.+?- (.*)$")
+    chan_message_re = re.compile(r"^(\d{2}:\d{2}) -([^\s:]+):\S+?- (.*)$")
 
     """Recognizable, but unspecific system messages with a timestamp and no author"""
     system_re = re.compile(r"^(\d{2}:\d{2}) -!- (.*)$")
 
+    """Patterns in the order they are tried, and the method that reads a line matching each"""
+    rules = [
+        ("message_re", "message"),
+        ("message_glitch_re", "message"),
+        ("topic_re", "subject"),
+        ("join_re", "join"),
+        ("leave_re", "leave"),
+        ("quit_re", "leave"),
+        ("kick_re", "kick"),
+        ("ban_re", "ban"),
+        ("ban2_re", "ban"),
+        ("me_re", "message"),
+        ("nick_re", "nick"),
+        ("you_nick_re", "you_nick"),
+        ("invite_re", "system"),
+        ("invite2_re", "system"),
+        ("chanserv_re", "system"),
+        ("chan_message_re", "message"),
+        ("system_re", "unspecific_system"),
+        ("date_re", "date_change"),
+        ("log_open_re", "date_change"),
+        ("log_close_re", "date_change"),
+    ]
+
     def __init__(self, channel, utc_offset, you, source="irssi"):
         self.channel = channel
         self.tzinfo = timezone(timedelta(hours=utc_offset))
         self.you = you
         self.source = source
+        self.date = datetime.utcfromtimestamp(0)
 
-    def read(self, iterable, skip=0):
-        """Transform lines from iterable into quotes"""
-        sequence_id = 1
-        date = datetime.utcfromtimestamp(0)
-        skipped = 0
+    def read(self, iterable, skip=0, state=None):
+        """Transform lines from iterable into quotes, optionally continuing from a saved reader state"""
+        self.date = datetime.utcfromtimestamp(0)
 
-        for line in iterable:
-            line = line.rstrip("\r\n")
+        if state is not None:
+            self.restore(state)
 
-            if skipped < skip:
-                skipped += 1
-                continue
+        yield from read_lines(self, iterable, skip)
 
-            match = self.message_re.match(line)
-            if match is not None:
-                yield self.make_quote(
-                    date,
-                    match.group(1),
-                    match.group(2),
-                    match.group(3),
-                    sequence_id,
-                    QuoteType.message,
-                    line,
-                )
-                sequence_id += 1
-                continue
-
-            match = self.message_glitch_re.match(line)
-            if match is not None:
-                yield self.make_quote(
-                    date,
-                    match.group(1),
-                    match.group(2),
-                    match.group(3),
-                    sequence_id,
-                    QuoteType.message,
-                    line,
-                )
-                sequence_id += 1
-                continue
-
-            match = self.topic_re.match(line)
-            if match is not None:
-                yield self.make_quote(
-                    date,
-                    match.group(1),
-                    match.group(2),
-                    match.group(3),
-                    sequence_id,
-                    QuoteType.subject,
-                    line,
-                )
-                sequence_id += 1
-                continue
-
-            match = self.join_re.match(line)
-            if match is not None:
-                yield self.make_quote(
-                    date,
-                    match.group(1),
-                    match.group(2),
-                    "",
-                    sequence_id,
-                    QuoteType.join,
-                    line,
-                )
-                sequence_id += 1
-                continue
-
-            match = self.leave_re.match(line)
-            if match is not None:
-                yield self.make_quote(
-                    date,
-                    match.group(1),
-                    match.group(2),
-                    match.group(3),
-                    sequence_id,
-                    QuoteType.leave,
-                    line,
-                )
-                sequence_id += 1
-                continue
-
-            match = self.quit_re.match(line)
-            if match is not None:
-                yield self.make_quote(
-                    date,
-                    match.group(1),
-                    match.group(2),
-                    match.group(3),
-                    sequence_id,
-                    QuoteType.leave,
-                    line,
-                )
-                sequence_id += 1
-                continue
-
-            match = self.kick_re.match(line)
-            if match is not None:
-                yield self.make_quote(
-                    date,
-                    match.group(1),
-                    match.group(3),
-                    match.group(2),
-                    sequence_id,
-                    QuoteType.kick,
-                    line,
-                )
-                sequence_id += 1
-                continue
-
-            match = self.ban_re.match(line)
-            if match is not None:
-                yield self.make_quote(
-                    date,
-                    match.group(1),
-                    match.group(3),
-                    match.group(2),
-                    sequence_id,
-                    QuoteType.ban,
-                    line,
-                )
-                sequence_id += 1
-                continue
-
-            match = self.ban2_re.match(line)
-            if match is not None:
-                yield self.make_quote(
-                    date,
-                    match.group(1),
-                    match.group(3),
-                    match.group(2),
-                    sequence_id,
-                    QuoteType.ban,
-                    line,
-                )
-                sequence_id += 1
-                continue
-
-            match = self.me_re.match(line)
-            if match is not None:
-                yield self.make_quote(
-                    date,
-                    match.group(1),
-                    match.group(2),
-                    match.group(3),
-                    sequence_id,
-                    QuoteType.message,
-                    line,
-                )
-                sequence_id += 1
-                continue
-
-            match = self.nick_re.match(line)
-            if match is not None:
-                yield self.make_quote(
-                    date,
-                    match.group(1),
-                    match.group(2),
-                    match.group(3),
-                    sequence_id,
-                    QuoteType.nick,
-                    line,
-                )
-                sequence_id += 1
-                continue
-
-            match = self.you_nick_re.match(line)
-            if match is not None:
-                yield self.make_quote(
-                    date,
-                    match.group(1),
-                    self.you,
-                    match.group(3),
-                    sequence_id,
-                    QuoteType.nick,
-                    line,
-                )
-                sequence_id += 1
-                continue
-
-            match = self.invite_re.match(line)
-            if match is not None:
-                yield self.make_quote(
-                    date,
-                    match.group(1),
-                    match.group(2),
-                    match.group(3),
-                    sequence_id,
-                    QuoteType.system,
-                    line,
-                )
-                sequence_id += 1
-                continue
-
-            match = self.invite2_re.match(line)
-            if match is not None:
-                yield self.make_quote(
-                    date,
-                    match.group(1),
-                    match.group(2),
-                    match.group(3),
-                    sequence_id,
-                    QuoteType.system,
-                    line,
-                )
-                sequence_id += 1
-                continue
-
-            match = self.chanserv_re.match(line)
-            if match is not None:
-                yield self.make_quote(
-                    date,
-                    match.group(1),
-                    match.group(2),
-                    match.group(3),
-                    sequence_id,
-                    QuoteType.system,
-                    line,
-                )
-                sequence_id += 1
-                continue
-
-            match = self.chan_message_re.match(line)
-            if match is not None:
-                yield self.make_quote(
-                    date,
-                    match.group(1),
-                    match.group(2),
-                    match.group(3),
-                    sequence_id,
-                    QuoteType.message,
-                    line,
-                )
-                sequence_id += 1
-                continue
-
-            match = self.system_re.match(line)
-            if match is not None:
-                yield self.make_quote(
-                    date,
-                    match.group(1),
-                    "",
-                    match.group(2),
-                    sequence_id,
-                    QuoteType.system,
-                    line,
-                )
-                sequence_id += 1
-                continue
-
-            match = self.date_re.match(line)
-            if match is not None:
-                date = parse_date(match)
-                continue
+    def message(self, match, sequence_id):
+        return self.quote(
+            match, match.group(2), match.group(3), sequence_id, QuoteType.message
+        )
 
-            match = self.log_open_re.match(line)
-            if match is not None:
-                date = parse_date(match)
-                continue
+    def subject(self, match, sequence_id):
+        return self.quote(
+            match, match.group(2), match.group(3), sequence_id, QuoteType.subject
+        )
+
+    def join(self, match, sequence_id):
+        return self.quote(match, match.group(2), "", sequence_id, QuoteType.join)
+
+    def leave(self, match, sequence_id):
+        return self.quote(
+            match, match.group(2), match.group(3), sequence_id, QuoteType.leave
+        )
+
+    def kick(self, match, sequence_id):
+        return self.quote(
+            match, match.group(3), match.group(2), sequence_id, QuoteType.kick
+        )
+
+    def ban(self, match, sequence_id):
+        return self.quote(
+            match, match.group(3), match.group(2), sequence_id, QuoteType.ban
+        )
+
+    def nick(self, match, sequence_id):
+        return self.quote(
+            match, match.group(2), match.group(3), sequence_id, QuoteType.nick
+        )
+
+    def you_nick(self, match, sequence_id):
+        return self.quote(match, self.you, match.group(3), sequence_id, QuoteType.nick)
+
+    def system(self, match, sequence_id):
+        return self.quote(
+            match, match.group(2), match.group(3), sequence_id, QuoteType.system
+        )
+
+    def unspecific_system(self, match, sequence_id):
+        return self.quote(match, "", match.group(2), sequence_id, QuoteType.system)
+
+    def date_change(self, match, sequence_id):
+        self.date = parse_date(match)
+
+    def quote(self, match, author, message, sequence_id, quote_type):
+        """Make a quote from a line with the time in the first group"""
+        return self.make_quote(
+            self.date,
+            match.group(1),
+            author,
+            message,
+            sequence_id,
+            quote_type,
+            match.string,
+        )
+
+    def state(self):
+        """The reader state needed to continue reading from the current line"""
+        return {"date": self.date.isoformat()}
+
+    def restore(self, state):
+        """Restore a reader state saved by state()"""
+        self.date = datetime.fromisoformat(state["date"])
+
+    def day(self, line):
+        """The date of a line that starts a day, like --- Day changed, or None, for the day index"""
+        for pattern in [self.date_re, self.log_open_re]:
+            match = pattern.match(line)
 
-            match = self.log_close_re.match(line)
             if match is not None:
-                date = parse_date(match)
-                continue
+                return parse_date(match).date()
 
-            print("Unknown %s" % line)
+        return None
 
     def make_quote(self, date, time_str, author, message, sequence_id, quote_type, raw):
         """Make a quote from a line"""
@@ -348,9 +200,8 @@ class IrssiLogReader:
 
 def parse_date(match):
     """Parse a date for when the date changes. We just use some of its parts, so it can be naive"""
-    groups = match.groups()
-    month_name = groups[0]
-    day = groups[1]
-    year = groups[2]
+    month_name = match.group(1)
+    day = match.group(2)
+    year = match.group(3)
     date_str = "%s %s %s" % (month_name, day, year)
     return datetime.strptime(date_str, "%b %d %Y")
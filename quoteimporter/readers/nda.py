@@ -1,6 +1,7 @@
 """Read NDA logs"""
 import re
 from datetime import datetime, timezone, timedelta
+from quoteimporter.lines import read_lines
 from quoteimporter.models import Quote, QuoteType
 
 
@@ -8,31 +9,31 @@ class NdaLogReader:
     """Read an NDA log file"""
 
     message_re = re.compile(
-        r"^(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2})\.\d{6} :(.+)!.+ PRIVMSG (.+) :(.*)$"
+        r"^(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2})\.\d{6} :([^\s!]+)!\S+ PRIVMSG (\S+) :(.*)$"
     )
     join_re = re.compile(
-        r"^(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2})\.\d{6} :(.+)!.+ JOIN (.+)$"
+        r"^(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2})\.\d{6} :([^\s!]+)!\S+ JOIN (.+)$"
     )
     leave_re = re.compile(
-        r"^(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2})\.\d{6} :(.+)!.+ PART (.+)( :(.*))?$"
+        r"^(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2})\.\d{6} :([^\s!]+)!\S+ PART (\S+)(?: :(.*))?$"
     )
     quit_re = re.compile(
-        r"^(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2})\.\d{6} :(.+)!.+ QUIT :(.*)$"
+        r"^(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2})\.\d{6} :([^\s!]+)!\S+ QUIT :(.*)$"
     )
     kick_re = re.compile(
-        r"^(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2})\.\d{6} :(.+)!.+ KICK (.+) (.+) :.+$"
+        r"^(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2})\.\d{6} :([^\s!]+)!\S+ KICK (\S+) (\S+) :.+$"
     )
     nick_re = re.compile(
-        r"^(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2})\.\d{6} :(.+)!.+ NICK :(.+)$"
+        r"^(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2})\.\d{6} :([^\s!]+)!\S+ NICK :(.+)$"
     )
     topic_re = re.compile(
-        r"^(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2})\.\d{6} :(.+)!.+ TOPIC (.+) :(.+)$"
+        r"^(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2})\.\d{6} :([^\s!]+)!\S+ TOPIC (\S+) :(.+)$"
     )
     ban_re = re.compile(
-        r"^(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2})\.\d{6} :(.+)!.+ MODE (.+) \S*\+b\S* (\S+)!.+$"
+        r"^(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2})\.\d{6} :([^\s!]+)!\S+ MODE (\S+) (?=\S*\+b)\S+ (\S+)!.+$"
     )
     ban2_re = re.compile(
-        r"^(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2})\.\d{6} :(.+)!.+ MODE (.+) \S*\+b\S* (\S+) \S+!.+$"
+        r"^(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2})\.\d{6} :([^\s!]+)!\S+ MODE (\S+) (?=\S*\+b)\S+ (\S+) \S+!.+$"
     )
     nda_message_re = re.compile(
         r"^(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2})\.\d{6} Sending (.*) to (.+)$"
@@ -57,19 +58,45 @@ class NdaLogReader:
         r"^\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}\.\d{6} Traceback.*$",
         r"^\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}\.\d{6} redis message: .*$",
         r"^\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}\.\d{6} PING :.+$",
-        r"^\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}\.\d{6} :.+ PONG .+ :.+$",
+        r"^\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}\.\d{6} :\S+ PONG \S+ :.+$",
         r"^\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}\.\d{6} Sending PING :.+$",
         r"^\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}\.\d{6} Sending PONG :.+$",
         r"^\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}\.\d{6} Sending JOIN .+$",
         r"^\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}\.\d{6} Sending ISON .+$",
-        r"^\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}\.\d{6} :.+ \d{3} .+$",  # server connect info
-        r"^\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}\.\d{6} :.+ 303 .+ :.*$",  # ison reply
-        r"^\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}\.\d{6} :.+ NOTICE .+ :.+$",  # server notice
-        r"^\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}\.\d{6} :.+ MODE .+$",  # non-ban mode
+        r"^\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}\.\d{6} :\S+ \d{3} .+$",  # server connect info
+        r"^\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}\.\d{6} :\S+ 303 \S+ :.*$",  # ison reply
+        r"^\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}\.\d{6} :\S+ NOTICE \S+ :.+$",  # server notice
+        r"^\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}\.\d{6} :\S+ MODE .+$",  # non-ban mode
         r"^\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}\.\d{6} $",  # empty
     ]
     ignored_re = re.compile("(" + ")|(".join(ignored) + ")")
 
+    """Any line, for bisecting the log by time"""
+    timestamp_re = re.compile(r"^(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2})\.\d{6} ")
+
+    """nda's own nick changes in the raw log, to restore its nick when starting in the middle"""
+    nda_nick_bytes_re = re.compile(
+        rb"^\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}\.\d{6} Sending NICK (.+?)\r*$", re.M
+    )
+
+    """Patterns in the order they are tried, and the method that reads a line matching each"""
+    rules = [
+        ("message_re", "message"),
+        ("join_re", "join"),
+        ("leave_re", "leave"),
+        ("quit_re", "quit"),
+        ("kick_re", "kick"),
+        ("nick_re", "nick"),
+        ("topic_re", "subject"),
+        ("ban_re", "ban"),
+        ("ban2_re", "ban"),
+        ("nda_message_re", "nda_message"),
+        ("nda_nick_re", "nda_nick_change"),
+        ("nda_quit_re", "nda_quit"),
+        # known unusable lines, last because some of them are pretty general
+        ("ignored_re", None),
+    ]
+
     def __init__(self, channel, you="nda", source="nda"):
         """
         In this reader, the you parameter is only used as the initial value for nda's own nick,
@@ -78,194 +105,122 @@ class NdaLogReader:
         self.channel = channel
         self.you = you
         self.source = source
+        self.nda_nick = you
 
-    def read(self, iterable, skip=0):
-        """Transform lines from iterable into quotes"""
-        sequence_id = 1
-        nda_nick = self.you
-        skipped = 0
+    def read(self, iterable, skip=0, state=None):
+        """Transform lines from iterable into quotes, optionally continuing from a saved reader state"""
+        self.nda_nick = self.you
 
-        for line in iterable:
-            line = line.rstrip("\r\n")
+        if state is not None:
+            self.restore(state)
 
-            if skipped < skip:
-                skipped += 1
-                continue
+        yield from read_lines(self, iterable, skip)
+
+    def message(self, match, sequence_id):
+        # only match if the message matches the channel we're reading
+        if match.group(3) == self.channel:
+            return self.quote(
+                match, match.group(2), match.group(4), sequence_id, QuoteType.message
+            )
+
+    def join(self, match, sequence_id):
+        if match.group(3) == self.channel:
+            return self.quote(match, match.group(2), "", sequence_id, QuoteType.join)
+
+    def leave(self, match, sequence_id):
+        if match.group(3) == self.channel:
+            return self.quote(
+                match, match.group(2), match.group(4), sequence_id, QuoteType.leave
+            )
+
+    def quit(self, match, sequence_id):
+        return self.quote(
+            match, match.group(2), match.group(3), sequence_id, QuoteType.leave
+        )
+
+    def kick(self, match, sequence_id):
+        if match.group(3) == self.channel:
+            return self.quote(
+                match, match.group(2), match.group(4), sequence_id, QuoteType.kick
+            )
+
+    def nick(self, match, sequence_id):
+        return self.quote(
+            match, match.group(2), match.group(3), sequence_id, QuoteType.nick
+        )
+
+    def subject(self, match, sequence_id):
+        if match.group(3) == self.channel:
+            return self.quote(
+                match, match.group(2), match.group(4), sequence_id, QuoteType.subject
+            )
+
+    def ban(self, match, sequence_id):
+        if match.group(3) == self.channel:
+            return self.quote(
+                match, match.group(2), match.group(4), sequence_id, QuoteType.ban
+            )
+
+    def nda_message(self, match, sequence_id):
+        if match.group(3) == self.channel:
+            return self.quote(
+                match, self.nda_nick, match.group(2), sequence_id, QuoteType.message
+            )
+
+    def nda_nick_change(self, match, sequence_id):
+        # don't treat NICK commands on connect as nick changes
+        if match.group(2) != self.nda_nick:
+            quote = self.quote(
+                match, self.nda_nick, match.group(2), sequence_id, QuoteType.nick
+            )
+            self.nda_nick = match.group(2)
+            return quote
+
+    def nda_quit(self, match, sequence_id):
+        return self.quote(
+            match, self.nda_nick, match.group(2), sequence_id, QuoteType.leave
+        )
+
+    def quote(self, match, author, message, sequence_id, quote_type):
+        """Make a quote from a line with the timestamp in the first group"""
+        return self.make_quote(
+            match.group(1), author, message, sequence_id, quote_type, match.string
+        )
+
+    def state(self):
+        """The reader state needed to continue reading from the current line"""
+        return {"nda_nick": self.nda_nick}
+
+    def restore(self, state):
+        """Restore a reader state saved by state()"""
+        self.nda_nick = state["nda_nick"]
+
+    def state_at(self, data, offset):
+        """
+        The reader state at a byte offset of the raw log, with the nick from the last change before it.
+        The log is searched backwards from the offset, so only the part after that change is scanned.
+        """
+        end = offset
+
+        while True:
+            position = data.rfind(b" Sending NICK ", 0, end)
+
+            if position == -1:
+                return {"nda_nick": self.you}
+
+            # the text may also be part of a message, so check that the line is a nick change
+            start = data.rfind(b"\n", 0, position) + 1
+            match = self.nda_nick_bytes_re.match(data, start, offset)
 
-            match = self.message_re.match(line)
-            if match is not None:
-                # only match if the message matches the channel we're reading
-                if match.group(3) == self.channel:
-                    yield self.make_quote(
-                        match.group(1),
-                        match.group(2),
-                        match.group(4),
-                        sequence_id,
-                        QuoteType.message,
-                        line,
-                    )
-                    sequence_id += 1
-                continue
-
-            match = self.join_re.match(line)
-            if match is not None:
-                if match.group(3) == self.channel:
-                    yield self.make_quote(
-                        match.group(1),
-                        match.group(2),
-                        "",
-                        sequence_id,
-                        QuoteType.join,
-                        line,
-                    )
-                    sequence_id += 1
-                continue
-
-            match = self.leave_re.match(line)
-            if match is not None:
-                if match.group(3) == self.channel:
-                    yield self.make_quote(
-                        match.group(1),
-                        match.group(2),
-                        match.group(5),
-                        sequence_id,
-                        QuoteType.leave,
-                        line,
-                    )
-                    sequence_id += 1
-                continue
-
-            match = self.quit_re.match(line)
-            if match is not None:
-                yield self.make_quote(
-                    match.group(1),
-                    match.group(2),
-                    match.group(3),
-                    sequence_id,
-                    QuoteType.leave,
-                    line,
-                )
-                sequence_id += 1
-                continue
-
-            match = self.kick_re.match(line)
-            if match is not None:
-                if match.group(3) == self.channel:
-                    yield self.make_quote(
-                        match.group(1),
-                        match.group(2),
-                        match.group(4),
-                        sequence_id,
-                        QuoteType.kick,
-                        line,
-                    )
-                    sequence_id += 1
-                continue
-
-            match = self.nick_re.match(line)
-            if match is not None:
-                yield self.make_quote(
-                    match.group(1),
-                    match.group(2),
-                    match.group(3),
-                    sequence_id,
-                    QuoteType.nick,
-                    line,
-                )
-                sequence_id += 1
-                continue
-
-            match = self.topic_re.match(line)
-            if match is not None:
-                if match.group(3) == self.channel:
-                    yield self.make_quote(
-                        match.group(1),
-                        match.group(2),
-                        match.group(4),
-                        sequence_id,
-                        QuoteType.subject,
-                        line,
-                    )
-                    sequence_id += 1
-                continue
-
-            match = self.ban_re.match(line)
-            if match is not None:
-                if match.group(3) == self.channel:
-                    yield self.make_quote(
-                        match.group(1),
-                        match.group(2),
-                        match.group(4),
-                        sequence_id,
-                        QuoteType.ban,
-                        line,
-                    )
-                    sequence_id += 1
-                continue
-
-            match = self.ban2_re.match(line)
-            if match is not None:
-                if match.group(3) == self.channel:
-                    yield self.make_quote(
-                        match.group(1),
-                        match.group(2),
-                        match.group(4),
-                        sequence_id,
-                        QuoteType.ban,
-                        line,
-                    )
-                    sequence_id += 1
-                continue
-
-            match = self.nda_message_re.match(line)
-            if match is not None:
-                if match.group(3) == self.channel:
-                    yield self.make_quote(
-                        match.group(1),
-                        nda_nick,
-                        match.group(2),
-                        sequence_id,
-                        QuoteType.message,
-                        line,
-                    )
-                    sequence_id += 1
-                continue
-
-            match = self.nda_nick_re.match(line)
-            if match is not None:
-                if (
-                    match.group(2) != nda_nick
-                ):  # don't treat NICK commands on connect as nick changes
-                    yield self.make_quote(
-                        match.group(1),
-                        nda_nick,
-                        match.group(2),
-                        sequence_id,
-                        QuoteType.nick,
-                        line,
-                    )
-                    sequence_id += 1
-                    nda_nick = match.group(2)
-                continue
-
-            match = self.nda_quit_re.match(line)
             if match is not None:
-                yield self.make_quote(
-                    match.group(1),
-                    nda_nick,
-                    match.group(2),
-                    sequence_id,
-                    QuoteType.leave,
-                    line,
-                )
-                sequence_id += 1
-                continue
-
-            # handle known unusable lines; this is done last because some of them are pretty general
-            if self.ignored_re.match(line) is not None:
-                continue
-
-            print("Unknown: %s" % line)
+                return {"nda_nick": match.group(1).decode("utf-8", errors="replace")}
+
+            end = position
+
+    def timestamp(self, line):
+        """The time at the start of a line, or None if it has none"""
+        match = self.timestamp_re.match(line)
+        return None if match is None else self.parse_timestamp(match.group(1))
 
     def make_quote(self, datetime_str, author, message, sequence_id, quote_type, raw):
         """Make a quote from a line"""
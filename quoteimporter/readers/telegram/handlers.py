@@ -2,6 +2,8 @@ import json
 import os.path
 from datetime import datetime
 
+from quoteimporter import metrics
+from quoteimporter.archives import read_file
 from quoteimporter.models import Attachment, Quote, QuoteType
 
 from .models import TelegramOptions
@@ -36,15 +38,15 @@ class BaseHandler:
         return text
 
     def read_attachment(self, relative_path: str):
-        """Read media attachments from files in the chat export directory"""
+        """Read media attachments from files in the chat export directory or archive"""
         filename = os.path.basename(relative_path)
 
         if self.export_dir:
-            complete_path = os.path.join(self.export_dir, relative_path)
+            with metrics.stage("attachment"):
+                data = read_file(self.export_dir, relative_path)
 
-            if os.path.isfile(complete_path):
-                with open(complete_path, "rb") as f:
-                    return Attachment(filename, f.read())
+            if data is not None:
+                return Attachment(filename, data)
 
         return Attachment(filename, None)
 
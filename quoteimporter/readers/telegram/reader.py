@@ -1,6 +1,7 @@
 import json
 from typing import Iterator
 
+from quoteimporter import rejects
 from quoteimporter.models import Quote
 
 from .handlers import (
@@ -31,14 +32,21 @@ class TelegramLogReader:
             InviteHandler(options),
             GroupTitleHandler(options),
         ]
+        self.index = 0
 
-    def read(self, json_stream, skip=0) -> Iterator[Quote]:
+    def read(self, json_stream, skip=0, state=None) -> Iterator[Quote]:
         doc = json.load(json_stream)
         messages = doc["messages"]
         sequence_id = 1
         skipped = 0
+        self.index = 0
+
+        if state is not None:
+            self.restore(state)
+
+        for message in messages[self.index :]:
+            self.index += 1
 
-        for message in messages:
             if skipped < skip:
                 skipped += 1
                 continue
@@ -55,4 +63,12 @@ class TelegramLogReader:
             if handled:
                 sequence_id += 1
             else:
-                print("Unknown %s" % json.dumps(message))
+                rejects.unknown(json.dumps(message))
+
+    def state(self) -> dict:
+        """The reader state needed to continue reading from the current message"""
+        return {"index": self.index}
+
+    def restore(self, state: dict):
+        """Restore a reader state saved by state()"""
+        self.index = state["index"]
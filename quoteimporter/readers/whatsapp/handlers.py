@@ -1,7 +1,8 @@
-import os.path
 import re
 from datetime import datetime, timedelta, timezone
 
+from quoteimporter import metrics
+from quoteimporter.archives import read_file
 from quoteimporter.models import Attachment, Quote, QuoteType
 
 from .models import DateOrder, WhatsAppOptions
@@ -90,13 +91,13 @@ class MatchHandler:
         return local_dt.astimezone(timezone.utc)
 
     def read_attachment(self, filename):
-        """Read media attachments from files in the attachment directory"""
+        """Read media attachments from files in the attachment directory or export archive"""
         if self.attachment_dir is not None:
-            path = os.path.join(self.attachment_dir, filename)
+            with metrics.stage("attachment"):
+                data = read_file(self.attachment_dir, filename)
 
-            if os.path.isfile(path):
-                with open(path, "rb") as f:
-                    return Attachment(filename, f.read())
+            if data is not None:
+                return Attachment(filename, data)
 
         return Attachment(filename, None)
 
@@ -118,7 +119,7 @@ class MessageMatchHandler(MatchHandler):
 
 
 class AttachmentMatchHandler(MatchHandler):
-    pattern = re.compile(fr"^{TIMESTAMP_PATTERN} (.+?): (<attached: (.+)>)$")
+    pattern = re.compile(fr"^{TIMESTAMP_PATTERN} (?>(.+?): )(<attached: (.+)>)$")
 
     def handle(self, line: str, sequence_id: int):
         match = self.pattern.match(line)
@@ -139,7 +140,7 @@ class AttachmentOmittedMatchHandler(MatchHandler):
     """At some point, likely in 2020, exporting chats "without media" causes media messages to be exported as e.g. "video omitted"."""
 
     pattern = re.compile(
-        fr"^{TIMESTAMP_PATTERN} (.+?): ((GIF|image|audio|video|sticker|Contact card|document) omitted)$"
+        fr"^{TIMESTAMP_PATTERN} (?>(.+?): )((GIF|image|audio|video|sticker|Contact card|document) omitted)$"
     )
 
     def handle(self, line: str, sequence_id: int):
@@ -162,7 +163,7 @@ class NamedAttachmentOmittedMatchHandler(MatchHandler):
     """
 
     pattern = re.compile(
-        fr"^{TIMESTAMP_PATTERN} (.+?): ((.+?)( • \d+ pages)? document omitted)$"
+        fr"^{TIMESTAMP_PATTERN} (?>(.+?): )((.+?)( • \d+ pages)? document omitted)$"
     )
 
     def handle(self, line: str, sequence_id: int):
@@ -182,7 +183,7 @@ class NamedAttachmentOmittedMatchHandler(MatchHandler):
 
 class SubjectMatchHandler(MatchHandler):
     pattern = re.compile(
-        fr'^{TIMESTAMP_PATTERN} (.+) changed the subject from .* to (?:"|“)(.*)(?:"|”)$'
+        fr'^{TIMESTAMP_PATTERN} (?>(.+?) changed the subject from )(?=.*["”]$).* to ["“](.*)["”]$'
     )
 
     def handle(self, line: str, sequence_id: int):
@@ -1,4 +1,6 @@
 """Read WhatsApp logs"""
+from quoteimporter import rejects
+
 from .handlers import *
 from .models import WhatsAppOptions
 
@@ -34,6 +36,10 @@ class WhatsAppLogReader:
                 skipped += 1
                 continue
 
+            if len(line) > rejects.max_line_length:
+                rejects.unknown(line)
+                continue
+
             handled = False
             for handler in self.handlers:
                 if not handler.can_handle(line):
@@ -55,7 +61,7 @@ class WhatsAppLogReader:
                 current.raw += "\n" + line
                 continue
 
-            print("Unknown %s" % line)
+            rejects.unknown(line)
 
         if current is not None:
             yield current
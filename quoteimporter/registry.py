@@ -0,0 +1,155 @@
+"""
+Look up readers and writers by name. Their modules, and the database drivers they use, are only
+imported once they are selected. Other packages can add readers and writers through the
+quoteimporter.readers and quoteimporter.writers entry point groups, with a factory that takes
+the command line args.
+"""
+import os.path
+
+from . import archives
+
+
+def irssi_reader(args):
+    from .readers.irssi import IrssiLogReader
+
+    return IrssiLogReader(args.channel, args.utc_offset, args.you, source(args))
+
+
+def hexchat_reader(args):
+    from .readers.hexchat import HexChatLogReader
+
+    return HexChatLogReader(args.channel, args.utc_offset, args.you, source(args))
+
+
+def nda_reader(args):
+    from .readers.nda import NdaLogReader
+
+    return NdaLogReader(args.channel, args.you, source(args))
+
+
+def whatsapp_reader(args):
+    from .readers.whatsapp.models import DateOrder, WhatsAppOptions
+    from .readers.whatsapp.reader import WhatsAppLogReader
+
+    date_order = DateOrder.american if args.dates == "american" else DateOrder.standard
+    attachment_dir = (
+        None if args.no_attachments else archives.attachment_dir(args.filename)
+    )
+    options = WhatsAppOptions(
+        args.channel, args.utc_offset, date_order, args.you, source(args), attachment_dir
+    )
+    return WhatsAppLogReader(options)
+
+
+def telegram_reader(args):
+    from .readers.telegram.models import TelegramOptions
+    from .readers.telegram.reader import TelegramLogReader
+
+    export_dir = (
+        None if args.no_attachments else archives.attachment_dir(args.filename)
+    )
+    return TelegramLogReader(TelegramOptions(args.channel, source(args), export_dir))
+
+
+def source(args):
+    return os.path.basename(args.filename)
+
+
+def mysql_writer(args):
+    from .writers.mysqldb import MySqlDb
+
+    return MySqlDb(
+        host="127.0.0.1",
+        user=args.mysql_user,
+        password=args.mysql_password,
+        database=args.database,
+    )
+
+
+def postgres_writer(args):
+    from .writers.postgresdb import PostgresDb
+
+    return PostgresDb(
+        host="127.0.0.1",
+        user=args.postgres_user,
+        password=args.postgres_password,
+        dbname=args.database,
+    )
+
+
+def json_writer(args):
+    from .writers.jsonfile import JsonFile
+
+    return JsonFile("quotes.json")
+
+
+def mongo_writer(args):
+    from .writers.mongodb import MongoDb
+
+    return MongoDb("localhost", 27017, args.database, args.mongo_write_concern)
+
+
+def sqlite_writer(args):
+    from .writers.sqlitedb import SqliteDb
+
+    return SqliteDb("quotes.db")
+
+
+def dry_run_writer(args):
+    from .writers.dryrun import DryRun
+
+    return DryRun()
+
+
+readers = {
+    "irssi": irssi_reader,
+    "whatsapp": whatsapp_reader,
+    "hexchat": hexchat_reader,
+    "nda": nda_reader,
+    "telegram": telegram_reader,
+}
+
+writers = {
+    "sqlite": sqlite_writer,
+    "mysql": mysql_writer,
+    "json": json_writer,
+    "mongo": mongo_writer,
+    "postgres": postgres_writer,
+    "none": dry_run_writer,
+}
+
+
+def plugins(group):
+    """The factories registered by other packages. Only looked up when needed, as it is slow"""
+    from importlib.metadata import entry_points
+
+    return {entry_point.name: entry_point for entry_point in entry_points(group=group)}
+
+
+def lookup(kind, factories, name):
+    if name in factories:
+        return factories[name]
+
+    entry_point = plugins("quoteimporter.%ss" % kind).get(name)
+
+    if entry_point is None:
+        raise Exception(
+            "Invalid %s type %s, expected one of: %s"
+            % (kind, name, ", ".join(names(kind, factories)))
+        )
+
+    return entry_point.load()
+
+
+def names(kind, factories):
+    return list(factories) + sorted(plugins("quoteimporter.%ss" % kind))
+
+
+def make_reader(args):
+    """Creates the reader named by the type in the command line args"""
+    return lookup("reader", readers, args.type)(args)
+
+
+def make_writer(args):
+    """Creates the writer named in the command line args"""
+    return lookup("writer", writers, args.writer)(args)
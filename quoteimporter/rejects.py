@@ -0,0 +1,119 @@
+"""Collect the lines that no reader pattern recognizes, grouped by their shape"""
+import re
+from collections import Counter
+
+# the rejects of the running import, or None to print every unknown line right away
+active = None
+
+# parts of a line that vary between otherwise identical lines, and what to replace them with
+masks = [
+    (re.compile(r"<[^<>\s]+>"), "<NICK>"),
+    (re.compile(r"(?<![^\s:!])[^\s:!]+![^@\s!]+@\S+"), "NICK!USER@HOST"),
+    (re.compile(r"\d+"), "0"),
+]
+
+# lines with more distinct shapes than this are counted, but not told apart
+max_shapes = 10000
+
+max_shape_length = 100
+
+# longer lines are reported as unknown without matching them, as no real log line is this long
+max_line_length = 2**17
+
+
+def shape(line):
+    """Normalize a line by masking digits and nicks, so lines of the same kind have the same shape"""
+    for (pattern, replacement) in masks:
+        line = pattern.sub(replacement, line)
+
+    return line[:max_shape_length]
+
+
+class Rejects:
+    """
+    Counts unknown lines by shape and keeps a few samples of each.
+    All unknown lines are optionally written to a buffered rejects file.
+    """
+
+    def __init__(self, samples=3, filename=None):
+        self.samples = samples
+        self.filename = filename
+        self.file = None
+        self.count = 0
+        self.shapes = Counter()
+        self.examples = {}
+        self.lines = None  # set to a list to keep the lines for merging instead of writing them
+
+    def add(self, line):
+        self.count += 1
+        key = shape(line)
+
+        if key not in self.shapes and len(self.shapes) >= max_shapes:
+            key = "(other)"
+
+        self.shapes[key] += 1
+        examples = self.examples.setdefault(key, [])
+
+        if len(examples) < self.samples:
+            examples.append(line)
+
+        if self.lines is not None:
+            self.lines.append(line)
+        elif self.filename is not None:
+            self.write(line)
+
+    def write(self, line):
+        if self.file is None:
+            self.file = open(self.filename, "w", encoding="utf-8", buffering=2**20)
+
+        self.file.write(line + "\n")
+
+    def merge(self, other):
+        """Add the rejects collected elsewhere, e.g. in a worker process"""
+        self.count += other.count
+        self.shapes.update(other.shapes)
+
+        for (key, lines) in other.examples.items():
+            examples = self.examples.setdefault(key, [])
+            examples.extend(lines[: self.samples - len(examples)])
+
+        for line in other.lines or []:
+            if self.filename is not None:
+                self.write(line)
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+def unknown(line):
+    """Report a line that no pattern recognized"""
+    if active is None:
+        print("Unknown %s" % line)
+        return
+
+    active.add(line)
+
+
+def print_rejects(rejects, top=20, file=None):
+    """Prints the most common shapes of unknown lines with a few samples each"""
+    if rejects.count == 0:
+        return
+
+    print(
+        "%i unknown lines in %i shapes" % (rejects.count, len(rejects.shapes)),
+        file=file,
+    )
+
+    for (key, count) in rejects.shapes.most_common(top):
+        print("%10i  %s" % (count, key), file=file)
+
+        for example in rejects.examples[key]:
+            print("            e.g. %s" % example, file=file)
+
+    if len(rejects.shapes) > top:
+        print("and %i more shapes" % (len(rejects.shapes) - top), file=file)
+
+    if rejects.filename is not None:
+        print("Wrote all unknown lines to %s" % rejects.filename, file=file)
@@ -0,0 +1,94 @@
+"""Collect statistics about quotes as they stream through an import"""
+import json
+from collections import Counter
+
+from .models import QuoteType
+
+type_descriptions = [
+    (QuoteType.message, "messages"),
+    (QuoteType.subject, "subject changes"),
+    (QuoteType.join, "joins"),
+    (QuoteType.leave, "leaves"),
+    (QuoteType.kick, "kicks"),
+    (QuoteType.ban, "bans"),
+    (QuoteType.nick, "nick changes"),
+    (QuoteType.system, "system notices"),
+    (QuoteType.attachment, "attachments"),
+]
+
+
+class Stats:
+    """Counts quotes per type, author and day in a single pass, without holding on to them"""
+
+    def __init__(self):
+        self.total = 0
+        self.types = Counter()
+        self.authors = Counter()
+        self.days = Counter()
+        self.message_bytes = 0
+        self.raw_bytes = 0
+        self.attachment_bytes = 0
+
+    def add(self, quote):
+        """Count a single quote"""
+        self.total += 1
+        self.types[quote.quote_type] += 1
+        self.authors[quote.author] += 1
+        self.days[quote.timestamp.date()] += 1
+        self.message_bytes += len(quote.message.encode("utf-8"))
+        self.raw_bytes += len(quote.raw.encode("utf-8"))
+
+        if quote.attachment is not None and quote.attachment.content is not None:
+            self.attachment_bytes += len(quote.attachment.content)
+
+    def collect(self, quotes):
+        """Count quotes as they pass through"""
+        for quote in quotes:
+            self.add(quote)
+            yield quote
+
+    def to_json(self):
+        """All collected statistics as a JSON serializable dict"""
+        return {
+            "total": self.total,
+            "types": dict(self.types),
+            "authors": dict(self.authors.most_common()),
+            "days": {day.isoformat(): n for (day, n) in sorted(self.days.items())},
+            "message_bytes": self.message_bytes,
+            "raw_bytes": self.raw_bytes,
+            "attachment_bytes": self.attachment_bytes,
+        }
+
+
+def print_stats(stats, top_authors=10):
+    """Prints stats about the quotes read"""
+    for (quote_type, description) in type_descriptions:
+        print("Read %i %s" % (stats.types[quote_type], description))
+
+    print("Read %i total" % stats.total)
+    print(
+        "Read %i bytes of messages, %i bytes of raw lines and %i bytes of attachments"
+        % (stats.message_bytes, stats.raw_bytes, stats.attachment_bytes)
+    )
+
+    if len(stats.days) > 0:
+        (busiest_day, busiest_count) = max(stats.days.items(), key=lambda d: d[1])
+        print(
+            "Read %i days from %s to %s, busiest %s with %i"
+            % (
+                len(stats.days),
+                min(stats.days),
+                max(stats.days),
+                busiest_day,
+                busiest_count,
+            )
+        )
+
+    for (author, n) in stats.authors.most_common(top_authors):
+        print("Read %i from %s" % (n, author))
+
+
+def write_stats(stats, filename):
+    """Writes all collected statistics to a JSON file"""
+    with open(filename, "w") as file:
+        json.dump(stats.to_json(), file, indent=2)
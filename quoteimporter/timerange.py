@@ -0,0 +1,91 @@
+"""Import only the quotes of a time window, seeking near its start instead of reading the whole log"""
+import mmap
+from datetime import datetime, timezone, timedelta
+
+from .archives import is_plain
+from .dayindex import day_offset, load_index
+
+
+def iso_time(value):
+    """A date or time on the command line, like 2017-07-22 or 2017-07-22T20:56"""
+    return datetime.fromisoformat(value)
+
+
+def resolve(value, utc_offset):
+    """Times without a UTC offset are in the time zone of the log, like its lines"""
+    if value is None or value.tzinfo is not None:
+        return value
+
+    return value.replace(tzinfo=timezone(timedelta(hours=utc_offset)))
+
+
+def within(quotes, since, until, utc_offset=0):
+    """
+    The quotes from since (inclusive) until until (exclusive). Logs are in chronological order,
+    so this stops reading at the first quote past the window. Quotes without a UTC offset, like those of
+    Telegram exports, are in the time zone of the log, like times on the command line.
+    """
+    zone = timezone(timedelta(hours=utc_offset))
+
+    for quote in quotes:
+        timestamp = quote.timestamp
+
+        if timestamp.tzinfo is None:
+            timestamp = timestamp.replace(tzinfo=zone)
+
+        if until is not None and timestamp >= until:
+            return
+
+        if since is None or timestamp >= since:
+            yield quote
+
+
+def seek(reader, stream, since):
+    """
+    Move the stream to a line at or shortly before the first quote since the given time.
+    nda logs are bisected, irssi and HexChat logs use their day index if one was built.
+    Compressed logs are read from the start, as seeking in them means decompressing up to there anyway.
+    Returns the reader state at that line, or None if the reader starts with its usual state.
+    """
+    if not is_plain(stream):
+        return None
+
+    if hasattr(reader, "timestamp"):
+        try:
+            data = mmap.mmap(stream.fileno(), 0, access=mmap.ACCESS_READ)
+        except (ValueError, OSError):
+            return None  # empty files and pipes can't be mapped
+
+        offset = bisect_log(reader, data, since)
+        state = reader.state_at(data, offset)
+        data.close()
+        stream.seek(offset)
+        return state
+
+    if hasattr(reader, "day"):
+        index = load_index(stream.name)
+
+        if index is not None:
+            stream.seek(day_offset(index, since.astimezone(reader.tzinfo).date()))
+
+    return None
+
+
+def bisect_log(reader, data, since):
+    """The offset of the first line at or after the given time, in a log with the time on every line"""
+    (low, high) = (0, len(data))
+
+    while low < high:
+        middle = (low + high) // 2
+        start = data.rfind(b"\n", 0, middle) + 1
+        end = data.find(b"\n", start)
+        end = len(data) if end == -1 else end + 1
+        timestamp = reader.timestamp(data[start:end].decode("utf-8", errors="replace"))
+
+        # lines without a time can't be placed, so keep them in the window to be safe
+        if timestamp is not None and timestamp < since:
+            low = end
+        else:
+            high = start
+
+    return low
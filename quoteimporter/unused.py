@@ -0,0 +1,79 @@
+"""Find media attachments that are not referenced by a chat log"""
+import io
+import os
+import os.path
+
+from .archives import ZipDirectory, open_log
+
+
+class AttachmentReport:
+    """The result of comparing the attachments referenced by a log with a directory listing"""
+
+    def __init__(self, unused, missing, unused_bytes):
+        self.unused = unused
+        self.missing = missing
+        self.unused_bytes = unused_bytes
+
+
+def referenced_attachments(reader, stream):
+    """Parses the log once and collects the names of all attachments it refers to"""
+    return {
+        quote.attachment.name
+        for quote in reader.read(stream)
+        if quote.attachment is not None
+    }
+
+
+def list_attachments(attachments_dir, exclude=()):
+    """
+    Lists all files below the directory, or in the folder of the log in a ZipDirectory, as a map of file
+    name to paths and sizes. Members of an archive are listed with the path of the archive in front.
+    """
+    files = {}
+
+    if isinstance(attachments_dir, ZipDirectory):
+        for (member, size) in attachments_dir.files():
+            name = os.path.basename(member)
+            path = os.path.join(attachments_dir.archive.filename, member)
+            files.setdefault(name, []).append((path, size))
+
+        return files
+
+    for root, _, names in os.walk(attachments_dir):
+        for name in names:
+            path = os.path.join(root, name)
+
+            if path in exclude:
+                continue
+
+            files.setdefault(name, []).append((path, os.path.getsize(path)))
+
+    return files
+
+
+def find_unused_attachments(reader, log_file, attachments_dir):
+    """
+    Compares the attachments referenced by the log with the files in the attachments directory, which is
+    a folder or, for a log in a zip archive, a ZipDirectory of the archive. Compressed and zipped logs are
+    read like for an import.
+    """
+    log_file = os.path.abspath(log_file)
+
+    with open_log(log_file) as stream:
+        text = io.TextIOWrapper(stream, encoding="utf-8", errors="replace")
+        referenced = referenced_attachments(reader, text)
+
+    if not isinstance(attachments_dir, ZipDirectory):
+        attachments_dir = os.path.abspath(attachments_dir)
+
+    files = list_attachments(attachments_dir, exclude={log_file})
+    unused = sorted(
+        (path, size)
+        for name, paths in files.items()
+        if name not in referenced
+        for (path, size) in paths
+    )
+    missing = sorted(name for name in referenced if name not in files)
+    unused_bytes = sum(size for (_, size) in unused)
+
+    return AttachmentReport([path for (path, _) in unused], missing, unused_bytes)
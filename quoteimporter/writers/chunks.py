@@ -0,0 +1,73 @@
+"""
+Split the quotes of a batch into the chunks a writer sends to the database at a time.
+Chunks are cut at a number of quotes or a number of bytes, whichever comes first, and the number
+of quotes is tuned after every chunk toward the number that takes the writer's target time to write.
+"""
+import time
+
+from quoteimporter import quote_size
+
+# the most quotes sent at a time, however fast the database is
+max_chunk_size = 100000
+
+
+def chunks(writer, quotes):
+    """
+    Split quotes into chunks of writer.chunk_size quotes (None for all of them) that add up to at most
+    about writer.chunk_bytes. Every chunk is timed until the writer asks for the next one, which
+    adapts writer.chunk_size if writer.chunk_seconds is set, and the sizes are printed.
+    """
+    start = 0
+    count = 0
+
+    while start < len(quotes):
+        (end, size) = cut(quotes, start, writer.chunk_size, writer.chunk_bytes)
+        started = time.perf_counter()
+        yield quotes[start:end]
+        seconds = time.perf_counter() - started
+
+        count += end - start
+        print(
+            "Inserted %i (chunk of %i quotes, %.1f MB in %.2fs)"
+            % (count, end - start, size / 1e6, seconds)
+        )
+        adapt(writer, end - start, seconds)
+        start = end
+
+
+def cut(quotes, start, chunk_size, chunk_bytes):
+    """
+    Where the chunk that starts at quote start ends, and its size in bytes. It has at most chunk_size
+    quotes and about chunk_bytes, either of which may be None for no limit.
+    """
+    end = start
+    size = 0
+    limit = len(quotes) if chunk_size is None else start + chunk_size
+
+    # a chunk has at least one quote, even if it is over the budget on its own
+    while end < min(limit, len(quotes)):
+        size += quote_size(quotes[end])
+        end += 1
+
+        if chunk_bytes is not None and size >= chunk_bytes:
+            break
+
+    return (end, size)
+
+
+def adapt(writer, rows, seconds):
+    """
+    Scale the chunk size by how far writing the last chunk was from the target time, at most halving
+    or doubling it at once so a single slow or fast chunk doesn't throw it off. A chunk cut short, by
+    its bytes or at the end of a batch, only says that full ones are too big if it was already too slow.
+    """
+    if writer.chunk_seconds is None or seconds <= 0:
+        return
+
+    short = writer.chunk_size is not None and rows < writer.chunk_size
+
+    if short and seconds <= writer.chunk_seconds:
+        return
+
+    factor = min(max(writer.chunk_seconds / seconds, 0.5), 2.0)
+    writer.chunk_size = min(max(int(rows * factor), 1), max_chunk_size)
@@ -5,6 +5,9 @@ class DryRun:
     def max_sequence_id(self, channel):
         return 0
 
+    def existing_hashes(self, channel, hashes):
+        return set()
+
     def insert_all(self, quotes):
         print("Dry run: would have inserted %i" % len(quotes))
 
@@ -3,51 +3,66 @@ import base64
 import json
 import os
 
+from quoteimporter import metrics
+
 
 class JsonFile:
-    """Wrap export to a JSON file"""
+    """
+    Wrap export to a JSON file. The quotes in the file are loaded once and kept in memory along with
+    the content hashes and largest sequence id of each channel, and the file is written once on close.
+    """
 
     def __init__(self, filename):
         self.filename = filename
+        self.json_quotes = None
+        self.max_ids = {}
+        self.hashes = {}
 
     def max_sequence_id(self, channel):
         """Gets the largest sequence id with the given channel, or 0"""
-        with open(self.filename) as file:
-            json_quotes = json.load(file)
-        max_id = 0
-
-        for quote in json_quotes:
-            seq_id = quote["sequence_id"]
+        return self.max_ids.get(channel, 0)
 
-            if quote["channel"] == channel and seq_id > max_id:
-                max_id = seq_id
-
-        return max_id
+    def existing_hashes(self, channel, hashes):
+        """Gets the subset of the given content hashes that are already present in the channel"""
+        return self.hashes.get(channel, set()).intersection(hashes)
 
     def insert_all(self, quotes):
-        """Write all given quotes to the file"""
-        with open(self.filename) as file:
-            json_quotes = json.load(file)
-
-        for quote in quotes:
-            json_quote = make_json(quote)
-            json_quotes.append(json_quote)
-
-        with open(self.filename, mode="w") as file:
-            json.dump(json_quotes, file)
+        """Add all given quotes to the quotes to write to the file"""
+        with metrics.stage("serialize"):
+            for quote in quotes:
+                self.add(make_json(quote))
 
         print("Inserted %i" % len(quotes))
 
+    def add(self, json_quote):
+        """Add a quote in JSON form, keeping track of its content hash and sequence id"""
+        channel = json_quote["channel"]
+        self.json_quotes.append(json_quote)
+        self.hashes.setdefault(channel, set()).add(json_quote.get("content_hash"))
+        self.max_ids[channel] = max(
+            self.max_ids.get(channel, 0), json_quote["sequence_id"]
+        )
+
     def initialize(self):
-        """Create an empty JSON array in the file if it is empty"""
-        if os.path.exists(self.filename) and os.path.getsize(self.filename) > 0:
+        """Load the quotes already in the file, if it isn't empty"""
+        self.json_quotes = []
+
+        if not os.path.exists(self.filename) or os.path.getsize(self.filename) == 0:
             return
 
-        with open(self.filename, mode="w") as file:
-            file.write("[]")
+        with open(self.filename) as file:
+            for json_quote in json.load(file):
+                self.add(json_quote)
+
+    def flush(self):
+        """Write all quotes to the file"""
+        with metrics.stage("write"), open(self.filename, mode="w") as file:
+            json.dump(self.json_quotes, file)
 
     def close(self):
-        pass
+        """Write the file, if the writer was initialized"""
+        if self.json_quotes is not None:
+            self.flush()
 
 
 def make_json(quote):
@@ -73,4 +88,5 @@ def make_json(quote):
         "raw": quote.raw,
         "attachment_name": attachment_name,
         "attachment": attachment_content,
+        "content_hash": quote.content_hash,
     }
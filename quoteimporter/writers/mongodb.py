@@ -1,37 +1,279 @@
 """Read and write quotes to the database"""
+import collections
+import math
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import bson
 import pymongo
+from bson.raw_bson import RawBSONDocument
+
+from quoteimporter import metrics
+from quoteimporter.writers.chunks import adapt, chunks, cut
 
 
 class MongoDb:
     """Wrap MongoDB database access"""
 
-    def __init__(self, host, port, database):
+    # number of quotes sent to the database at a time, tuned toward chunk_seconds
+    chunk_size = 10000
+
+    # most bytes of quotes sent to the database at a time, below the 48 MB limit of a bulk write message
+    chunk_bytes = 32 * 2**20
+
+    # seconds it should take to write a chunk, or None to keep chunk_size fixed
+    chunk_seconds = 1.0
+
+    # how to merge quotes whose content hash is already in the channel, skip or update, or None to insert
+    merge = None
+
+    # number of chunks written at once, by as many threads, after as many processes encode them to BSON
+    in_flight = 1
+
+    def __init__(self, host, port, database, write_concern=None):
         self.client = pymongo.MongoClient(host, port)
         self.quotes = self.client[database]["quotes"]
+        self.counters = self.client[database]["sequence_counters"]
+        self.encoders = None
+        self.threads = None
+
+        # e.g. 0 or 1 instead of majority for bulk loads
+        if write_concern is not None:
+            self.quotes = self.quotes.with_options(
+                write_concern=pymongo.WriteConcern(w=write_concern)
+            )
 
     def max_sequence_id(self, channel):
-        """Gets the largest sequence id with the given channel, or 0"""
-        aggregation = self.quotes.aggregate(
+        """Gets the largest sequence id with the given channel, or 0, from the end of its index"""
+        document = self.quotes.find_one(
+            {"channel": channel},
+            {"sequence_id": True},
+            sort=[("sequence_id", pymongo.DESCENDING)],
+        )
+        return 0 if document is None else document["sequence_id"]
+
+    def reserve_sequence_ids(self, channel, count):
+        """
+        Reserves the next count sequence ids of the channel and returns the first one, with an atomic
+        increment of a counter document per channel, so importers writing to the same channel at once
+        get separate blocks
+        """
+        # the counter never falls behind quotes written without reserving them
+        self.counters.update_one(
+            {"_id": channel},
+            {"$max": {"last_sequence_id": self.max_sequence_id(channel)}},
+            upsert=True,
+        )
+        counter = self.counters.find_one_and_update(
+            {"_id": channel},
+            {"$inc": {"last_sequence_id": count}},
+            return_document=pymongo.ReturnDocument.AFTER,
+        )
+        return counter["last_sequence_id"] - count + 1
+
+    def release_sequence_ids(self, channel, first, count):
+        """
+        Take a reserved block back after writing its quotes failed, if no later block of the channel was
+        reserved since, so a failed batch doesn't leave a gap
+        """
+        self.counters.update_one(
+            {"_id": channel, "last_sequence_id": first + count - 1},
+            {"$set": {"last_sequence_id": first - 1}},
+        )
+
+    def timeline(self, channel, since, until):
+        """
+        Gets the sequence ids and timestamps of the quotes of the channel from since until until, along
+        with the last quote before and the first quote after them, in order of sequence id
+        """
+        fields = {"sequence_id": True, "timestamp": True}
+        before = self.quotes.find_one(
+            {"channel": channel, "timestamp": {"$lt": since}},
+            fields,
+            sort=[("sequence_id", pymongo.DESCENDING)],
+        )
+        within = self.quotes.find(
+            {"channel": channel, "timestamp": {"$gte": since, "$lte": until}},
+            fields,
+        )
+        after = self.quotes.find_one(
+            {"channel": channel, "timestamp": {"$gt": until}},
+            fields,
+            sort=[("sequence_id", pymongo.ASCENDING)],
+        )
+        documents = [before, *within, after]
+        rows = [
+            (document["sequence_id"], document["timestamp"])
+            for document in documents
+            if document is not None
+        ]
+        return sorted(rows)
+
+    def sequence_ids_from(self, channel, first, page_size=1000):
+        """Gets the sequence ids of the channel from first on in order, a page at a time"""
+        while True:
+            documents = self.quotes.find(
+                {"channel": channel, "sequence_id": {"$gte": first}},
+                {"sequence_id": True},
+                sort=[("sequence_id", pymongo.ASCENDING)],
+                limit=page_size,
+            )
+            page = [document["sequence_id"] for document in documents]
+            yield from page
+
+            if len(page) < page_size:
+                break
+
+            first = page[-1] + 1
+
+    def renumber(self, channel, first, last, amount):
+        """
+        Moves the quotes of the channel from sequence id first to last up by amount. They are moved to
+        negative sequence ids first, so the unique index never sees two quotes with the same one.
+        """
+        self.quotes.update_many(
+            {"channel": channel, "sequence_id": {"$gte": first, "$lte": last}},
             [
-                {"$match": {"channel": channel}},
-                {"$group": {"_id": None, "max_sequence_id": {"$max": "$sequence_id"}}},
-            ]
+                {
+                    "$set": {
+                        "sequence_id": {
+                            "$multiply": [{"$add": ["$sequence_id", amount]}, -1]
+                        }
+                    }
+                }
+            ],
+        )
+        self.quotes.update_many(
+            {"channel": channel, "sequence_id": {"$lt": 0}},
+            {"$mul": {"sequence_id": -1}},
         )
 
-        for result in aggregation:
-            return result["max_sequence_id"]
-        return 0
+    def existing_hashes(self, channel, hashes):
+        """Gets the subset of the given content hashes that are already present in the channel"""
+        documents = self.quotes.find(
+            {"channel": channel, "content_hash": {"$in": hashes}},
+            {"content_hash": True, "_id": False},
+        )
+        return {document["content_hash"] for document in documents}
 
     def insert_all(self, quotes):
-        """Insert all given quotes in chunks"""
-        chunked_quotes = chunk(quotes, 10000)
-        count = 0
+        """
+        Insert all given quotes in chunks, or merge them into the channel if merge is set. Quotes whose
+        sequence id is already in the channel are counted and skipped.
+        """
+        if self.merge is None and self.in_flight > 1:
+            skipped = self.insert_parallel(quotes)
+        else:
+            skipped = 0
+
+            for q_chunk in chunks(self, quotes):
+                with metrics.stage("serialize"):
+                    data = [make_bson(quote) for quote in q_chunk]
+                with metrics.stage("write"):
+                    if self.merge is None:
+                        skipped += self.insert_documents(data)
+                    else:
+                        self.merge_documents(data)
+
+        if skipped > 0:
+            print(
+                "Skipped %i quotes whose sequence id is already in the channel" % skipped
+            )
+
+    def insert_parallel(self, quotes):
+        """
+        Split the quotes into chunks like the serial path does, but spread over at least in_flight of
+        them, so that in_flight are written at once. Each chunk is made into documents, which leave out
+        attachment contents, encoded to BSON in a worker process and inserted from a thread as raw
+        documents, while the next chunks are encoded. Returns the number of quotes skipped.
+        """
+        if self.encoders is None:
+            self.encoders = ProcessPoolExecutor(self.in_flight)
+            self.threads = ThreadPoolExecutor(self.in_flight, "mongo")
+
+        spread = math.ceil(len(quotes) / self.in_flight)
+        pending = collections.deque()
+        skipped = 0
+        start = 0
+        pieces = 0
+
+        while start < len(quotes):
+            chunk_size = min(self.chunk_size, spread)
+            (end, _) = cut(quotes, start, chunk_size, self.chunk_bytes)
+
+            with metrics.stage("serialize"):
+                documents = [make_bson(quote) for quote in quotes[start:end]]
+
+            encoded = self.encoders.submit(encode_bson, documents)
+            pending.append(self.threads.submit(self.insert_encoded, encoded))
+            pieces += 1
+            start = end
+
+            # each chunk is written as soon as it is encoded, while the next ones are encoded
+            if len(pending) >= self.in_flight:
+                with metrics.stage("write"):
+                    skipped += pending.popleft().result()
+
+        with metrics.stage("write"):
+            skipped += sum(insertion.result() for insertion in pending)
+
+        print("Inserted %i (%i chunks in parallel)" % (len(quotes), pieces))
+        return skipped
 
-        for q_chunk in chunked_quotes:
-            data = (make_bson(quote) for quote in q_chunk)
-            self.quotes.insert_many(data)
-            count += len(q_chunk)
-            print("Inserted %i" % count)
+    def insert_encoded(self, encoded):
+        """
+        Insert a chunk of quotes once encode_bson has encoded it, returning the number skipped, and
+        adapt chunk_size to how long the insert took
+        """
+        documents = [RawBSONDocument(data) for data in encoded.result()]
+        started = time.perf_counter()
+        skipped = self.insert_documents(documents)
+        adapt(self, len(documents), time.perf_counter() - started)
+        return skipped
+
+    def insert_documents(self, documents):
+        """
+        Insert the documents in an unordered bulk write, so the server can apply them in any order and
+        a duplicate doesn't stop the rest. Returns the number of documents that were skipped because
+        their sequence id is already in the channel, and raises any other error.
+        """
+        try:
+            self.quotes.insert_many(documents, ordered=False)
+            return 0
+        except pymongo.errors.BulkWriteError as e:
+            errors = e.details["writeErrors"]
+            duplicates = [error for error in errors if error["code"] == 11000]
+
+            if len(duplicates) < len(errors):
+                raise
+
+            return len(duplicates)
+
+    def merge_documents(self, documents):
+        """
+        Write the documents in one unordered bulk write. New quotes come with the sequence ids they were
+        given and are inserted, those without one are already present and update the quote of the
+        channel with the same content hash.
+        """
+        requests = []
+
+        for document in documents:
+            if document["sequence_id"] is not None:
+                requests.append(pymongo.InsertOne(document))
+                continue
+
+            key = {
+                "channel": document.pop("channel"),
+                "content_hash": document.pop("content_hash"),
+            }
+            del document["sequence_id"]
+            requests.append(pymongo.UpdateOne(key, {"$set": document}))
+
+        result = self.quotes.bulk_write(requests, ordered=False)
+        print(
+            "Merged %i new quotes, updated %i already present"
+            % (result.inserted_count, len(documents) - result.inserted_count)
+        )
 
     def initialize(self):
         """Create quotes collection if it doesn't already exist"""
@@ -39,16 +281,22 @@ class MongoDb:
             [("channel", pymongo.ASCENDING), ("sequence_id", pymongo.ASCENDING)],
             unique=True,
         )
+        self.quotes.create_index(
+            [("channel", pymongo.ASCENDING), ("content_hash", pymongo.ASCENDING)]
+        )
 
     def close(self):
-        """Close the database connection"""
+        """Close the database connection, and stop the encoding processes and writing threads"""
+        if self.encoders is not None:
+            self.encoders.shutdown()
+            self.threads.shutdown()
+
         self.client.close()
 
 
-def chunk(items, chunk_size):
-    """Split items into n chunks"""
-    for i in range(0, len(items), chunk_size):
-        yield items[i : i + chunk_size]
+def encode_bson(documents):
+    """Encode documents made by make_bson to BSON, in a worker process"""
+    return [bson.encode(document) for document in documents]
 
 
 def make_bson(quote):
@@ -72,4 +320,5 @@ def make_bson(quote):
         "raw": quote.raw,
         "attachment_name": attachment_name,
         "attachment": attachment_description,
+        "content_hash": quote.content_hash,
     }
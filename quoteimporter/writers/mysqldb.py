@@ -1,12 +1,32 @@
 """Read and write quotes to the database"""
+import json
+
 import mysql.connector
 
+from quoteimporter import metrics
+from quoteimporter.indexes import check_conflicts
+from quoteimporter.writers.chunks import chunks
+
 
 class MySqlDb:
     """Wrap MySQL database access"""
 
+    # number of quotes sent to the database at a time, tuned toward chunk_seconds
+    chunk_size = 2000
+
+    # most bytes of quotes sent to the database at a time; a chunk is sent as one statement, which has to
+    # fit in max_allowed_packet, so initialize() lowers it to half of that if needed
+    chunk_bytes = 16 * 2**20
+
+    # seconds it should take to write a chunk, or None to keep chunk_size fixed
+    chunk_seconds = 1.0
+
+    # how to merge quotes whose content hash is already in the channel, skip or update, or None to insert
+    merge = None
+
     def __init__(self, *args, **kwargs):
         self.cnx = mysql.connector.connect(*args, **kwargs)
+        self.indexes_dropped = False  # during a bulk load, see reserve_sequence_ids
 
         # force utf8mb4 like this because the charset argument for connect() doesn't work
         cursor = self.cnx.cursor()
@@ -22,24 +42,239 @@ class MySqlDb:
         cursor.close()
         return seq_id if seq_id is not None else 0
 
-    def insert_all(self, quotes):
-        """Insert all given quotes in chunks"""
-        sql = """INSERT INTO quotes
-            (author, channel, message, sequence_id, source, timestamp, type, raw, attachment_name, attachment)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)"""
+    def reserve_sequence_ids(self, channel, count):
+        """
+        Reserves the next count sequence ids of the channel and returns the first one. The counter is
+        updated in its own transaction while holding a named lock for the channel, so importers writing
+        to the same channel at once get separate blocks.
+        """
+        sql_lock = "SELECT GET_LOCK(CONCAT('quoteimporter:', SHA1(%s)), 60)"
+        sql_unlock = "SELECT RELEASE_LOCK(CONCAT('quoteimporter:', SHA1(%s)))"
+        sql_last = """
+            SELECT GREATEST(
+                COALESCE((SELECT last_sequence_id FROM sequence_counters WHERE channel = %s), 0),
+                COALESCE((SELECT MAX(sequence_id) FROM quotes WHERE channel = %s), 0)
+            )"""
+        # without the index, finding the last quote scans the whole table, so only the counter is read,
+        # which bulk_insert brings up to date before dropping the indexes
+        sql_counter = """SELECT COALESCE(MAX(last_sequence_id), 0)
+            FROM sequence_counters WHERE channel = %s"""
+        sql_reserve = """INSERT INTO sequence_counters (channel, last_sequence_id)
+            VALUES (%s, %s)
+            ON DUPLICATE KEY UPDATE last_sequence_id = VALUES(last_sequence_id)"""
+        # start a new transaction, so the counter is read after the lock is taken
+        self.cnx.commit()
         cursor = self.cnx.cursor()
-        chunked_quotes = chunk(quotes, 2000)
-        count = 0
+        cursor.execute(sql_lock, (channel,))
+        (locked,) = cursor.fetchone()
+
+        if locked != 1:
+            cursor.close()
+            raise Exception("Timed out waiting for the sequence id lock of %s" % channel)
 
-        for q_chunk in chunked_quotes:
-            data = (make_row(quote) for quote in q_chunk)
-            cursor.executemany(sql, data)
-            count += len(q_chunk)
-            print("Inserted %i" % count)
+        try:
+            if self.indexes_dropped:
+                cursor.execute(sql_counter, (channel,))
+            else:
+                cursor.execute(sql_last, (channel, channel))
+            (last,) = cursor.fetchone()
+            first = last + 1
+            cursor.execute(sql_reserve, (channel, first + count - 1))
+            self.cnx.commit()
+        finally:
+            cursor.execute(sql_unlock, (channel,))
+            cursor.fetchone()
+            cursor.close()
 
+        return first
+
+    def release_sequence_ids(self, channel, first, count):
+        """
+        Roll back a failed write of the quotes given a reserved block, and take the block back if no
+        later block of the channel was reserved since, so a failed batch doesn't leave a gap
+        """
+        sql = """UPDATE sequence_counters SET last_sequence_id = %s
+            WHERE channel = %s AND last_sequence_id = %s"""
+        self.cnx.rollback()
+        cursor = self.cnx.cursor()
+        cursor.execute(sql, (first - 1, channel, first + count - 1))
         self.cnx.commit()
         cursor.close()
 
+    def timeline(self, channel, since, until):
+        """
+        Gets the sequence ids and timestamps of the quotes of the channel from since until until, along
+        with the last quote before and the first quote after them, in order of sequence id
+        """
+        sql = """
+            (SELECT sequence_id, timestamp FROM quotes
+                WHERE channel = %s AND timestamp < %s
+                ORDER BY sequence_id DESC LIMIT 1)
+            UNION ALL
+            (SELECT sequence_id, timestamp FROM quotes
+                WHERE channel = %s AND timestamp >= %s AND timestamp <= %s)
+            UNION ALL
+            (SELECT sequence_id, timestamp FROM quotes
+                WHERE channel = %s AND timestamp > %s
+                ORDER BY sequence_id LIMIT 1)
+            ORDER BY sequence_id"""
+        cursor = self.cnx.cursor()
+        cursor.execute(sql, (channel, since, channel, since, until, channel, until))
+        rows = cursor.fetchall()
+        cursor.close()
+        return rows
+
+    def sequence_ids_from(self, channel, first, page_size=1000):
+        """Gets the sequence ids of the channel from first on in order, a page at a time"""
+        sql = """SELECT sequence_id FROM quotes WHERE channel = %s AND sequence_id >= %s
+            ORDER BY sequence_id LIMIT %s"""
+        cursor = self.cnx.cursor()
+
+        while True:
+            cursor.execute(sql, (channel, first, page_size))
+            page = [sequence_id for (sequence_id,) in cursor.fetchall()]
+            yield from page
+
+            if len(page) < page_size:
+                break
+
+            first = page[-1] + 1
+
+        cursor.close()
+
+    def renumber(self, channel, first, last, amount):
+        """
+        Moves the quotes of the channel from sequence id first to last up by amount. They are moved to
+        negative sequence ids first, so the unique index never sees two quotes with the same one.
+        """
+        sql_move = """UPDATE quotes SET sequence_id = -(sequence_id + %s)
+            WHERE channel = %s AND sequence_id >= %s AND sequence_id <= %s"""
+        sql_restore = """UPDATE quotes SET sequence_id = -sequence_id
+            WHERE channel = %s AND sequence_id < 0"""
+        cursor = self.cnx.cursor()
+        cursor.execute(sql_move, (amount, channel, first, last))
+        cursor.execute(sql_restore, (channel,))
+        self.cnx.commit()
+        cursor.close()
+
+    def existing_hashes(self, channel, hashes):
+        """Gets the subset of the given content hashes that are already present in the channel"""
+        if len(hashes) == 0:
+            return set()
+
+        placeholders = ", ".join(["%s"] * len(hashes))
+        sql = (
+            "SELECT content_hash FROM quotes WHERE channel = %%s AND content_hash IN (%s)"
+            % placeholders
+        )
+        cursor = self.cnx.cursor()
+        cursor.execute(sql, (channel, *hashes))
+        existing = {content_hash for (content_hash,) in cursor.fetchall()}
+        cursor.close()
+        return existing
+
+    def load_progress(self, channel, filename):
+        """The progress marker committed with the last batch imported from the file, or None"""
+        sql = "SELECT progress FROM import_progress WHERE channel = %s AND filename = %s"
+        cursor = self.cnx.cursor()
+        cursor.execute(sql, (channel, filename))
+        row = cursor.fetchone()
+        cursor.close()
+        return json.loads(row[0]) if row is not None else None
+
+    def insert_all(self, quotes, progress=None):
+        """
+        Insert all given quotes in chunks, and commit them in one transaction with the progress marker
+        of the import, if given
+        """
+        self.write_all(quotes)
+
+        if progress is not None:
+            self.save_progress(progress)
+
+        self.commit()
+
+    def write_all(self, quotes):
+        """Insert all given quotes in chunks, or merge them if merge is set, without committing"""
+        sql_staging = """
+            CREATE TEMPORARY TABLE IF NOT EXISTS staging_quotes (sequence_id int(11) DEFAULT NULL)
+            SELECT author, channel, message, sequence_id, source, timestamp, type, raw, attachment_name, attachment, content_hash
+            FROM quotes LIMIT 0"""
+        table = "quotes" if self.merge is None else "staging_quotes"
+        sql = (
+            "INSERT INTO %s" % table
+            + """
+            (author, channel, message, sequence_id, source, timestamp, type, raw, attachment_name, attachment, content_hash)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)"""
+        )
+        cursor = self.cnx.cursor()
+
+        if self.merge is not None:
+            cursor.execute(sql_staging)
+
+        for q_chunk in chunks(self, quotes):
+            with metrics.stage("serialize"):
+                data = [make_row(quote) for quote in q_chunk]
+            with metrics.stage("write"):
+                cursor.executemany(sql, data)
+
+        if self.merge is not None:
+            with metrics.stage("write"):
+                self.merge_staged(cursor, len(quotes))
+
+        cursor.close()
+
+    def save_progress(self, progress):
+        """Store the progress marker of the import in the transaction of the quotes written with it"""
+        sql = """INSERT INTO import_progress (channel, filename, progress)
+            VALUES (%s, %s, %s)
+            ON DUPLICATE KEY UPDATE progress = VALUES(progress)"""
+        cursor = self.cnx.cursor()
+        cursor.execute(
+            sql, (progress["channel"], progress["filename"], json.dumps(progress))
+        )
+        cursor.close()
+
+    def commit(self):
+        """Commit the quotes written since the last commit"""
+        with metrics.stage("commit"):
+            self.cnx.commit()
+
+    def rollback(self):
+        """Discard the quotes written since the last commit"""
+        self.cnx.rollback()
+
+    def merge_staged(self, cursor, count):
+        """
+        Merge the staged quotes into the quotes table. New quotes come with the sequence ids they were
+        given and are inserted, those without one are already present and update the quote of the
+        channel with the same content hash. Empties the staging table.
+        """
+        sql_update = """UPDATE quotes AS q JOIN staging_quotes AS s
+            ON s.sequence_id IS NULL
+                AND q.channel = s.channel AND q.content_hash = s.content_hash
+            SET q.author = s.author,
+                q.message = s.message,
+                q.source = s.source,
+                q.timestamp = s.timestamp,
+                q.type = s.type,
+                q.raw = s.raw,
+                q.attachment_name = s.attachment_name,
+                q.attachment = s.attachment"""
+        sql_insert = """INSERT INTO quotes
+            (author, channel, message, sequence_id, source, timestamp, type, raw, attachment_name, attachment, content_hash)
+            SELECT author, channel, message, sequence_id, source, timestamp, type, raw, attachment_name, attachment, content_hash
+            FROM staging_quotes WHERE sequence_id IS NOT NULL"""
+
+        cursor.execute(sql_update)
+        cursor.execute(sql_insert)
+        inserted = cursor.rowcount
+        cursor.execute("DELETE FROM staging_quotes")
+        print(
+            "Merged %i new quotes, updated %i already present"
+            % (inserted, count - inserted)
+        )
+
     def initialize(self):
         """Create quotes table if it doesn't already exist"""
         sql = """
@@ -55,25 +290,116 @@ class MySqlDb:
                 `raw` longtext DEFAULT NULL,
                 `attachment_name` varchar(255) DEFAULT NULL,
                 `attachment` longblob DEFAULT NULL,
+                `content_hash` char(40) DEFAULT NULL,
                 PRIMARY KEY (`id`),
-                UNIQUE KEY `IX_quotes_channel_sequence_id` (`channel`,`sequence_id`)
+                UNIQUE KEY `IX_quotes_channel_sequence_id` (`channel`,`sequence_id`),
+                KEY `IX_quotes_channel_content_hash` (`channel`,`content_hash`)
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4"""
+        sql_has_hash = """
+            SELECT COUNT(*) FROM information_schema.columns
+            WHERE table_schema = DATABASE() AND table_name = 'quotes' AND column_name = 'content_hash'"""
+        sql_hash = """
+            ALTER TABLE `quotes`
+                ADD COLUMN `content_hash` char(40) DEFAULT NULL,
+                ADD KEY `IX_quotes_channel_content_hash` (`channel`,`content_hash`)"""
+        sql_progress = """
+            CREATE TABLE IF NOT EXISTS `import_progress` (
+                `channel` varchar(127) NOT NULL,
+                `filename` varchar(255) NOT NULL,
+                `progress` text NOT NULL,
+                PRIMARY KEY (`channel`, `filename`)
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4"""
+        sql_counters = """
+            CREATE TABLE IF NOT EXISTS `sequence_counters` (
+                `channel` varchar(127) NOT NULL,
+                `last_sequence_id` int(11) NOT NULL,
+                PRIMARY KEY (`channel`)
             ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4"""
         cursor = self.cnx.cursor()
         cursor.execute(sql)
+        cursor.execute(sql_progress)
+        cursor.execute(sql_counters)
+
+        # tables created before content hashes were introduced
+        cursor.execute(sql_has_hash)
+        (has_hash,) = cursor.fetchone()
+        if not has_hash:
+            cursor.execute(sql_hash)
+
+        # escaping and the quote that goes over the budget can make a statement bigger than its chunk,
+        # so only half of max_allowed_packet is used, which is 4 MB on MySQL 5.7
+        cursor.execute("SELECT @@max_allowed_packet")
+        (max_allowed_packet,) = cursor.fetchone()
+
+        if self.chunk_bytes is None or self.chunk_bytes > max_allowed_packet // 2:
+            self.chunk_bytes = max_allowed_packet // 2
+            print(
+                "Sending chunks of at most %i bytes, half of max_allowed_packet"
+                % self.chunk_bytes
+            )
+
+        self.cnx.commit()
+        cursor.close()
+
+        # the indexes are missing if a bulk load was killed before it could build them
+        check_conflicts(self.create_indexes())
+
+    def index_names(self, cursor):
+        """The names of the indexes of the quotes table"""
+        sql = """
+            SELECT DISTINCT index_name FROM information_schema.statistics
+            WHERE table_schema = DATABASE() AND table_name = 'quotes'"""
+        cursor.execute(sql)
+        return {name for (name,) in cursor.fetchall()}
+
+    def drop_indexes(self):
+        """Drop the indexes of the quotes table for a bulk load"""
+        cursor = self.cnx.cursor()
+        names = self.index_names(cursor)
+
+        for name in ["IX_quotes_channel_sequence_id", "IX_quotes_channel_content_hash"]:
+            if name in names:
+                cursor.execute("ALTER TABLE `quotes` DROP INDEX `%s`" % name)
+
+        self.indexes_dropped = True
         self.cnx.commit()
         cursor.close()
 
+    def create_indexes(self):
+        """
+        Build the indexes of the quotes table that are missing. Returns the channels and sequence ids used
+        by more than one quote, with their number of quotes, in which case the unique index is not built.
+        """
+        sql_conflicts = """
+            SELECT channel, sequence_id, COUNT(*) FROM quotes
+            GROUP BY channel, sequence_id HAVING COUNT(*) > 1
+            ORDER BY channel, sequence_id"""
+        sql_index = "ALTER TABLE `quotes` ADD UNIQUE KEY `IX_quotes_channel_sequence_id` (`channel`,`sequence_id`)"
+        sql_hash_index = "ALTER TABLE `quotes` ADD KEY `IX_quotes_channel_content_hash` (`channel`,`content_hash`)"
+        cursor = self.cnx.cursor()
+        names = self.index_names(cursor)
+        conflicts = []
+
+        if "IX_quotes_channel_content_hash" not in names:
+            cursor.execute(sql_hash_index)
+
+        if "IX_quotes_channel_sequence_id" not in names:
+            cursor.execute(sql_conflicts)
+            conflicts = cursor.fetchall()
+
+            if len(conflicts) == 0:
+                cursor.execute(sql_index)
+
+        self.indexes_dropped = False
+        self.cnx.commit()
+        cursor.close()
+        return conflicts
+
     def close(self):
         """Close the database connection"""
         self.cnx.close()
 
 
-def chunk(items, chunk_size):
-    """Split items into n chunks"""
-    for i in range(0, len(items), chunk_size):
-        yield items[i : i + chunk_size]
-
-
 def make_row(quote):
     return (
         quote.author,
@@ -86,4 +412,5 @@ def make_row(quote):
         quote.raw,
         quote.attachment.name if quote.attachment is not None else None,
         quote.attachment.content if quote.attachment is not None else None,
+        quote.content_hash,
     )
@@ -0,0 +1,164 @@
+"""
+Write batches of quotes through several database connections at once. Batches are loaded in parallel,
+but committed in the order they were submitted, so the quotes in the database are always a prefix of
+the import, and the progress marker committed with the last batch of it says where to resume.
+"""
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+class WriterPool:
+    """
+    Spread batches over loaders, writers with a connection each, while another writer with its own
+    connection does everything else, like lookups and reserving sequence ids
+    """
+
+    def __init__(self, writer, loaders):
+        self.writer = writer
+        self.loaders = loaders
+        self.idle = queue.Queue()
+        self.executor = ThreadPoolExecutor(len(loaders), "writer")
+        self.turn = threading.Condition()
+        self.submitted = 0  # number of batches submitted
+        self.finished = 0  # number of batches committed or rolled back, in order
+        self.committed = 0  # number of batches committed, always the first ones
+        self.error = None  # error of the first failed batch, after which none are committed
+
+        for loader in loaders:
+            self.idle.put(loader)
+
+    def __getattr__(self, name):
+        """Anything else is done by the writer, once the batches in flight are committed"""
+        attribute = getattr(self.writer, name)
+
+        if not callable(attribute):
+            return attribute
+
+        def call(*args, **kwargs):
+            self.flush()
+            return attribute(*args, **kwargs)
+
+        return call
+
+    def initialize(self):
+        """
+        Initialize the database with the writer. The loaders write to the same database, so they take
+        over the chunk_bytes that initializing may have lowered to fit it.
+        """
+        self.writer.initialize()
+
+        for loader in self.loaders:
+            loader.chunk_bytes = self.writer.chunk_bytes
+
+    def reserve_sequence_ids(self, channel, count):
+        """Reserves sequence ids with the writer, without waiting for the batches in flight"""
+        return self.writer.reserve_sequence_ids(channel, count)
+
+    def release_sequence_ids(self, channel, first, count):
+        """Takes reserved sequence ids back with the writer, see reserve_sequence_ids"""
+        self.writer.release_sequence_ids(channel, first, count)
+
+    def existing_hashes(self, channel, hashes):
+        """
+        Looks up content hashes with the writer, without waiting for the batches in flight, as those
+        are other quotes of the same import
+        """
+        return self.writer.existing_hashes(channel, hashes)
+
+    def insert_all(self, quotes, progress=None):
+        """Insert the quotes in the background, see submit"""
+        self.submit(quotes, progress)
+
+    def submit(self, quotes, progress=None, committed=None):
+        """
+        Load the quotes with the next idle loader in the background, waiting for one if all are busy, and
+        commit them with the progress marker, if given, once the batches before them are committed.
+        committed is called after that. Raises the error of a failed batch, if there was one.
+        """
+        self.check()
+        loader = self.idle.get()
+        index = self.submitted
+        self.submitted += 1
+        self.executor.submit(self.write, index, loader, quotes, progress, committed)
+
+    def write(self, index, loader, quotes, progress, committed):
+        """Load the quotes in a transaction, then wait for their turn to commit it"""
+        error = None
+
+        try:
+            loader.write_all(quotes)
+        except Exception as e:
+            error = e
+
+        with self.turn:
+            self.turn.wait_for(lambda: self.finished == index)
+
+            try:
+                if error is None and self.error is None:
+                    if progress is not None:
+                        loader.save_progress(progress)
+
+                    loader.commit()
+                    self.committed += 1
+
+                    if committed is not None:
+                        committed()
+                else:
+                    loader.rollback()
+            except Exception as e:
+                error = e
+
+            if self.error is None:
+                self.error = error
+
+            self.finished += 1
+            self.turn.notify_all()
+
+        self.idle.put(loader)
+
+    def flush(self):
+        """Wait until all submitted batches are committed, and raise the error of a failed one, if any"""
+        self.wait()
+        self.check()
+
+    def wait(self):
+        """Wait until all submitted batches are committed or rolled back"""
+        with self.turn:
+            self.turn.wait_for(lambda: self.finished == self.submitted)
+
+    def rollback(self):
+        """
+        Wait for the batches in flight, which are rolled back after a failed one, and discard what the
+        writer wrote since its last commit
+        """
+        self.wait()
+        self.writer.rollback()
+
+    def create_indexes(self):
+        """
+        Build the indexes with the writer once the batches in flight are finished, also after a failed
+        one, so a failed bulk load gets its indexes back. The error of the batch is raised by close.
+        """
+        self.wait()
+        return self.writer.create_indexes()
+
+    def check(self):
+        """Raise the error that stopped the import, if a batch failed"""
+        if self.error is not None:
+            raise Exception(
+                "Writing a batch failed, so only the first %i batches were committed"
+                % self.committed
+            ) from self.error
+
+    def close(self):
+        """Wait for the batches in flight and close all connections"""
+        try:
+            self.flush()
+        finally:
+            self.executor.shutdown()
+
+            self.writer.close()
+
+            for loader in self.loaders:
+                loader.close()
@@ -1,12 +1,31 @@
 """Read and write quotes to the database"""
+import json
+
 import psycopg2
 
+from quoteimporter import metrics
+from quoteimporter.indexes import check_conflicts
+from quoteimporter.writers.chunks import chunks
+
 
 class PostgresDb:
     """Wrap PostgreSQL database access"""
 
+    # number of quotes sent to the database at a time, tuned toward chunk_seconds
+    chunk_size = 10000
+
+    # most bytes of quotes sent to the database at a time
+    chunk_bytes = 64 * 2**20
+
+    # seconds it should take to write a chunk, or None to keep chunk_size fixed
+    chunk_seconds = 1.0
+
+    # how to merge quotes whose content hash is already in the channel, skip or update, or None to insert
+    merge = None
+
     def __init__(self, *args, **kwargs):
         self.cnx = psycopg2.connect(*args, **kwargs)
+        self.indexes_dropped = False  # during a bulk load, see reserve_sequence_ids
 
     def max_sequence_id(self, channel):
         """Gets the largest sequence id with the given channel, or 0"""
@@ -17,24 +36,225 @@ class PostgresDb:
         cursor.close()
         return seq_id if seq_id is not None else 0
 
-    def insert_all(self, quotes):
-        """Insert all given quotes in chunks"""
-        sql = """INSERT INTO quotes
-            (author, channel, message, sequence_id, source, timestamp, type, raw, attachment_name, attachment)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)"""
+    def reserve_sequence_ids(self, channel, count):
+        """
+        Reserves the next count sequence ids of the channel and returns the first one. The counter is
+        updated in its own transaction under an advisory lock on the channel, so importers writing to
+        the same channel at once get separate blocks.
+        """
+        sql_last = """
+            SELECT GREATEST(
+                (SELECT last_sequence_id FROM sequence_counters WHERE channel = %s),
+                (SELECT MAX(sequence_id) FROM quotes WHERE channel = %s)
+            )"""
+        # without the index, finding the last quote scans the whole table, so only the counter is read,
+        # which bulk_insert brings up to date before dropping the indexes
+        sql_counter = """SELECT COALESCE(MAX(last_sequence_id), 0)
+            FROM sequence_counters WHERE channel = %s"""
+        sql_reserve = """INSERT INTO sequence_counters (channel, last_sequence_id)
+            VALUES (%s, %s)
+            ON CONFLICT (channel) DO UPDATE SET last_sequence_id = EXCLUDED.last_sequence_id"""
+        self.cnx.commit()
         cursor = self.cnx.cursor()
-        chunked_quotes = chunk(quotes, 10000)
-        count = 0
+        cursor.execute("SELECT pg_advisory_xact_lock(hashtext(%s))", (channel,))
+        if self.indexes_dropped:
+            cursor.execute(sql_counter, (channel,))
+        else:
+            cursor.execute(sql_last, (channel, channel))
+        (last,) = cursor.fetchone()
+        first = (last or 0) + 1
+        cursor.execute(sql_reserve, (channel, first + count - 1))
+        self.cnx.commit()
+        cursor.close()
+        return first
+
+    def release_sequence_ids(self, channel, first, count):
+        """
+        Roll back a failed write of the quotes given a reserved block, and take the block back if no
+        later block of the channel was reserved since, so a failed batch doesn't leave a gap
+        """
+        sql = """UPDATE sequence_counters SET last_sequence_id = %s
+            WHERE channel = %s AND last_sequence_id = %s"""
+        self.cnx.rollback()
+        cursor = self.cnx.cursor()
+        cursor.execute(sql, (first - 1, channel, first + count - 1))
+        self.cnx.commit()
+        cursor.close()
 
-        for q_chunk in chunked_quotes:
-            data = (make_row(quote) for quote in q_chunk)
-            cursor.executemany(sql, data)
-            count += len(q_chunk)
-            print("Inserted %i" % count)
+    def timeline(self, channel, since, until):
+        """
+        Gets the sequence ids and timestamps of the quotes of the channel from since until until, along
+        with the last quote before and the first quote after them, in order of sequence id
+        """
+        sql = """
+            (SELECT sequence_id, timestamp::timestamptz FROM quotes
+                WHERE channel = %s AND timestamp < %s
+                ORDER BY sequence_id DESC LIMIT 1)
+            UNION ALL
+            (SELECT sequence_id, timestamp::timestamptz FROM quotes
+                WHERE channel = %s AND timestamp >= %s AND timestamp <= %s)
+            UNION ALL
+            (SELECT sequence_id, timestamp::timestamptz FROM quotes
+                WHERE channel = %s AND timestamp > %s
+                ORDER BY sequence_id LIMIT 1)
+            ORDER BY sequence_id"""
+        cursor = self.cnx.cursor()
+        cursor.execute(sql, (channel, since, channel, since, until, channel, until))
+        rows = cursor.fetchall()
+        cursor.close()
+        return rows
 
+    def sequence_ids_from(self, channel, first, page_size=1000):
+        """Gets the sequence ids of the channel from first on in order, a page at a time"""
+        sql = """SELECT sequence_id FROM quotes WHERE channel = %s AND sequence_id >= %s
+            ORDER BY sequence_id LIMIT %s"""
+        cursor = self.cnx.cursor()
+
+        while True:
+            cursor.execute(sql, (channel, first, page_size))
+            page = [sequence_id for (sequence_id,) in cursor.fetchall()]
+            yield from page
+
+            if len(page) < page_size:
+                break
+
+            first = page[-1] + 1
+
+        cursor.close()
+
+    def renumber(self, channel, first, last, amount):
+        """
+        Moves the quotes of the channel from sequence id first to last up by amount. They are moved to
+        negative sequence ids first, so the unique index never sees two quotes with the same one.
+        """
+        sql_move = """UPDATE quotes SET sequence_id = -(sequence_id + %s)
+            WHERE channel = %s AND sequence_id >= %s AND sequence_id <= %s"""
+        sql_restore = """UPDATE quotes SET sequence_id = -sequence_id
+            WHERE channel = %s AND sequence_id < 0"""
+        cursor = self.cnx.cursor()
+        cursor.execute(sql_move, (amount, channel, first, last))
+        cursor.execute(sql_restore, (channel,))
         self.cnx.commit()
         cursor.close()
 
+    def existing_hashes(self, channel, hashes):
+        """Gets the subset of the given content hashes that are already present in the channel"""
+        if len(hashes) == 0:
+            return set()
+
+        placeholders = ", ".join(["%s"] * len(hashes))
+        sql = (
+            "SELECT content_hash FROM quotes WHERE channel = %%s AND content_hash IN (%s)"
+            % placeholders
+        )
+        cursor = self.cnx.cursor()
+        cursor.execute(sql, (channel, *hashes))
+        existing = {content_hash for (content_hash,) in cursor.fetchall()}
+        cursor.close()
+        return existing
+
+    def load_progress(self, channel, filename):
+        """The progress marker committed with the last batch imported from the file, or None"""
+        sql = "SELECT progress FROM import_progress WHERE channel = %s AND filename = %s"
+        cursor = self.cnx.cursor()
+        cursor.execute(sql, (channel, filename))
+        row = cursor.fetchone()
+        cursor.close()
+        return json.loads(row[0]) if row is not None else None
+
+    def insert_all(self, quotes, progress=None):
+        """
+        Insert all given quotes in chunks, and commit them in one transaction with the progress marker
+        of the import, if given
+        """
+        self.write_all(quotes)
+
+        if progress is not None:
+            self.save_progress(progress)
+
+        self.commit()
+
+    def write_all(self, quotes):
+        """Insert all given quotes in chunks, or merge them if merge is set, without committing"""
+        sql_staging = """
+            CREATE TEMP TABLE IF NOT EXISTS staging_quotes AS
+            SELECT author, channel, message, sequence_id, source, timestamp, type, raw, attachment_name, attachment, content_hash
+            FROM quotes WITH NO DATA"""
+        table = "quotes" if self.merge is None else "staging_quotes"
+        sql = (
+            "INSERT INTO %s" % table
+            + """
+            (author, channel, message, sequence_id, source, timestamp, type, raw, attachment_name, attachment, content_hash)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)"""
+        )
+        cursor = self.cnx.cursor()
+
+        if self.merge is not None:
+            cursor.execute(sql_staging)
+
+        for q_chunk in chunks(self, quotes):
+            with metrics.stage("serialize"):
+                data = [make_row(quote) for quote in q_chunk]
+            with metrics.stage("write"):
+                cursor.executemany(sql, data)
+
+        if self.merge is not None:
+            with metrics.stage("write"):
+                self.merge_staged(cursor, len(quotes))
+
+        cursor.close()
+
+    def save_progress(self, progress):
+        """Store the progress marker of the import in the transaction of the quotes written with it"""
+        sql = """INSERT INTO import_progress (channel, filename, progress)
+            VALUES (%s, %s, %s)
+            ON CONFLICT (channel, filename) DO UPDATE SET progress = EXCLUDED.progress"""
+        cursor = self.cnx.cursor()
+        cursor.execute(
+            sql, (progress["channel"], progress["filename"], json.dumps(progress))
+        )
+        cursor.close()
+
+    def commit(self):
+        """Commit the quotes written since the last commit"""
+        with metrics.stage("commit"):
+            self.cnx.commit()
+
+    def rollback(self):
+        """Discard the quotes written since the last commit"""
+        self.cnx.rollback()
+
+    def merge_staged(self, cursor, count):
+        """
+        Merge the staged quotes into the quotes table. New quotes come with the sequence ids they were
+        given and are inserted, those without one are already present and update the quote of the
+        channel with the same content hash. Empties the staging table.
+        """
+        sql_update = """UPDATE quotes AS q SET author = s.author,
+                message = s.message,
+                source = s.source,
+                timestamp = s.timestamp,
+                type = s.type,
+                raw = s.raw,
+                attachment_name = s.attachment_name,
+                attachment = s.attachment
+            FROM staging_quotes AS s
+            WHERE s.sequence_id IS NULL
+                AND q.channel = s.channel AND q.content_hash = s.content_hash"""
+        sql_insert = """INSERT INTO quotes
+            (author, channel, message, sequence_id, source, timestamp, type, raw, attachment_name, attachment, content_hash)
+            SELECT author, channel, message, sequence_id, source, timestamp, type, raw, attachment_name, attachment, content_hash
+            FROM staging_quotes WHERE sequence_id IS NOT NULL"""
+
+        cursor.execute(sql_update)
+        cursor.execute(sql_insert)
+        inserted = cursor.rowcount
+        cursor.execute("DELETE FROM staging_quotes")
+        print(
+            "Merged %i new quotes, updated %i already present"
+            % (inserted, count - inserted)
+        )
+
     def initialize(self):
         """Create quotes table if it doesn't already exist"""
         sql = """
@@ -50,24 +270,84 @@ class PostgresDb:
                 raw text DEFAULT NULL,
                 attachment_name varchar DEFAULT NULL,
                 attachment bytea DEFAULT NULL,
+                content_hash varchar DEFAULT NULL,
                 UNIQUE (channel,sequence_id)
             )"""
+        # tables created before content hashes were introduced
+        sql_hash = "ALTER TABLE quotes ADD COLUMN IF NOT EXISTS content_hash varchar DEFAULT NULL"
+        sql_progress = """
+            CREATE TABLE IF NOT EXISTS import_progress (
+                channel varchar NOT NULL,
+                filename varchar NOT NULL,
+                progress text NOT NULL,
+                PRIMARY KEY (channel, filename)
+            )"""
+        sql_counters = """
+            CREATE TABLE IF NOT EXISTS sequence_counters (
+                channel varchar NOT NULL PRIMARY KEY,
+                last_sequence_id int NOT NULL
+            )"""
         cursor = self.cnx.cursor()
         cursor.execute(sql)
+        cursor.execute(sql_progress)
+        cursor.execute(sql_counters)
+        cursor.execute(sql_hash)
+        self.cnx.commit()
+        cursor.close()
+
+        # the indexes are missing if a bulk load was killed before it could build them
+        check_conflicts(self.create_indexes())
+
+    def drop_indexes(self):
+        """Drop the indexes of the quotes table for a bulk load"""
+        cursor = self.cnx.cursor()
+        # the unique index is a table constraint, unless create_indexes built it
+        cursor.execute(
+            "ALTER TABLE quotes DROP CONSTRAINT IF EXISTS quotes_channel_sequence_id_key"
+        )
+        cursor.execute("DROP INDEX IF EXISTS quotes_channel_sequence_id_key")
+        cursor.execute("DROP INDEX IF EXISTS quotes_channel_content_hash_idx")
+        self.indexes_dropped = True
+        self.cnx.commit()
+        cursor.close()
+
+    def create_indexes(self):
+        """
+        Build the indexes of the quotes table that are missing. Returns the channels and sequence ids used
+        by more than one quote, with their number of quotes, in which case the unique index is not built.
+        """
+        sql_has_index = """
+            SELECT COUNT(*) FROM pg_indexes
+            WHERE tablename = 'quotes' AND indexname = 'quotes_channel_sequence_id_key'"""
+        sql_conflicts = """
+            SELECT channel, sequence_id, COUNT(*) FROM quotes
+            GROUP BY channel, sequence_id HAVING COUNT(*) > 1
+            ORDER BY channel, sequence_id"""
+        sql_index = "CREATE UNIQUE INDEX quotes_channel_sequence_id_key ON quotes (channel, sequence_id)"
+        sql_hash_index = "CREATE INDEX IF NOT EXISTS quotes_channel_content_hash_idx ON quotes (channel, content_hash)"
+        cursor = self.cnx.cursor()
+        cursor.execute(sql_hash_index)
+        cursor.execute(sql_has_index)
+        (has_index,) = cursor.fetchone()
+        conflicts = []
+
+        if not has_index:
+            cursor.execute(sql_conflicts)
+            conflicts = cursor.fetchall()
+
+            if len(conflicts) == 0:
+                cursor.execute(sql_index)
+
+        self.indexes_dropped = False
         self.cnx.commit()
         cursor.close()
+        return conflicts
 
     def close(self):
         """Close the database connection"""
         self.cnx.close()
 
 
-def chunk(items, chunk_size):
-    """Split items into n chunks"""
-    for i in range(0, len(items), chunk_size):
-        yield items[i : i + chunk_size]
-
-
 def make_row(quote):
     return (
         quote.author,
@@ -80,4 +360,5 @@ def make_row(quote):
         quote.raw,
         quote.attachment.name if quote.attachment is not None else None,
         quote.attachment.content if quote.attachment is not None else None,
+        quote.content_hash,
     )
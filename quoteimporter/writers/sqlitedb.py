@@ -1,12 +1,31 @@
 """Read and write quotes to the database"""
+import json
 import sqlite3
+from datetime import datetime
+
+from quoteimporter import metrics
+from quoteimporter.indexes import check_conflicts
+from quoteimporter.writers.chunks import chunks
 
 
 class SqliteDb:
     """Wrap SQLite database access"""
 
+    # number of quotes sent to the database at a time, or None for all at once, tuned toward chunk_seconds
+    chunk_size = None
+
+    # most bytes of quotes sent to the database at a time
+    chunk_bytes = 64 * 2**20
+
+    # seconds it should take to write a chunk, or None to keep chunk_size fixed
+    chunk_seconds = 1.0
+
+    # how to merge quotes whose content hash is already in the channel, skip or update, or None to insert
+    merge = None
+
     def __init__(self, *args, **kwargs):
         self.cnx = sqlite3.connect(*args, **kwargs)
+        self.indexes_dropped = False  # during a bulk load, see reserve_sequence_ids
 
     def max_sequence_id(self, channel):
         """Gets the largest sequence id with the given channel, or 0"""
@@ -17,20 +36,217 @@ class SqliteDb:
         cursor.close()
         return seq_id if seq_id is not None else 0
 
-    def insert_all(self, quotes):
-        """Insert all given quotes"""
-        sql = """INSERT INTO quotes
-            (author, channel, message, sequence_id, source, timestamp, type, raw, attachment_name, attachment)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"""
+    def reserve_sequence_ids(self, channel, count):
+        """
+        Reserves the next count sequence ids of the channel and returns the first one. The counter is
+        updated in its own BEGIN IMMEDIATE transaction, which locks out other writers of the database,
+        so importers writing to the same channel at once get separate blocks.
+        """
+        sql_last = """
+            SELECT MAX(last_sequence_id) FROM (
+                SELECT last_sequence_id FROM sequence_counters WHERE channel = ?
+                UNION ALL
+                SELECT MAX(sequence_id) FROM quotes WHERE channel = ?
+            )"""
+        # without the index, finding the last quote scans the whole table, so only the counter is read,
+        # which bulk_insert brings up to date before dropping the indexes
+        sql_counter = """SELECT COALESCE(MAX(last_sequence_id), 0)
+            FROM sequence_counters WHERE channel = ?"""
+        sql_reserve = """INSERT OR REPLACE INTO sequence_counters
+            (channel, last_sequence_id) VALUES (?, ?)"""
+        cursor = self.cnx.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+        if self.indexes_dropped:
+            cursor.execute(sql_counter, (channel,))
+        else:
+            cursor.execute(sql_last, (channel, channel))
+        (last,) = cursor.fetchone()
+        first = (last or 0) + 1
+        cursor.execute(sql_reserve, (channel, first + count - 1))
+        self.cnx.commit()
+        cursor.close()
+        return first
+
+    def release_sequence_ids(self, channel, first, count):
+        """
+        Roll back a failed write of the quotes given a reserved block, and take the block back if no
+        later block of the channel was reserved since, so a failed batch doesn't leave a gap
+        """
+        sql = """UPDATE sequence_counters SET last_sequence_id = ?
+            WHERE channel = ? AND last_sequence_id = ?"""
+        self.cnx.rollback()
+        cursor = self.cnx.cursor()
+        cursor.execute(sql, (first - 1, channel, first + count - 1))
+        self.cnx.commit()
+        cursor.close()
+
+    def timeline(self, channel, since, until):
+        """
+        Gets the sequence ids and timestamps of the quotes of the channel from since until until, along
+        with the last quote before and the first quote after them, in order of sequence id
+        """
+        sql = """
+            SELECT sequence_id, timestamp FROM (
+                SELECT * FROM (
+                    SELECT sequence_id, timestamp FROM quotes
+                    WHERE channel = ? AND timestamp < ?
+                    ORDER BY sequence_id DESC LIMIT 1
+                )
+                UNION ALL
+                SELECT sequence_id, timestamp FROM quotes
+                WHERE channel = ? AND timestamp >= ? AND timestamp <= ?
+                UNION ALL
+                SELECT * FROM (
+                    SELECT sequence_id, timestamp FROM quotes
+                    WHERE channel = ? AND timestamp > ?
+                    ORDER BY sequence_id LIMIT 1
+                )
+            ) ORDER BY sequence_id"""
         cursor = self.cnx.cursor()
+        cursor.execute(sql, (channel, since, channel, since, until, channel, until))
+        rows = [
+            (sequence_id, datetime.fromisoformat(timestamp))
+            for (sequence_id, timestamp) in cursor.fetchall()
+        ]
+        cursor.close()
+        return rows
 
-        data = (make_row(quote) for quote in quotes)
-        cursor.executemany(sql, data)
-        print("Inserted %i" % len(quotes))
+    def sequence_ids_from(self, channel, first, page_size=1000):
+        """Gets the sequence ids of the channel from first on in order, a page at a time"""
+        sql = """SELECT sequence_id FROM quotes WHERE channel = ? AND sequence_id >= ?
+            ORDER BY sequence_id LIMIT ?"""
+        cursor = self.cnx.cursor()
 
+        while True:
+            cursor.execute(sql, (channel, first, page_size))
+            page = [sequence_id for (sequence_id,) in cursor.fetchall()]
+            yield from page
+
+            if len(page) < page_size:
+                break
+
+            first = page[-1] + 1
+
+        cursor.close()
+
+    def renumber(self, channel, first, last, amount):
+        """
+        Moves the quotes of the channel from sequence id first to last up by amount. They are moved to
+        negative sequence ids first, so the unique index never sees two quotes with the same one.
+        """
+        sql_move = """UPDATE quotes SET sequence_id = -(sequence_id + ?)
+            WHERE channel = ? AND sequence_id >= ? AND sequence_id <= ?"""
+        sql_restore = """UPDATE quotes SET sequence_id = -sequence_id
+            WHERE channel = ? AND sequence_id < 0"""
+        cursor = self.cnx.cursor()
+        cursor.execute(sql_move, (amount, channel, first, last))
+        cursor.execute(sql_restore, (channel,))
         self.cnx.commit()
         cursor.close()
 
+    def existing_hashes(self, channel, hashes):
+        """Gets the subset of the given content hashes that are already present in the channel"""
+        if len(hashes) == 0:
+            return set()
+
+        placeholders = ", ".join(["?"] * len(hashes))
+        sql = (
+            "SELECT content_hash FROM quotes WHERE channel = ? AND content_hash IN (%s)"
+            % placeholders
+        )
+        cursor = self.cnx.cursor()
+        cursor.execute(sql, (channel, *hashes))
+        existing = {content_hash for (content_hash,) in cursor.fetchall()}
+        cursor.close()
+        return existing
+
+    def load_progress(self, channel, filename):
+        """The progress marker committed with the last batch imported from the file, or None"""
+        sql = "SELECT progress FROM import_progress WHERE channel = ? AND filename = ?"
+        cursor = self.cnx.cursor()
+        cursor.execute(sql, (channel, filename))
+        row = cursor.fetchone()
+        cursor.close()
+        return json.loads(row[0]) if row is not None else None
+
+    def insert_all(self, quotes, progress=None):
+        """
+        Insert all given quotes in chunks, and commit them in one transaction
+        with the progress marker of the import, if given
+        """
+        sql_staging = """
+            CREATE TEMP TABLE IF NOT EXISTS staging_quotes AS
+            SELECT author, channel, message, sequence_id, source, timestamp, type, raw, attachment_name, attachment, content_hash
+            FROM quotes WHERE 0"""
+        table = "quotes" if self.merge is None else "staging_quotes"
+        sql = (
+            "INSERT INTO %s" % table
+            + """
+            (author, channel, message, sequence_id, source, timestamp, type, raw, attachment_name, attachment, content_hash)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"""
+        )
+        cursor = self.cnx.cursor()
+
+        if self.merge is not None:
+            cursor.execute(sql_staging)
+
+        for q_chunk in chunks(self, quotes):
+            with metrics.stage("serialize"):
+                data = [make_row(quote) for quote in q_chunk]
+            with metrics.stage("write"):
+                cursor.executemany(sql, data)
+
+        if self.merge is not None:
+            with metrics.stage("write"):
+                self.merge_staged(cursor, len(quotes))
+
+        if progress is not None:
+            sql_progress = """INSERT OR REPLACE INTO import_progress
+                (channel, filename, progress) VALUES (?, ?, ?)"""
+            cursor.execute(
+                sql_progress,
+                (progress["channel"], progress["filename"], json.dumps(progress)),
+            )
+
+        with metrics.stage("commit"):
+            self.cnx.commit()
+        cursor.close()
+
+    def rollback(self):
+        """Discard the quotes written since the last commit"""
+        self.cnx.rollback()
+
+    def merge_staged(self, cursor, count):
+        """
+        Merge the staged quotes into the quotes table. New quotes come with the sequence ids they were
+        given and are inserted, those without one are already present and update the quote of the
+        channel with the same content hash. Empties the staging table.
+        """
+        sql_update = """UPDATE quotes SET author = s.author,
+                message = s.message,
+                source = s.source,
+                timestamp = s.timestamp,
+                type = s.type,
+                raw = s.raw,
+                attachment_name = s.attachment_name,
+                attachment = s.attachment
+            FROM staging_quotes AS s
+            WHERE s.sequence_id IS NULL
+                AND quotes.channel = s.channel AND quotes.content_hash = s.content_hash"""
+        sql_insert = """INSERT INTO quotes
+            (author, channel, message, sequence_id, source, timestamp, type, raw, attachment_name, attachment, content_hash)
+            SELECT author, channel, message, sequence_id, source, timestamp, type, raw, attachment_name, attachment, content_hash
+            FROM staging_quotes WHERE sequence_id IS NOT NULL"""
+
+        cursor.execute(sql_update)
+        cursor.execute(sql_insert)
+        inserted = cursor.rowcount
+        cursor.execute("DELETE FROM staging_quotes")
+        print(
+            "Merged %i new quotes, updated %i already present"
+            % (inserted, count - inserted)
+        )
+
     def initialize(self):
         """Create quotes table if it doesn't already exist"""
         sql_table = """
@@ -45,18 +261,87 @@ class SqliteDb:
                 `type`	TEXT NOT NULL,
                 `raw`	TEXT DEFAULT NULL,
                 `attachment_name` TEXT DEFAULT NULL,
-                `attachment`  BLOB DEFAULT NULL
+                `attachment`  BLOB DEFAULT NULL,
+                `content_hash`  TEXT DEFAULT NULL
+            )"""
+        sql_progress = """
+            CREATE TABLE IF NOT EXISTS `import_progress` (
+                `channel`	TEXT NOT NULL,
+                `filename`	TEXT NOT NULL,
+                `progress`	TEXT NOT NULL,
+                PRIMARY KEY (`channel`, `filename`)
+            )"""
+        sql_counters = """
+            CREATE TABLE IF NOT EXISTS `sequence_counters` (
+                `channel`	TEXT NOT NULL PRIMARY KEY,
+                `last_sequence_id`	INTEGER NOT NULL
             )"""
+        cursor = self.cnx.cursor()
+        cursor.execute(sql_table)
+        cursor.execute(sql_progress)
+        cursor.execute(sql_counters)
+
+        # tables created before content hashes were introduced
+        cursor.execute("PRAGMA table_info(`quotes`)")
+        if "content_hash" not in [column[1] for column in cursor.fetchall()]:
+            cursor.execute(
+                "ALTER TABLE `quotes` ADD COLUMN `content_hash` TEXT DEFAULT NULL"
+            )
+
+        self.cnx.commit()
+        cursor.close()
+
+        # the indexes are missing if a bulk load was killed before it could build them
+        check_conflicts(self.create_indexes())
+
+    def drop_indexes(self):
+        """Drop the indexes of the quotes table for a bulk load"""
+        cursor = self.cnx.cursor()
+        cursor.execute("DROP INDEX IF EXISTS `IX_quotes_channel_sequence_id`")
+        cursor.execute("DROP INDEX IF EXISTS `IX_quotes_channel_content_hash`")
+        self.indexes_dropped = True
+        self.cnx.commit()
+        cursor.close()
+
+    def create_indexes(self):
+        """
+        Build the indexes of the quotes table that are missing. Returns the channels and sequence ids used
+        by more than one quote, with their number of quotes, in which case the unique index is not built.
+        """
+        sql_has_index = """
+            SELECT COUNT(*) FROM sqlite_master
+            WHERE type = 'index' AND name = 'IX_quotes_channel_sequence_id'"""
+        sql_conflicts = """
+            SELECT channel, sequence_id, COUNT(*) FROM quotes
+            GROUP BY channel, sequence_id HAVING COUNT(*) > 1
+            ORDER BY channel, sequence_id"""
         sql_index = """
-            CREATE UNIQUE INDEX IF NOT EXISTS `IX_quotes_channel_sequence_id` ON `quotes` (
+            CREATE UNIQUE INDEX `IX_quotes_channel_sequence_id` ON `quotes` (
                 `channel`,
                 `sequence_id`
             )"""
+        sql_hash_index = """
+            CREATE INDEX IF NOT EXISTS `IX_quotes_channel_content_hash` ON `quotes` (
+                `channel`,
+                `content_hash`
+            )"""
         cursor = self.cnx.cursor()
-        cursor.execute(sql_table)
-        cursor.execute(sql_index)
+        cursor.execute(sql_hash_index)
+        cursor.execute(sql_has_index)
+        (has_index,) = cursor.fetchone()
+        conflicts = []
+
+        if not has_index:
+            cursor.execute(sql_conflicts)
+            conflicts = cursor.fetchall()
+
+            if len(conflicts) == 0:
+                cursor.execute(sql_index)
+
+        self.indexes_dropped = False
         self.cnx.commit()
         cursor.close()
+        return conflicts
 
     def close(self):
         """Close the database connection"""
@@ -75,4 +360,5 @@ def make_row(quote):
         quote.raw,
         quote.attachment.name if quote.attachment is not None else None,
         quote.attachment.content if quote.attachment is not None else None,
+        quote.content_hash,
     )
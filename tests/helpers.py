@@ -0,0 +1,9 @@
+import io
+
+from quoteimporter import hash_quotes
+from quoteimporter.readers.irssi import IrssiLogReader
+
+
+def read_irssi(text):
+    reader = IrssiLogReader("#chan", 0, "")
+    return list(hash_quotes(reader.read(io.StringIO(text))))
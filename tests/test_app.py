@@ -1,6 +1,15 @@
 import io
-from quoteimporter import shift
+import json
+import sqlite3
+import threading
+
+import pytest
+from quoteimporter import batches, insert_batches, insert_quotes, shift
 from quoteimporter.readers.irssi import IrssiLogReader
+from quoteimporter.writers.jsonfile import JsonFile
+from quoteimporter.writers.sqlitedb import SqliteDb
+
+from tests.helpers import read_irssi
 
 
 def test_shift():
@@ -22,3 +31,194 @@ def test_shift():
     assert quotes[0].sequence_id == 123
     assert quotes[1].sequence_id == 124
     assert quotes[2].sequence_id == 125
+
+
+def test_hash_quotes_tells_identical_lines_apart():
+    quotes = read_irssi("20:56 <Cassie> lol\n" + "20:56 <Cassie> lol\n")
+
+    assert quotes[0].content_hash != quotes[1].content_hash
+
+
+def test_insert_quotes_skips_present_prefix():
+    writer = SqliteDb(":memory:")
+    writer.initialize()
+    old_export = "20:56 <Cassie> what the fuck\n" + "20:58 <ashin> also swear words\n"
+    new_export = old_export + "20:59 <ashin> also swear words\n" + "21:00 <Cassie> ok\n"
+
+    insert_quotes(writer, "#chan", read_irssi(old_export))
+    insert_quotes(writer, "#chan", read_irssi(new_export))
+    insert_quotes(writer, "#chan", read_irssi(new_export))
+
+    rows = writer.cnx.execute(
+        "SELECT sequence_id, message FROM quotes ORDER BY sequence_id"
+    ).fetchall()
+    writer.close()
+
+    assert rows == [
+        (1, "what the fuck"),
+        (2, "also swear words"),
+        (3, "also swear words"),
+        (4, "ok"),
+    ]
+
+
+def test_insert_batches_prints_start_once(capsys):
+    writer = SqliteDb(":memory:")
+    writer.initialize()
+    quotes = read_irssi("".join("20:5%i <Cassie> %i\n" % (i, i) for i in range(6)))
+    insert_quotes(writer, "#chan", quotes[:2])
+    capsys.readouterr()
+
+    insert_batches(writer, "#chan", batches(iter(quotes), 2))
+    writer.close()
+
+    # the first batch was already imported, so the import starts in the second one
+    out = capsys.readouterr().out
+    assert out.startswith("All 2 quotes are already present in #chan\n")
+    assert out.count("Starting at sequence id") == 1
+    assert "Starting at sequence id 3 for #chan" in out
+
+
+def test_json_file_written_once_on_close(tmp_path):
+    filename = str(tmp_path / "quotes.json")
+    old_export = "20:56 <Cassie> one\n" + "20:58 <ashin> two\n"
+    new_export = old_export + "21:00 <Cassie> three\n"
+
+    for export in [old_export, new_export]:
+        writer = JsonFile(filename)
+        writer.initialize()
+
+        for batch in batches(iter(read_irssi(export)), 1):
+            insert_quotes(writer, "#chan", batch)
+
+        writer.close()
+
+    with open(filename) as file:
+        json_quotes = json.load(file)
+
+    assert [(q["sequence_id"], q["message"]) for q in json_quotes] == [
+        (1, "one"),
+        (2, "two"),
+        (3, "three"),
+    ]
+
+
+def merge_logs(merge, first_log, second_log, edit=None):
+    writer = SqliteDb(":memory:")
+    writer.initialize()
+    writer.merge = merge
+    insert_quotes(writer, "#chan", read_irssi(first_log))
+    quotes = read_irssi(second_log)
+
+    # like a reader that parses the same lines differently now
+    for quote in quotes:
+        if edit is not None:
+            quote.message = edit(quote.message)
+
+    insert_quotes(writer, "#chan", quotes)
+    rows = writer.cnx.execute(
+        "SELECT sequence_id, message FROM quotes ORDER BY sequence_id"
+    ).fetchall()
+    writer.close()
+    return rows
+
+
+@pytest.mark.parametrize(
+    "merge,present", [("skip", ["also", "lol"]), ("update", ["ALSO", "LOL"])]
+)
+def test_insert_quotes_merges_overlapping_log(merge, present):
+    first_log = "20:56 <Cassie> wtf\n" + "20:58 <ashin> also\n" + "20:59 <a> lol\n"
+    second_log = "20:58 <ashin> also\n" + "20:59 <a> lol\n" + "21:00 <a> ok\n"
+
+    rows = merge_logs(merge, first_log, second_log, str.upper)
+
+    assert rows == [(1, "wtf"), (2, present[0]), (3, present[1]), (4, "OK")]
+
+
+def test_insert_quotes_merges_log_that_starts_earlier():
+    first_log = "20:58 <ashin> also\n" + "20:59 <a> lol\n"
+    second_log = "20:56 <Cassie> wtf\n" + first_log + "21:00 <a> ok\n"
+
+    rows = merge_logs("skip", first_log, second_log)
+
+    # the quotes already imported keep their sequence ids, the others are appended
+    assert rows == [(1, "also"), (2, "lol"), (3, "wtf"), (4, "ok")]
+
+
+def test_insert_quotes_merges_log_with_a_different_line():
+    first_log = "20:56 <Cassie> wtf\n" + "20:58 <ashin> also\n" + "20:59 <a> lol\n"
+    second_log = "20:56 <Cassie> wtf\n" + "20:58 <ashin> as well\n" + "20:59 <a> lol\n"
+
+    rows = merge_logs("update", first_log, second_log)
+
+    assert rows == [(1, "wtf"), (2, "also"), (3, "lol"), (4, "as well")]
+
+
+def test_concurrent_imports_reserve_sequence_ids(tmp_path):
+    database = str(tmp_path / "quotes.db")
+    SqliteDb(database).initialize()
+
+    def import_log(author):
+        writer = SqliteDb(database, timeout=30, check_same_thread=False)
+        log = "".join("20:%02i <%s> %i\n" % (i, author, i) for i in range(50))
+
+        for i in range(0, 50, 10):
+            insert_quotes(writer, "#chan", read_irssi(log)[i : i + 10], commit_every=5)
+
+        writer.close()
+
+    threads = [threading.Thread(target=import_log, args=(a,)) for a in ["a", "b", "c"]]
+
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    cnx = sqlite3.connect(database)
+    rows = cnx.execute("SELECT sequence_id FROM quotes ORDER BY sequence_id").fetchall()
+    cnx.close()
+
+    assert [sequence_id for (sequence_id,) in rows] == list(range(1, 151))
+
+
+def test_failed_batch_leaves_no_gap():
+    writer = SqliteDb(":memory:")
+    writer.initialize()
+    quotes = read_irssi("20:56 <a> 1\n" + "20:57 <b> 2\n")
+    insert_all = writer.insert_all
+    writer.insert_all = lambda batch: 1 / 0
+
+    with pytest.raises(ZeroDivisionError):
+        insert_quotes(writer, "#chan", quotes[:1])
+
+    writer.insert_all = insert_all
+    insert_quotes(writer, "#chan", quotes)
+
+    rows = writer.cnx.execute("SELECT sequence_id FROM quotes").fetchall()
+    assert rows == [(1,), (2,)]
+
+
+def test_sqlite_insert_all_in_chunks(capsys):
+    writer = SqliteDb(":memory:")
+    writer.chunk_size = 2
+    writer.chunk_seconds = None
+    writer.initialize()
+    writer.insert_all(read_irssi("20:56 <a> 1\n" + "20:57 <b> 2\n" + "20:58 <c> 3\n"))
+
+    (count,) = writer.cnx.execute("SELECT COUNT(*) FROM quotes").fetchone()
+    writer.close()
+
+    assert count == 3
+    assert [line.split(" (")[0] for line in capsys.readouterr().out.splitlines()] == [
+        "Inserted 2",
+        "Inserted 3",
+    ]
+
+
+def test_batches_by_bytes():
+    lines = ["20:5%i <a> %s\n" % (i, "x" * 100 * i) for i in range(5)]
+    quotes = read_irssi("".join(lines))
+    sizes = [len(batch) for batch in batches(iter(quotes), 3, batch_bytes=250)]
+
+    # the batch that crosses the byte budget is cut right after the quote that crossed it
+    assert sizes == [3, 1, 1]
@@ -0,0 +1,77 @@
+import bz2
+import gzip
+import json
+import lzma
+import zipfile
+
+import pytest
+from quoteimporter import read_quotes
+from quoteimporter.__main__ import parse_args
+from quoteimporter.batch import infer_channel
+from quoteimporter.models import QuoteType
+
+irssi_log = (
+    "--- Log opened Sat Jul 22 20:00:00 2017\n"
+    + "20:51 <Cassie> one\n"
+    + "20:52 <Cassie> two\n"
+)
+
+
+def make_args(log_type, filename):
+    return parse_args([log_type, "#chan", filename])
+
+
+@pytest.mark.parametrize(
+    "extension,module", [(".gz", gzip), (".xz", lzma), (".bz2", bz2)]
+)
+def test_compressed(tmp_path, extension, module):
+    log_file = tmp_path / ("chan.log" + extension)
+    log_file.write_bytes(module.compress(irssi_log.encode()))
+
+    quotes = read_quotes(make_args("irssi", str(log_file)))
+    assert [q.message for q in quotes] == ["one", "two"]
+
+
+def test_whatsapp_zip(tmp_path):
+    archive = tmp_path / "WhatsApp Chat.zip"
+
+    with zipfile.ZipFile(archive, "w") as file:
+        file.writestr(
+            "_chat.txt",
+            "22/07/2017, 20:51 - Cassie: hi\n"
+            + "22/07/2017, 20:52 - Cassie: <attached: photo.jpg>\n",
+        )
+        file.writestr("photo.jpg", b"\x01\x02\x03")
+
+    quotes = read_quotes(make_args("whatsapp", str(archive)))
+
+    assert [q.message for q in quotes] == ["hi", "<attached: photo.jpg>"]
+    assert quotes[1].attachment.content == b"\x01\x02\x03"
+    assert list(tmp_path.iterdir()) == [archive]
+
+
+def test_telegram_zip(tmp_path):
+    archive = tmp_path / "export.zip"
+    message = {
+        "id": 1,
+        "type": "message",
+        "date": "2017-07-22T20:51:00",
+        "from": "Cassie",
+        "file": "voice_messages/voice.ogg",
+        "media_type": "voice_message",
+        "text": "",
+    }
+
+    with zipfile.ZipFile(archive, "w") as file:
+        file.writestr("ChatExport/result.json", json.dumps({"messages": [message]}))
+        file.writestr("ChatExport/voice_messages/voice.ogg", b"\x01\x02\x03")
+
+    quotes = read_quotes(make_args("telegram", str(archive)))
+
+    assert quotes[0].quote_type == QuoteType.attachment
+    assert quotes[0].attachment.content == b"\x01\x02\x03"
+
+
+def test_infer_compressed_channel():
+    assert infer_channel("/logs/#chan-2017-07-22.log.gz") == "#chan"
+    assert infer_channel("/logs/#chan/20170722.log.xz") == "#chan"
@@ -0,0 +1,80 @@
+import sqlite3
+
+import pytest
+from quoteimporter.__main__ import parse_batch_args
+from quoteimporter.batch import (
+    LogFile,
+    find_logs,
+    import_tree,
+    infer_channel,
+    schedule,
+)
+
+
+@pytest.mark.parametrize(
+    "path, channel",
+    [
+        ("irclogs/net/#chan.log", "#chan"),
+        ("irclogs/net/#chan.20170722.log", "#chan"),
+        ("irclogs/net/#chan-2017-07-22.log", "#chan"),
+        ("irclogs/net/#chan.with.dots.log", "#chan.with.dots"),
+        ("irclogs/net/#chan/2017-07-22.log", "#chan"),
+        ("irclogs/net/someone.log", "someone"),
+    ],
+)
+def test_infer_channel(path, channel):
+    assert infer_channel(path) == channel
+
+
+def test_find_logs(tmp_path):
+    (tmp_path / "net").mkdir()
+    (tmp_path / "net" / "#b.log").write_text("")
+    (tmp_path / "net" / "#a").mkdir()
+    (tmp_path / "net" / "#a" / "2017-07-23.log").write_text("")
+    (tmp_path / "net" / "#a" / "2017-07-22.log").write_text("")
+    (tmp_path / "net" / "#c.log.gz").write_text("")
+    (tmp_path / "net" / "notes.txt").write_text("")
+
+    channels = find_logs(str(tmp_path))
+
+    assert sorted(channels) == ["#a", "#b", "#c"]
+    assert [f.path for f in channels["#a"]] == [
+        str(tmp_path / "net" / "#a" / "2017-07-22.log"),
+        str(tmp_path / "net" / "#a" / "2017-07-23.log"),
+    ]
+
+
+def test_schedule_keeps_channels_in_path_order():
+    channels = {
+        "#a": [LogFile("a1", "#a", 10), LogFile("a2", "#a", 1000)],
+        "#b": [LogFile("b1", "#b", 500)],
+    }
+
+    tasks = schedule(channels)
+
+    assert [log_file.path for (_, _, log_file) in tasks] == ["a1", "b1", "a2"]
+
+
+def test_import_tree(tmp_path, monkeypatch):
+    (tmp_path / "#chan").mkdir()
+    (tmp_path / "#chan" / "2017-07-22.log").write_text(
+        "--- Log opened Sat Jul 22 20:00:00 2017\n20:56 <Cassie> first\n"
+    )
+    (tmp_path / "#chan" / "2017-07-23.log").write_text(
+        "--- Log opened Sun Jul 23 20:00:00 2017\n"
+        + "".join("20:5%i <Matt> line %i\n" % (i, i) for i in range(10))
+    )
+    monkeypatch.chdir(tmp_path)
+    args = parse_batch_args(["--writer", "sqlite", "irssi", str(tmp_path)])
+
+    import_tree(args, str(tmp_path), workers=2)
+
+    cnx = sqlite3.connect(str(tmp_path / "quotes.db"))
+    rows = cnx.execute(
+        "SELECT sequence_id, message FROM quotes WHERE channel = '#chan' ORDER BY sequence_id"
+    ).fetchall()
+    cnx.close()
+
+    assert len(rows) == 11
+    assert rows[0] == (1, "first")
+    assert rows[1] == (2, "line 0")
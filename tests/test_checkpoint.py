@@ -0,0 +1,182 @@
+import io
+import sqlite3
+
+import pytest
+from quoteimporter import checkpoint as checkpoints
+from quoteimporter.__main__ import parse_args
+from quoteimporter.checkpoint import import_with_checkpoints, load_checkpoint
+from quoteimporter.lines import LineSource
+from quoteimporter.readers.nda import NdaLogReader
+from quoteimporter.writers.sqlitedb import SqliteDb
+
+
+def make_args(filename, checkpoint, *options):
+    argv = ["--writer", "sqlite", "--checkpoint", checkpoint, "--commit-every", "2"]
+    return parse_args(argv + [*options, "irssi", "#chan", filename])
+
+
+def test_line_source_offset():
+    stream = io.BytesIO("first\nsecond ø\r\nthird".encode("utf-8"))
+    lines = LineSource(stream)
+    iterator = iter(lines)
+
+    assert next(iterator) == "first\n"
+    assert lines.offset == 6
+    assert next(iterator) == "second ø\r\n"
+    assert lines.offset == 17
+
+
+def test_nda_state():
+    lines = io.StringIO("2017-07-22 20:56:39.123456 Sending NICK nda_\n")
+    reader = NdaLogReader("#chan", "nda")
+    list(reader.read(lines))
+    state = reader.state()
+
+    lines = io.StringIO("2017-07-22 20:56:40.123456 Sending hi to #chan\n")
+    quote = next(NdaLogReader("#chan", "nda").read(lines, state=state))
+    assert quote.author == "nda_"
+
+
+def test_resume(tmp_path, monkeypatch):
+    log_file = tmp_path / "chan.log"
+    log_file.write_text(
+        "--- Day changed Sat Jul 22 2017\n"
+        + "20:51 <Cassie> one\n"
+        + "20:52 <Cassie> two\n"
+        + "--- Day changed Sun Jul 23 2017\n"
+        + "20:53 <Cassie> three\n"
+        + "20:54 <Cassie> four\n"
+        + "20:55 <Cassie> five\n"
+    )
+    checkpoint_file = str(tmp_path / "checkpoint.json")
+    monkeypatch.chdir(tmp_path)
+
+    insert_all = SqliteDb.insert_all
+
+    def crash_on_second_batch(self, quotes, progress=None):
+        if quotes[0].message == "three":
+            raise IOError("crashed")
+        insert_all(self, quotes, progress)
+
+    monkeypatch.setattr(SqliteDb, "insert_all", crash_on_second_batch)
+
+    with pytest.raises(IOError):
+        import_with_checkpoints(make_args(str(log_file), checkpoint_file))
+
+    checkpoint = load_checkpoint(checkpoint_file)
+    assert checkpoint.sequence_id == 2
+    assert checkpoint.state == {"date": "2017-07-22T00:00:00"}
+
+    monkeypatch.setattr(SqliteDb, "insert_all", insert_all)
+    import_with_checkpoints(make_args(str(log_file), checkpoint_file, "--resume"))
+
+    cnx = sqlite3.connect(str(tmp_path / "quotes.db"))
+    rows = cnx.execute(
+        "SELECT sequence_id, message, timestamp FROM quotes ORDER BY sequence_id"
+    ).fetchall()
+    cnx.close()
+
+    assert [row[:2] for row in rows] == [
+        (1, "one"),
+        (2, "two"),
+        (3, "three"),
+        (4, "four"),
+        (5, "five"),
+    ]
+    assert rows[2][2].startswith("2017-07-23")
+    assert load_checkpoint(checkpoint_file).sequence_id == 5
+
+
+def test_resume_from_committed_progress(tmp_path, monkeypatch):
+    log_file = tmp_path / "chan.log"
+    log_file.write_text(
+        "--- Day changed Sat Jul 22 2017\n"
+        + "".join("20:5%i <Cassie> %i\n" % (i, i) for i in range(5))
+    )
+    checkpoint_file = str(tmp_path / "checkpoint.json")
+    monkeypatch.chdir(tmp_path)
+
+    save_checkpoint = checkpoints.save_checkpoint
+
+    def crash_after_second_commit(path, checkpoint):
+        if checkpoint.sequence_id == 4:
+            raise IOError("crashed")
+        save_checkpoint(path, checkpoint)
+
+    monkeypatch.setattr(checkpoints, "save_checkpoint", crash_after_second_commit)
+
+    with pytest.raises(IOError):
+        import_with_checkpoints(make_args(str(log_file), checkpoint_file))
+
+    # the file is a batch behind the database, which has the batch and its progress marker
+    assert load_checkpoint(checkpoint_file).sequence_id == 2
+
+    monkeypatch.setattr(checkpoints, "save_checkpoint", save_checkpoint)
+    import_with_checkpoints(make_args(str(log_file), checkpoint_file, "--resume"))
+
+    cnx = sqlite3.connect(str(tmp_path / "quotes.db"))
+    rows = cnx.execute("SELECT sequence_id, message FROM quotes ORDER BY sequence_id")
+    assert rows.fetchall() == [(i + 1, str(i)) for i in range(5)]
+    cnx.close()
+
+
+def crash_on_second_batch(tmp_path, monkeypatch):
+    """Import a log of five quotes in batches of two, crashing after the first one"""
+    log_file = tmp_path / "chan.log"
+    log_file.write_text(
+        "--- Day changed Sat Jul 22 2017\n"
+        + "".join("20:5%i <Cassie> %i\n" % (i, i) for i in range(5))
+    )
+    checkpoint_file = str(tmp_path / "checkpoint.json")
+    monkeypatch.chdir(tmp_path)
+    insert_all = SqliteDb.insert_all
+
+    def crashing_insert_all(self, quotes, progress=None):
+        if quotes[0].message == "2":
+            raise IOError("crashed")
+        insert_all(self, quotes, progress)
+
+    monkeypatch.setattr(SqliteDb, "insert_all", crashing_insert_all)
+
+    with pytest.raises(IOError):
+        import_with_checkpoints(make_args(str(log_file), checkpoint_file))
+
+    monkeypatch.setattr(SqliteDb, "insert_all", insert_all)
+    return make_args(str(log_file), checkpoint_file, "--resume")
+
+
+def test_resume_after_other_imports(tmp_path, monkeypatch):
+    args = crash_on_second_batch(tmp_path, monkeypatch)
+    # another import appended to the channel in the meantime
+    cnx = sqlite3.connect(str(tmp_path / "quotes.db"))
+    cnx.execute(
+        "INSERT INTO quotes (channel, sequence_id, timestamp, type, message) VALUES ('#chan', 3, '', '', 'other')"
+    )
+    cnx.commit()
+
+    import_with_checkpoints(args)
+
+    rows = cnx.execute("SELECT sequence_id, message FROM quotes ORDER BY sequence_id")
+    assert rows.fetchall() == [
+        (1, "0"),
+        (2, "1"),
+        (3, "other"),
+        (4, "2"),
+        (5, "3"),
+        (6, "4"),
+    ]
+    cnx.close()
+
+
+def test_resume_needs_the_quote_of_the_checkpoint(tmp_path, monkeypatch):
+    args = crash_on_second_batch(tmp_path, monkeypatch)
+    cnx = sqlite3.connect(str(tmp_path / "quotes.db"))
+    cnx.execute("DELETE FROM quotes WHERE sequence_id = 2")
+    cnx.execute(
+        "INSERT INTO quotes (channel, sequence_id, timestamp, type, message) VALUES ('#chan', 3, '', '', 'other')"
+    )
+    cnx.commit()
+    cnx.close()
+
+    with pytest.raises(Exception, match="at sequence id 2, but #chan has no quote"):
+        import_with_checkpoints(args)
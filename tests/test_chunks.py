@@ -0,0 +1,49 @@
+import time
+
+from quoteimporter.writers.chunks import chunks
+from quoteimporter.writers.sqlitedb import SqliteDb
+
+from tests.helpers import read_irssi
+
+
+def make_writer(chunk_size, chunk_bytes=None, chunk_seconds=None):
+    writer = SqliteDb(":memory:")
+    writer.chunk_size = chunk_size
+    writer.chunk_bytes = chunk_bytes
+    writer.chunk_seconds = chunk_seconds
+    return writer
+
+
+def test_chunks_by_bytes():
+    lines = ["20:5%i <a> %s\n" % (i, "x" * 100 * i) for i in range(5)]
+    quotes = read_irssi("".join(lines))
+    sizes = [len(chunk) for chunk in chunks(make_writer(None, 250), quotes)]
+
+    # a quote bigger than the budget is sent on its own
+    assert sizes == [3, 1, 1]
+
+
+def test_chunk_size_adapts_to_latency(capsys):
+    quotes = read_irssi("".join("20:56 <a> %i\n" % i for i in range(40)))
+    writer = make_writer(4, chunk_seconds=0.01)
+    sizes = []
+
+    for chunk in chunks(writer, quotes):
+        sizes.append(len(chunk))
+
+        # fast chunks grow, but at most by doubling, then a slow one shrinks it by half
+        if len(sizes) == 3:
+            time.sleep(0.05)
+
+    assert sizes[:4] == [4, 8, 16, 8]
+    assert sum(sizes) == 40
+    assert "(chunk of 16 quotes" in capsys.readouterr().out
+
+
+def test_short_chunk_keeps_chunk_size(capsys):
+    quotes = read_irssi("".join("20:56 <a> %i\n" % i for i in range(5)))
+    writer = make_writer(4, chunk_seconds=10)
+
+    # the last chunk of a batch is short but fast, which says nothing about full chunks
+    assert [len(chunk) for chunk in chunks(writer, quotes)] == [4, 1]
+    assert writer.chunk_size == 8
@@ -0,0 +1,66 @@
+import os
+
+import pytest
+from quoteimporter.follow import FollowSource
+
+
+class StopFollowing(Exception):
+    pass
+
+
+def follow_lines(path, steps):
+    """Read lines from a FollowSource, running the next step whenever it runs out of data"""
+    steps = iter(steps)
+
+    def on_idle():
+        step = next(steps, None)
+        if step is None:
+            raise StopFollowing()
+        step()
+
+    source = FollowSource(str(path), poll_interval=0, on_idle=on_idle)
+    lines = []
+
+    with pytest.raises(StopFollowing):
+        for line in source:
+            lines.append(line)
+
+    return lines
+
+
+def append(path, text):
+    def step():
+        with open(path, "a") as f:
+            f.write(text)
+
+    return step
+
+
+def test_follow_appended_lines(tmp_path):
+    path = tmp_path / "chan.log"
+    path.write_text("first\n")
+
+    lines = follow_lines(path, [append(path, "sec"), append(path, "ond\nthird\n")])
+
+    assert lines == ["first\n", "second\n", "third\n"]
+
+
+def test_follow_rotation(tmp_path):
+    path = tmp_path / "chan.log"
+    path.write_text("old\n")
+
+    def rotate():
+        os.rename(path, tmp_path / "chan.log.1")
+
+    lines = follow_lines(path, [rotate, append(path, "new\n"), lambda: None])
+
+    assert lines == ["old\n", "new\n"]
+
+
+def test_follow_truncation(tmp_path):
+    path = tmp_path / "chan.log"
+    path.write_text("old line\n")
+
+    lines = follow_lines(path, [lambda: path.write_text("new\n"), lambda: None])
+
+    assert lines == ["old line\n", "new\n"]
@@ -0,0 +1,108 @@
+import sqlite3
+
+from quoteimporter import import_quotes
+from quoteimporter.__main__ import parse_args
+from quoteimporter.gaps import backfill
+from quoteimporter.writers.sqlitedb import SqliteDb
+
+from tests.helpers import read_irssi
+
+log_opened = "--- Log opened Sat Jul 22 20:00:00 2017\n"
+
+
+def make_args(filename, *options):
+    argv = ["--writer", "sqlite", "--sequence-gap", "10", *options]
+    return parse_args(argv + ["irssi", "#chan", filename])
+
+
+def timeline(cnx):
+    sql = "SELECT sequence_id, message FROM quotes ORDER BY sequence_id"
+    return cnx.execute(sql).fetchall()
+
+
+def test_backfill_fills_gaps(tmp_path, monkeypatch, capsys):
+    monkeypatch.chdir(tmp_path)
+    newer_log = tmp_path / "newer.log"
+    newer_log.write_text(log_opened + "20:51 <a> b\n20:53 <a> d\n20:55 <a> f\n")
+    older_log = tmp_path / "older.log"
+    older_log.write_text(
+        log_opened + "20:50 <a> a\n20:51 <a> b\n20:52 <a> c\n20:54 <a> e\n20:56 <a> g\n"
+    )
+
+    import_quotes(make_args(str(newer_log)))
+    import_quotes(make_args(str(older_log), "--backfill"))
+
+    cnx = sqlite3.connect(str(tmp_path / "quotes.db"))
+
+    # the quote already imported is skipped, and newer quotes are appended gap apart
+    assert timeline(cnx) == [
+        (5, "a"),
+        (10, "b"),
+        (15, "c"),
+        (20, "d"),
+        (25, "e"),
+        (30, "f"),
+        (40, "g"),
+    ]
+    assert "Renumbered" not in capsys.readouterr().out
+
+
+def test_backfill_commits_like_other_imports(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    log_file = tmp_path / "chan.log"
+    log_file.write_text(log_opened + "20:50 <a> a\n20:51 <a> b\n")
+    calls = []
+    monkeypatch.setattr(
+        "quoteimporter.gaps.backfill",
+        lambda writer, channel, quotes, *commit: calls.append(commit),
+    )
+
+    options = ["--backfill", "--commit-every", "50000", "--commit-bytes", "1MB"]
+    import_quotes(make_args(str(log_file), *options))
+
+    assert calls == [(50000, 2**20)]
+
+
+def test_backfill_renumbers_up_to_next_gap(capsys):
+    writer = SqliteDb(":memory:")
+    writer.initialize()
+    writer.sequence_gap = 2
+    writer.cnx.executemany(
+        "INSERT INTO quotes (channel, sequence_id, timestamp, type, message) VALUES ('#chan', ?, ?, '', ?)",
+        [
+            (2, "2017-07-22 20:51:00+00:00", "b"),
+            (4, "2017-07-22 20:53:00+00:00", "f"),
+            (6, "2017-07-22 20:55:00+00:00", "g"),
+            (100, "2017-07-22 20:57:00+00:00", "h"),
+        ],
+    )
+
+    quotes = read_irssi(log_opened + "20:52 <a> c\n20:52 <a> d\n20:52 <a> e\n")
+    backfill(writer, "#chan", quotes)
+
+    assert timeline(writer.cnx) == [
+        (2, "b"),
+        (4, "c"),
+        (6, "d"),
+        (8, "e"),
+        (10, "f"),
+        (12, "g"),
+        (100, "h"),
+    ]
+    assert "Renumbered sequence ids 4 to 6 of #chan by 6" in capsys.readouterr().out
+
+
+def test_merge_appends_gap_apart(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    first_log = tmp_path / "first.log"
+    first_log.write_text(log_opened + "20:50 <a> a\n20:51 <a> b\n20:52 <a> c\n")
+    second_log = tmp_path / "second.log"
+    second_log.write_text(log_opened + "20:51 <a> b\n20:52 <a> c\n20:53 <a> d\n")
+
+    import_quotes(make_args(str(first_log)))
+    import_quotes(make_args(str(second_log), "--merge", "skip"))
+
+    cnx = sqlite3.connect(str(tmp_path / "quotes.db"))
+
+    # the quotes already imported keep their sequence ids, and the new one is appended a gap after them
+    assert timeline(cnx) == [(10, "a"), (20, "b"), (30, "c"), (40, "d")]
@@ -0,0 +1,76 @@
+import os
+
+import pytest
+from benchmarks.generate import GeneratorOptions, formats, generate, generate_channels
+from benchmarks.readers import make_reader
+from quoteimporter.readers.whatsapp.models import DateOrder, WhatsAppOptions
+from quoteimporter.readers.whatsapp.reader import WhatsAppLogReader
+
+
+def read(log_format, filename, reader=None):
+    reader = reader if reader is not None else make_reader(log_format)
+    with open(filename, encoding="utf-8") as stream:
+        return list(reader.read(stream))
+
+
+@pytest.mark.parametrize("log_format", formats)
+def test_generated_logs_parse_cleanly(log_format, tmp_path, capsys):
+    filename = str(tmp_path / "log")
+    options = GeneratorOptions(glitch_rate=0.05)
+    lines = generate(log_format, filename, 50000, seed=1, options=options)
+    quotes = read(log_format, filename)
+
+    assert lines > 0
+    assert len(quotes) > 0
+    assert "Unknown" not in capsys.readouterr().out
+
+
+@pytest.mark.parametrize("log_format", ["irssi", "hexchat", "nda", "telegram"])
+def test_unknown_lines(log_format, tmp_path, capsys):
+    filename = str(tmp_path / "log")
+    generate(log_format, filename, 20000, seed=1, options=GeneratorOptions(unknown_rate=0.1))
+    read(log_format, filename)
+
+    assert "Unknown" in capsys.readouterr().out
+
+
+@pytest.mark.parametrize("variant", ["android", "ios"])
+@pytest.mark.parametrize("date_order", [DateOrder.standard, DateOrder.american])
+def test_whatsapp_variants(variant, date_order, tmp_path, capsys):
+    filename = str(tmp_path / "_chat.txt")
+    options = GeneratorOptions(
+        multiline_rate=0.2,
+        attachment_rate=0.2,
+        attachment_size=10,
+        variant=variant,
+        date_order=date_order,
+    )
+    generate("whatsapp", filename, 20000, seed=2, options=options)
+    reader = WhatsAppLogReader(
+        WhatsAppOptions("#chan", date_order=date_order, attachment_dir=str(tmp_path))
+    )
+    quotes = read("whatsapp", filename, reader)
+    attachments = [q.attachment for q in quotes if q.attachment is not None]
+
+    assert "Unknown" not in capsys.readouterr().out
+    assert quotes[0].timestamp.month == 7 and quotes[0].timestamp.day == 22
+    assert any("\n" in q.message for q in quotes)
+    assert len(attachments) > 0
+    assert all(len(a.content) == 10 for a in attachments)
+
+
+def test_generate_channels(tmp_path):
+    options = GeneratorOptions(attachment_rate=0.5, attachment_size=10)
+    generate_channels("telegram", str(tmp_path), 20000, 3, options=options)
+
+    for i in range(3):
+        export_dir = tmp_path / ("chan%i" % i)
+        assert os.path.isfile(export_dir / "result.json")
+        assert len(os.listdir(export_dir)) > 1  # media folders
+
+
+def test_generate_is_reproducible(tmp_path):
+    generate("irssi", str(tmp_path / "a"), 10000, seed=3)
+    generate("irssi", str(tmp_path / "b"), 10000, seed=3)
+
+    assert (tmp_path / "a").read_bytes() == (tmp_path / "b").read_bytes()
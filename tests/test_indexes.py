@@ -0,0 +1,111 @@
+import sqlite3
+
+import pytest
+from quoteimporter import bulk_insert, import_quotes
+from quoteimporter.__main__ import parse_args
+from quoteimporter.indexes import deferred_indexes
+from quoteimporter.writers.sqlitedb import SqliteDb
+
+from tests.helpers import read_irssi
+
+irssi_log = "--- Log opened Sat Jul 22 20:00:00 2017\n" + "".join(
+    "20:5%i <Cassie> line %i\n" % (i, i) for i in range(5)
+)
+
+
+def make_args(filename):
+    argv = ["--writer", "sqlite", "--commit-every", "2", "--defer-indexes"]
+    return parse_args(argv + ["irssi", "#chan", filename])
+
+
+def index_names(cnx):
+    rows = cnx.execute("SELECT name FROM sqlite_master WHERE type = 'index'").fetchall()
+    return {name for (name,) in rows if name.startswith("IX_")}
+
+
+def insert_rows(writer, sequence_ids):
+    writer.cnx.executemany(
+        "INSERT INTO quotes (channel, sequence_id, timestamp, type) VALUES ('#chan', ?, '', '')",
+        [(sequence_id,) for sequence_id in sequence_ids],
+    )
+
+
+def test_bulk_import(tmp_path, monkeypatch, capsys):
+    log_file = tmp_path / "chan.log"
+    log_file.write_text(irssi_log)
+    monkeypatch.chdir(tmp_path)
+
+    import_quotes(make_args(str(log_file)))
+    import_quotes(make_args(str(log_file)))
+
+    cnx = sqlite3.connect(str(tmp_path / "quotes.db"))
+    rows = cnx.execute("SELECT sequence_id FROM quotes ORDER BY sequence_id").fetchall()
+
+    assert rows == [(1,), (2,), (3,), (4,), (5,)]
+    assert index_names(cnx) == {
+        "IX_quotes_channel_sequence_id",
+        "IX_quotes_channel_content_hash",
+    }
+    assert "already has quotes from this log" in capsys.readouterr().out
+
+
+def test_indexes_rebuilt_after_interruption():
+    writer = SqliteDb(":memory:")
+    writer.initialize()
+
+    with pytest.raises(KeyboardInterrupt):
+        with deferred_indexes(writer):
+            assert index_names(writer.cnx) == set()
+            raise KeyboardInterrupt()
+
+    assert len(index_names(writer.cnx)) == 2
+
+
+def test_failed_batch_rolled_back_before_building_indexes():
+    writer = SqliteDb(":memory:")
+    writer.initialize()
+    writer.chunk_size = 2
+    writer.chunk_seconds = None
+    quotes = read_irssi(irssi_log)
+    # the third chunk fails, after the first two were written in the same transaction
+    quotes[4].channel = None
+
+    with pytest.raises(sqlite3.IntegrityError):
+        bulk_insert(writer, "#chan", iter([quotes]))
+
+    assert writer.cnx.execute("SELECT COUNT(*) FROM quotes").fetchone() == (0,)
+    assert len(index_names(writer.cnx)) == 2
+
+
+def test_bulk_load_reserves_sequence_ids():
+    writer = SqliteDb(":memory:")
+    writer.initialize()
+    quotes = read_irssi(irssi_log)
+    # another import of the channel has reserved a block it is still writing
+    writer.reserve_sequence_ids("#chan", 10)
+
+    bulk_insert(writer, "#chan", iter([quotes[:2], quotes[2:]]))
+
+    rows = writer.cnx.execute("SELECT sequence_id FROM quotes ORDER BY sequence_id")
+    assert rows.fetchall() == [(11,), (12,), (13,), (14,), (15,)]
+    assert writer.reserve_sequence_ids("#chan", 1) == 16
+
+
+def test_conflict_report(capsys):
+    writer = SqliteDb(":memory:")
+    writer.initialize()
+
+    with pytest.raises(Exception, match="1 sequence ids are used more than once"):
+        with deferred_indexes(writer):
+            insert_rows(writer, [1, 2, 2])
+
+    assert "Sequence id 2 of #chan is used by 2 quotes" in capsys.readouterr().err
+    assert index_names(writer.cnx) == {"IX_quotes_channel_content_hash"}
+
+    # the next import doesn't start until the duplicates are gone
+    with pytest.raises(Exception, match="unique index"):
+        writer.initialize()
+
+    writer.cnx.execute("DELETE FROM quotes WHERE id = 3")
+    writer.initialize()
+    assert len(index_names(writer.cnx)) == 2
@@ -51,6 +51,14 @@ def test_leave():
     assert quote.message == "bye"
 
 
+def test_adversarial_leave():
+    """A line that used to backtrack for minutes"""
+    line = "20:56 -!- " + "a [b] has left c [" * 2000
+    reader = IrssiLogReader("", 0, "")
+    quote = next(reader.read(io.StringIO(line)))
+    assert quote.quote_type == QuoteType.system
+
+
 def test_kick():
     lines = io.StringIO("20:56 -!- anyname was kicked from #chan by ashin [fuck off]")
     reader = IrssiLogReader("", 0, "")
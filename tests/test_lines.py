@@ -0,0 +1,80 @@
+import pytest
+from quoteimporter import rejects
+from quoteimporter.lines import LineSource
+from quoteimporter.readers.hexchat import HexChatLogReader
+from quoteimporter.readers.irssi import IrssiLogReader
+from quoteimporter.readers.nda import NdaLogReader
+from quoteimporter.rejects import Rejects
+
+logs = {
+    "irssi": (
+        lambda: IrssiLogReader("#chan", 0, "You"),
+        b"--- Log opened Sat Jul 22 20:00:00 2017\n"
+        + b"20:51 <Cassie> one\r\n"
+        + b"20:52 <Cassie> caf\xc3\xa9\n"
+        + b"20:53 <Cassie> bad \xff\xfe bytes\r\r\n"
+        + b"20:54 -!- Cassie [~c@host] has quit [bye]\n"
+        + b"\n"
+        + b"20:55 something unknown\n"
+        + b"20:56 <Matt>\xc2\xa0hi\n"
+        + b"20:57 <Matt> last",
+    ),
+    "hexchat": (
+        lambda: HexChatLogReader("#chan", 0, "You"),
+        b"**** BEGIN LOGGING AT Sat Jul 22 20:00:00 2017\n"
+        + b"\n"
+        + b"Jul 22 20:51:00 <Cassie>\tone\r\n"
+        + b"Jul 22 20:52:00 <Cassie>\tcaf\xc3\xa9\n"
+        + b"Jul 22 20:53:00 something unknown \xff\n"
+        + b"Jul 22 20:54:00 *\tMatt waves\n",
+    ),
+    "nda": (
+        lambda: NdaLogReader("#chan", "nda"),
+        b"2017-07-22 20:51:00.000000 Sending hi to #chan\n"
+        + b"2017-07-22 20:52:00.000000 :Matt!m@host PRIVMSG #other :elsewhere\n"
+        + b"2017-07-22 20:53:00.000000 :Matt!m@host PRIVMSG #chan :caf\xc3\xa9\r\n"
+        + b"2017-07-22 20:54:00.000000 :Matt!m@host PART #chan\n",
+    ),
+}
+
+
+def read(log_format, lines, skip):
+    rejects.active = Rejects()
+
+    try:
+        quotes = list(logs[log_format][0]().read(lines, skip))
+        return (quotes, rejects.active.count, lines.offset)
+    finally:
+        rejects.active = None
+
+
+expected = {
+    "irssi": (["one", "caf\u00e9", "bad \ufffd\ufffd bytes", "bye", "last"], 3),
+    "hexchat": (["one", "caf\u00e9", "waves"], 1),
+    "nda": (["hi", "caf\u00e9", ""], 0),
+}
+
+
+@pytest.mark.parametrize("log_format", list(logs))
+def test_read_lines(tmp_path, log_format):
+    log_file = tmp_path / "chan.log"
+    log_file.write_bytes(logs[log_format][1])
+
+    with open(log_file, "rb") as stream:
+        (quotes, unknown, offset) = read(log_format, LineSource(stream), 0)
+
+    assert [q.message for q in quotes] == expected[log_format][0]
+    assert [q.sequence_id for q in quotes] == list(range(1, len(quotes) + 1))
+    assert unknown == expected[log_format][1]
+    assert offset == len(logs[log_format][1])
+
+
+def test_read_lines_skips_lines(tmp_path):
+    log_file = tmp_path / "chan.log"
+    log_file.write_bytes(logs["nda"][1])
+
+    with open(log_file, "rb") as stream:
+        (quotes, _, _) = read("nda", LineSource(stream), 2)
+
+    assert [q.message for q in quotes] == ["caf\u00e9", ""]
+    assert quotes[0].sequence_id == 1
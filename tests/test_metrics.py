@@ -0,0 +1,46 @@
+import json
+import time
+
+from quoteimporter import metrics
+from quoteimporter.metrics import Metrics, write_metrics
+
+
+def test_nested_stages_charge_innermost():
+    m = Metrics()
+
+    with m.stage("parse"):
+        with m.stage("attachment"):
+            time.sleep(0.02)
+
+    assert m.wall["attachment"] >= 0.02
+    assert m.wall["parse"] < 0.02
+
+
+def test_track_counts_lines_and_quotes():
+    m = Metrics()
+    lines = ["a\n", "b\n", "c\n"]
+    quotes = list(m.track_quotes(line for line in m.track_lines(lines) if line != "b\n"))
+
+    assert quotes == ["a\n", "c\n"]
+    assert m.lines == 3
+    assert m.quotes == 2
+
+
+def test_stage_disabled():
+    assert metrics.active is None
+
+    with metrics.stage("write"):
+        pass
+
+
+def test_write_metrics(tmp_path):
+    m = Metrics(total_bytes=100)
+    m.position = lambda: 50
+
+    write_metrics(m, str(tmp_path / "metrics.json"))
+    write_metrics(m, str(tmp_path / "metrics.prom"))
+
+    with open(tmp_path / "metrics.json") as file:
+        assert json.load(file)["bytes"] == 50
+    with open(tmp_path / "metrics.prom") as file:
+        assert "quoteimporter_bytes_total 50\n" in file.read()
@@ -0,0 +1,117 @@
+import pymongo
+import pytest
+from quoteimporter.writers.mongodb import MongoDb
+
+from tests.helpers import read_irssi
+
+irssi_log = "--- Log opened Sat Jul 22 20:00:00 2017\n" + "".join(
+    "20:5%i <Cassie> line %i\n" % (i, i) for i in range(5)
+)
+
+
+class FakeCollection:
+    """Records unordered inserts, failing those of documents with the given sequence ids"""
+
+    def __init__(self, failing=(), code=11000):
+        self.failing = failing
+        self.code = code
+        self.inserted = []
+
+    def find_one(self, query, fields, sort):
+        # the last quote of the channel, found at the end of its index
+        assert sort == [("sequence_id", pymongo.DESCENDING)]
+        return {"sequence_id": 7}
+
+    def insert_many(self, documents, ordered=True):
+        assert not ordered
+        errors = [
+            {"index": i, "code": self.code, "errmsg": "E%i" % self.code}
+            for (i, document) in enumerate(documents)
+            if document["sequence_id"] in self.failing
+        ]
+        self.inserted += [
+            document["message"]
+            for document in documents
+            if document["sequence_id"] not in self.failing
+        ]
+
+        if len(errors) > 0:
+            raise pymongo.errors.BulkWriteError({"writeErrors": errors})
+
+
+class FakeCounters:
+    """Applies the $max and $inc updates of sequence counters"""
+
+    def __init__(self):
+        self.last = {}
+
+    def update_one(self, key, update, upsert=False):
+        value = update["$max"]["last_sequence_id"]
+        self.last[key["_id"]] = max(self.last.get(key["_id"], 0), value)
+
+    def find_one_and_update(self, key, update, return_document=None):
+        self.last[key["_id"]] += update["$inc"]["last_sequence_id"]
+        return {"last_sequence_id": self.last[key["_id"]]}
+
+
+def make_writer(collection, in_flight=1):
+    writer = MongoDb("localhost", 27017, "quotes")
+    writer.quotes = collection
+    writer.chunk_seconds = None
+    writer.in_flight = in_flight
+    return writer
+
+
+def test_duplicates_are_counted(capsys):
+    collection = FakeCollection(failing=(2, 4))
+    writer = make_writer(collection)
+
+    writer.insert_all(read_irssi(irssi_log))
+    writer.close()
+
+    assert collection.inserted == ["line 0", "line 2", "line 4"]
+    assert "Skipped 2 quotes" in capsys.readouterr().out
+
+
+def test_other_errors_abort():
+    writer = make_writer(FakeCollection(failing=(2,), code=121))
+
+    with pytest.raises(pymongo.errors.BulkWriteError):
+        writer.insert_all(read_irssi(irssi_log))
+
+    writer.close()
+
+
+def test_parallel_inserts_encoded_in_processes(capsys):
+    collection = FakeCollection(failing=(5,))
+    writer = make_writer(collection, in_flight=2)
+
+    writer.insert_all(read_irssi(irssi_log))
+    writer.close()
+
+    assert sorted(collection.inserted) == ["line 0", "line 1", "line 2", "line 3"]
+    output = capsys.readouterr().out
+    assert "Inserted 5 (2 chunks in parallel)" in output
+    assert "Skipped 1 quotes" in output
+
+
+def test_parallel_chunks_follow_byte_budget(capsys):
+    collection = FakeCollection()
+    writer = make_writer(collection, in_flight=2)
+    # every quote is a chunk of its own
+    writer.chunk_bytes = 1
+
+    writer.insert_all(read_irssi(irssi_log))
+    writer.close()
+
+    assert len(collection.inserted) == 5
+    assert "Inserted 5 (5 chunks in parallel)" in capsys.readouterr().out
+
+
+def test_reserve_looks_up_last_quote_in_index():
+    writer = make_writer(FakeCollection())
+    writer.counters = FakeCounters()
+
+    assert writer.reserve_sequence_ids("#chan", 3) == 8
+    assert writer.reserve_sequence_ids("#chan", 2) == 11
+    writer.close()
@@ -77,6 +77,21 @@ def test_join_different_channel():
     assert not list(reader.read(lines))
 
 
+@pytest.mark.parametrize(
+    "raw,message",
+    [
+        ("2017-07-22 20:56:39.123456 :Cassie!~abc@sdf.dkf.com PART #chan", ""),
+        ("2017-07-22 20:56:39.123456 :Cassie!~abc@sdf.dkf.com PART #chan :bye now", "bye now"),
+    ],
+)
+def test_leave(raw, message):
+    reader = NdaLogReader("#chan", "")
+    quote = next(reader.read(io.StringIO(raw)))
+    assert quote.quote_type == QuoteType.leave
+    assert quote.author == "Cassie"
+    assert quote.message == message
+
+
 def test_nda_nick():
     lines = io.StringIO(
         "2017-07-22 20:56:39.123456 Sending hi to #chan\n"
@@ -100,6 +115,19 @@ def test_nda_nick():
     assert quotes[3].author == "nda_"
 
 
+def test_nda_nick_at_offset():
+    data = (
+        b"2017-07-22 20:56:39.123456 Sending NICK nda_\r\n"
+        + b"2017-07-22 20:56:40.123456 Sending NICK nda__\r\n"
+        + b"2017-07-22 20:56:41.123456 :a!b@c PRIVMSG #chan : Sending NICK no\r\n"
+    )
+    reader = NdaLogReader("#chan", "nda")
+
+    assert reader.state_at(data, 0) == {"nda_nick": "nda"}
+    assert reader.state_at(data, data.index(b"2017", 1)) == {"nda_nick": "nda_"}
+    assert reader.state_at(data, len(data)) == {"nda_nick": "nda__"}
+
+
 @pytest.mark.parametrize(
     "mode, message",
     [
@@ -0,0 +1,86 @@
+import time
+
+import pytest
+from quoteimporter.writers.pool import WriterPool
+
+
+class FakeWriter:
+    """Takes batches of delays, sleeping for the first one, or fails on a negative one"""
+
+    def __init__(self, commits):
+        self.commits = commits
+        self.batch = None
+        self.progress = None
+
+    def write_all(self, batch):
+        if batch[0] < 0:
+            raise ValueError("bad batch")
+
+        time.sleep(batch[0])
+        self.batch = batch
+
+    def save_progress(self, progress):
+        self.progress = progress
+
+    def commit(self):
+        self.commits.append((self.batch, self.progress))
+
+    def rollback(self):
+        self.batch = None
+
+    def initialize(self):
+        # like a server with a small packet limit
+        self.chunk_bytes = 100
+
+    def max_sequence_id(self, channel):
+        return len(self.commits)
+
+    def close(self):
+        pass
+
+
+def make_pool(size):
+    commits = []
+    loaders = [FakeWriter(commits) for _ in range(size)]
+    return (WriterPool(FakeWriter(commits), loaders), commits)
+
+
+def test_batches_commit_in_order():
+    (pool, commits) = make_pool(3)
+    saved = []
+
+    for (i, delay) in enumerate([0.05, 0.02, 0]):
+        pool.submit([delay], {"batch": i}, lambda i=i: saved.append(i))
+
+    # lookups wait for the batches in flight
+    assert pool.max_sequence_id("#chan") == 3
+    assert commits == [
+        ([0.05], {"batch": 0}),
+        ([0.02], {"batch": 1}),
+        ([0], {"batch": 2}),
+    ]
+    assert saved == [0, 1, 2]
+    pool.close()
+
+
+def test_failed_batch_stops_later_commits():
+    (pool, commits) = make_pool(3)
+
+    # the last batch is loaded while the first one is still being written, but never committed
+    pool.insert_all([0.05])
+    pool.insert_all([-1])
+    pool.insert_all([0])
+
+    with pytest.raises(Exception, match="only the first 1 batches were committed"):
+        pool.close()
+
+    assert commits == [([0.05], None)]
+
+
+def test_loaders_take_over_chunk_bytes():
+    (pool, _) = make_pool(2)
+
+    pool.initialize()
+
+    assert [loader.chunk_bytes for loader in pool.loaders] == [100, 100]
+    pool.close()
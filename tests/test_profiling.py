@@ -0,0 +1,61 @@
+import io
+import json
+
+from quoteimporter.profiling import Profiler
+from quoteimporter.readers.hexchat import HexChatLogReader
+from quoteimporter.readers.telegram.models import TelegramOptions
+from quoteimporter.readers.telegram.reader import TelegramLogReader
+
+
+def profiles_by_name(profiler):
+    return {profile.name: profile for profile in profiler.profiles}
+
+
+def test_profile_patterns():
+    lines = io.StringIO(
+        "sep 20 18:11:08 <Cassie>\twhat the fuck\n"
+        + "sep 20 18:11:09 *\tWASD (~wasd@foo.bar) has joined #chan\n"
+        + "sep 20 18:11:10 *\tNow talking on #chan\n"
+    )
+    reader = HexChatLogReader("", 0, "")
+    profiler = Profiler()
+    profiler.instrument(reader)
+
+    quotes = list(reader.read(lines))
+    profiles = profiles_by_name(profiler)
+
+    assert len(quotes) == 2
+    assert profiles["HexChatLogReader.message_re"].attempts == 3
+    assert profiles["HexChatLogReader.message_re"].hits == 1
+    assert profiles["HexChatLogReader.join_re"].hits == 1
+    assert profiles["HexChatLogReader.ignored_res[0]"].hits == 1
+    assert profiler.lines == 3
+    assert profiler.matched_lines == 3
+    # the join line failed message_re and topic_re before matching
+    assert profiler.failed_before_match >= 2
+
+
+def test_profile_handlers():
+    lines = io.StringIO(
+        json.dumps(
+            {
+                "messages": [
+                    {
+                        "type": "message",
+                        "date": "2021-01-08T07:10:07",
+                        "from": "Test Testy",
+                        "text": "do care",
+                    }
+                ]
+            }
+        )
+    )
+    reader = TelegramLogReader(TelegramOptions(""))
+    profiler = Profiler()
+    profiler.instrument(reader)
+
+    list(reader.read(lines))
+    profiles = profiles_by_name(profiler)
+
+    assert profiles["TextMessageHandler"].hits == 1
+    assert profiles["AttachmentMessageHandler"].attempts == 0
@@ -0,0 +1,32 @@
+import subprocess
+import sys
+
+import pytest
+from quoteimporter import registry
+from quoteimporter.__main__ import parse_args
+from quoteimporter.readers.irssi import IrssiLogReader
+from quoteimporter.writers.dryrun import DryRun
+
+
+def test_make_reader_and_writer():
+    args = parse_args(["irssi", "#chan", "/logs/chan.log"])
+    reader = registry.make_reader(args)
+
+    assert isinstance(reader, IrssiLogReader)
+    assert reader.source == "chan.log"
+    assert isinstance(registry.make_writer(args), DryRun)
+
+
+def test_unknown_type():
+    with pytest.raises(Exception, match="Invalid reader type nope"):
+        registry.make_reader(parse_args(["nope", "#chan", "/logs/chan.log"]))
+
+
+def test_drivers_are_imported_lazily():
+    code = (
+        "import sys, quoteimporter.__main__; "
+        "print(any(m in sys.modules for m in ['pymongo', 'mysql.connector', 'psycopg2']))"
+    )
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True)
+
+    assert result.stdout.strip() == "False"
@@ -0,0 +1,71 @@
+import io
+
+from quoteimporter import rejects
+from quoteimporter.readers.irssi import IrssiLogReader
+from quoteimporter.rejects import Rejects, print_rejects, shape
+
+
+def test_shape_masks_digits_and_nicks():
+    assert shape("20:56 <Cassie> 123 things") == "0:0 <NICK> 0 things"
+    assert shape("12:01 :nick!~user@host.com FOO") == "0:0 :NICK!USER@HOST FOO"
+
+
+def test_unknown_lines_are_aggregated(tmp_path, capsys):
+    filename = str(tmp_path / "rejects.txt")
+    rejects.active = Rejects(samples=2, filename=filename)
+    log = "".join("20:5%i <nick%i> what %i\n" % (i, i, i) for i in range(5))
+    lines = io.StringIO("garbage 1\n" + "garbage 22\n" + "garbage 333\n" + log + "other\n")
+
+    try:
+        quotes = list(IrssiLogReader("#chan", 0, "You").read(lines))
+        collected = rejects.active
+        collected.close()
+    finally:
+        rejects.active = None
+
+    assert len(quotes) == 5
+    assert capsys.readouterr().out == ""
+    assert collected.count == 4
+    assert collected.shapes == {"garbage 0": 3, "other": 1}
+    assert collected.examples["garbage 0"] == ["garbage 1", "garbage 22"]
+    assert (tmp_path / "rejects.txt").read_text() == "garbage 1\ngarbage 22\ngarbage 333\nother\n"
+
+    print_rejects(collected)
+    out = capsys.readouterr().out
+
+    assert out.startswith("4 unknown lines in 2 shapes\n")
+    assert "         3  garbage 0\n" in out
+
+
+def test_merge():
+    worker = Rejects()
+    worker.lines = []
+    worker.add("a 1")
+    worker.add("a 2")
+    combined = Rejects(samples=3)
+    combined.add("a 3")
+    combined.merge(worker)
+
+    assert combined.count == 3
+    assert combined.shapes == {"a 0": 3}
+    assert combined.examples["a 0"] == ["a 3", "a 1", "a 2"]
+
+
+def test_prints_right_away_when_inactive(capsys):
+    rejects.unknown("what")
+
+    assert capsys.readouterr().out == "Unknown what\n"
+
+
+def test_too_long_lines_are_unknown():
+    line = "20:56 <nick> " + "a" * rejects.max_line_length
+    rejects.active = Rejects()
+
+    try:
+        quotes = list(IrssiLogReader("#chan", 0, "You").read(io.StringIO(line + "\n")))
+        collected = rejects.active
+    finally:
+        rejects.active = None
+
+    assert quotes == []
+    assert collected.count == 1
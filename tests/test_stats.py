@@ -0,0 +1,47 @@
+import io
+import json
+
+from quoteimporter.models import QuoteType
+from quoteimporter.readers.irssi import IrssiLogReader
+from quoteimporter.stats import Stats, write_stats
+
+
+def read_stats():
+    lines = io.StringIO(
+        "--- Day changed Sat Jul 22 2017\n"
+        + "20:56 <&Cassie> what the fuck\n"
+        + "20:56 -!- Duo is now known as udo\n"
+        + "--- Day changed Sun Jul 23 2017\n"
+        + "20:58 <&ashin> also swear words ø\n"
+        + "20:59 <&ashin> ok\n"
+    )
+    reader = IrssiLogReader("", 0, "")
+    stats = Stats()
+    quotes = list(stats.collect(reader.read(lines)))
+    return (stats, quotes)
+
+
+def test_stats():
+    (stats, quotes) = read_stats()
+
+    assert stats.total == len(quotes) == 4
+    assert stats.types[QuoteType.message] == 3
+    assert stats.types[QuoteType.nick] == 1
+    assert stats.authors["&ashin"] == 2
+    assert len(stats.days) == 2
+    assert stats.message_bytes == sum(len(q.message.encode("utf-8")) for q in quotes)
+    assert stats.raw_bytes == sum(len(q.raw.encode("utf-8")) for q in quotes)
+
+
+def test_write_stats(tmp_path):
+    (stats, _) = read_stats()
+    filename = str(tmp_path / "stats.json")
+
+    write_stats(stats, filename)
+
+    with open(filename) as file:
+        data = json.load(file)
+
+    assert data["total"] == 4
+    assert data["types"] == {"message": 3, "nick": 1}
+    assert data["days"] == {"2017-07-22": 2, "2017-07-23": 2}
@@ -0,0 +1,98 @@
+import json
+import os
+from datetime import datetime, timezone
+
+from quoteimporter import read_quotes
+from quoteimporter.__main__ import parse_args
+from quoteimporter.dayindex import build_index, index_path, load_index
+from quoteimporter.models import Quote, QuoteType
+from quoteimporter.readers.irssi import IrssiLogReader
+from quoteimporter.timerange import within
+
+
+def make_args(log_type, filename, *options):
+    return parse_args([*options, log_type, "#chan", filename])
+
+
+def make_quote(hour):
+    timestamp = datetime(2017, 7, 22, hour, tzinfo=timezone.utc)
+    return Quote("#chan", hour, "Cassie", "", timestamp, QuoteType.message, "", "")
+
+
+def test_within_stops_after_the_window():
+    def quotes():
+        for hour in range(5):
+            yield make_quote(hour)
+        raise Exception("read past the window")
+
+    since = datetime(2017, 7, 22, 1, tzinfo=timezone.utc)
+    until = datetime(2017, 7, 22, 3, tzinfo=timezone.utc)
+    assert [q.sequence_id for q in within(quotes(), since, until)] == [1, 2]
+
+
+def test_nda_since(tmp_path):
+    log_file = tmp_path / "nda.log"
+    log_file.write_text(
+        "".join(
+            "2017-07-22 20:%02i:00.000000 :Cassie!c@host PRIVMSG #chan :%i\n" % (i, i)
+            for i in range(50)
+        )
+        + "2017-07-22 20:50:00.000000 Sending NICK nda_\n"
+        + "".join(
+            "2017-07-22 21:%02i:00.000000 Sending %i to #chan\n" % (i, i)
+            for i in range(50)
+        )
+    )
+    options = ["--since", "2017-07-22T21:10", "--until", "2017-07-22T21:13"]
+    quotes = read_quotes(make_args("nda", str(log_file), *options))
+
+    assert [(q.author, q.message) for q in quotes] == [
+        ("nda_", "10"),
+        ("nda_", "11"),
+        ("nda_", "12"),
+    ]
+
+
+def test_telegram_since_until(tmp_path):
+    export = tmp_path / "result.json"
+    messages = [
+        {"type": "message", "date": date, "from": "a", "text": date[11:13]}
+        for date in ["2021-01-08T0%i:00:00" % i for i in range(5)]
+    ]
+    export.write_text(json.dumps({"messages": messages}))
+    # the export has no time zone, so it is in the one of the log like naive times
+    options = ["--since", "2021-01-08T00:00+00:00", "--until", "2021-01-08T04:00"]
+    args = make_args("telegram", str(export), "--utc-offset", "2", *options)
+
+    assert [q.message for q in read_quotes(args)] == ["02", "03"]
+
+
+def test_irssi_day_index(tmp_path):
+    log_file = tmp_path / "chan.log"
+    log_file.write_text(
+        "--- Log opened Sat Jul 22 20:00:00 2017\n"
+        + "20:51 <Cassie> one\n"
+        + "--- Day changed Sun Jul 23 2017\n"
+        + "20:52 <Cassie> two\n"
+    )
+    reader = IrssiLogReader("#chan", 0, "You")
+    build_index(reader, str(log_file))
+
+    with open(log_file, "a") as file:
+        file.write("--- Day changed Mon Jul 24 2017\n20:53 <Cassie> three\n20:54 <Cass")
+
+    index = build_index(reader, str(log_file))
+    assert [day for (day, _) in index.days] == ["2017-07-22", "2017-07-23", "2017-07-24"]
+    assert index.size == os.path.getsize(log_file) - len("20:54 <Cass")
+    assert os.path.exists(index_path(str(log_file)))
+
+    # starts reading at the second day, which must not be read from the start of the file
+    with open(log_file, "r+b") as file:
+        file.write(b"XX")
+
+    args = make_args("irssi", str(log_file), "--since", "2017-07-23T12:00")
+    quotes = read_quotes(args)
+    assert [q.message for q in quotes] == ["two", "three"]
+
+    log_file.write_text("--- Log opened Sat Jul 22 20:00:00 2017\n")
+    assert load_index(str(log_file)) is None
@@ -0,0 +1,50 @@
+import zipfile
+
+from quoteimporter.archives import attachment_dir
+from quoteimporter.readers.whatsapp.models import WhatsAppOptions
+from quoteimporter.readers.whatsapp.reader import WhatsAppLogReader
+from quoteimporter.unused import find_unused_attachments
+
+
+def test_find_unused_attachments(tmp_path):
+    log_file = tmp_path / "_chat.txt"
+    log_file.write_text(
+        "[26/07/2017, 15.11.24] Seth: <attached: used.jpg>\n"
+        + "[26/07/2017, 15.11.25] Seth: <attached: missing.jpg>\n"
+        + "[26/07/2017, 15.11.26] Seth: used.jpg is not a reference\n",
+        encoding="utf-8",
+    )
+    (tmp_path / "used.jpg").write_bytes(bytes(3))
+    (tmp_path / "unused.jpg").write_bytes(bytes(5))
+    (tmp_path / "unused.mp4").write_bytes(bytes(7))
+
+    reader = WhatsAppLogReader(WhatsAppOptions(""))
+    report = find_unused_attachments(reader, str(log_file), str(tmp_path))
+
+    assert report.unused == [
+        str(tmp_path / "unused.jpg"),
+        str(tmp_path / "unused.mp4"),
+    ]
+    assert report.missing == ["missing.jpg"]
+    assert report.unused_bytes == 12
+
+
+def test_find_unused_attachments_in_zip(tmp_path):
+    archive = tmp_path / "WhatsApp Chat.zip"
+
+    with zipfile.ZipFile(archive, "w") as file:
+        file.writestr(
+            "chat/_chat.txt",
+            "[26/07/2017, 15.11.24] Seth: <attached: used.jpg>\n"
+            + "[26/07/2017, 15.11.25] Seth: <attached: missing.jpg>\n",
+        )
+        file.writestr("chat/used.jpg", bytes(3))
+        file.writestr("chat/unused.jpg", bytes(5))
+        file.writestr("other.jpg", bytes(7))
+
+    reader = WhatsAppLogReader(WhatsAppOptions(""))
+    report = find_unused_attachments(reader, str(archive), attachment_dir(str(archive)))
+
+    assert report.unused == [str(archive / "chat" / "unused.jpg")]
+    assert report.missing == ["missing.jpg"]
+    assert report.unused_bytes == 5